@@ -8,13 +8,18 @@ import traceback
 import sys
 import tempfile
 import re
+import uuid
 
-from utils.sheets import get_config, save_form_data, save_dynamic_form_data, get_available_slots, get_candidate_by_index, get_all_candidates, update_candidate_analysis, update_config, get_dynamic_questions, get_active_forms, get_form_questions, save_form_configuration
-from utils.file_cache import default_file_cache, auto_cleanup
+from utils.sheets import get_config, save_form_data, save_dynamic_form_data, get_available_slots, get_candidate_by_index, get_all_candidates, update_candidate_analysis, update_config, get_dynamic_questions, get_active_forms, get_form_questions, save_form_configuration, submission_queue, sheet_replica, sheets_gateway, cache_flights, candidate_store
+from utils.file_cache import default_file_cache, auto_cleanup, file_cache_flights, file_cache_refresher
+from utils.rate_limiter import google_api_limiter, PRIORITY_BACKGROUND
 from utils.drive import upload_file_to_drive, download_cv_for_processing, download_file_from_drive
-from utils.ia import analyze_cv
+from utils.ia import analyze_cv, get_analysis_cache_stats
+from utils.text_extraction import text_extraction_cache
+from utils.extraction_service import extraction_service
 from utils.mail import send_email
 from utils.api_checker import check_api_status
+from utils.job_queue import JobQueue
 
 # Get current directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -53,6 +58,18 @@ ALLOWED_EXTENSIONS = {'pdf', 'txt', 'doc', 'docx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 
+# Retomar o envio de submissões pendentes no journal (write-behind)
+submission_queue.start()
+
+# Manter a réplica local (SQLite) das abas sincronizada em segundo plano
+sheet_replica.start()
+
+# Atualizar config/formulários/perguntas antes de expirarem (stale-while-revalidate)
+file_cache_refresher.start()
+
+# Remover caches expirados e aplicar o orçamento de disco periodicamente
+default_file_cache.start_janitor()
+
 def allowed_file(filename):
     """Check if file has an allowed extension"""
     return '.' in filename and \
@@ -112,6 +129,103 @@ def download_cv_for_processing(cv_url, temp_filename):
         logger.error(traceback.format_exc())
         return None
 
+# ===== PIPELINE DE SUBMISSÕES (ASSÍNCRONO) =====
+def classify_cv_analysis(cv_analysis):
+    """Define a classificação e a justificação a partir da pontuação (0 a 10) indicada na análise"""
+    analysis_text = cv_analysis.get('analysis', '')
+    
+    # Procurar pela pontuação na escala de 0 a 10
+    score_match = re.search(r'Em uma escala de 0 a 10,\s*(?:.*?)(\d+(?:\.\d+)?)', analysis_text, re.IGNORECASE)
+    score = float(score_match.group(1)) if score_match else 0
+    
+    # Classificar candidato com base na pontuação
+    if score >= 7:
+        cv_analysis['classificacao'] = 'Aprovado'
+    elif score >= 4:
+        cv_analysis['classificacao'] = 'Revisão'
+    else:
+        cv_analysis['classificacao'] = 'Rejeitado'
+    
+    cv_analysis['justificacao'] = analysis_text
+    return cv_analysis
+
+def _stage_upload(job):
+    """Etapa 1: upload do CV para o Google Drive"""
+    data = job['data']
+    data['cv_url'] = upload_file_to_drive(data['file_path'], data['filename'])
+    logger.info(f"Upload concluído com sucesso. URL: {data['cv_url']}")
+
+def _stage_analyze(job):
+    """Etapa 2: análise do CV com IA (repetida se o provedor falhar, exceto na última tentativa)"""
+    data = job['data']
+    cv_analysis = analyze_cv(data['file_path'], data['form_data'])
+    if cv_analysis.get('error') and job['attempts'] < submission_jobs.max_attempts:
+        raise RuntimeError(cv_analysis['error'])
+    
+    classify_cv_analysis(cv_analysis)
+    data['form_data'].update({
+        'classificacao': cv_analysis.get('classificacao', 'Desconhecido'),
+        'justificacao': cv_analysis.get('justificacao', ''),
+        'provider': cv_analysis.get('provider', 'Desconhecido'),
+        'prompt_hash': cv_analysis.get('prompt_hash', '')
+    })
+    logger.info(f"Análise do CV concluída: {data['form_data']['classificacao']}")
+
+def _stage_save(job):
+    """Etapa 3: gravação da candidatura (journal da fila de submissões da planilha)"""
+    data = job['data']
+    save_dynamic_form_data(dict(data['form_data'], cv_url=data['cv_url']), data['questions'])
+    
+    # Resultado já gravado: se a etapa do email falhar, é este o que o candidato vê
+    if data['form_data'].get('classificacao') == 'Aprovado':
+        data['result'] = {'category': 'warning', 'message': 'Candidatura submetida com sucesso, mas não foi possível enviar o email com os horários. Entraremos em contacto.'}
+    else:
+        data['result'] = {'category': 'success', 'message': 'Candidatura submetida com sucesso!'}
+
+def _stage_notify(job):
+    """Etapa 4: email com horários disponíveis para candidatos aprovados"""
+    data = job['data']
+    form_data = data['form_data']
+    
+    if form_data.get('classificacao') != 'Aprovado':
+        logger.info("Candidato não aprovado automaticamente")
+        data['result'] = {'category': 'success', 'message': 'Candidatura submetida com sucesso!'}
+        return
+    
+    available_slots = get_available_slots()
+    if not available_slots:
+        logger.warning("Não há horários disponíveis para o candidato")
+        data['result'] = {'category': 'warning', 'message': 'Candidatura aprovada, mas não há horários disponíveis.'}
+        return
+    
+    logger.info(f"Encontrados {len(available_slots)} horários disponíveis. Enviando email...")
+    send_email(form_data.get('email', ''), form_data.get('nome', ''), available_slots)
+    data['result'] = {'category': 'success', 'message': 'Candidatura submetida com sucesso! Verifique o seu email.'}
+
+def _finish_submission_job(job):
+    """Remove o CV temporário quando o trabalho termina"""
+    file_path = job['data'].get('file_path')
+    if file_path and os.path.exists(file_path):
+        logger.info(f"Limpando arquivo temporário: {file_path}")
+        os.remove(file_path)
+
+# Instância global da fila de candidaturas (etapas executadas fora do pedido HTTP)
+submission_jobs = JobQueue(
+    [
+        ('upload', _stage_upload),
+        ('analyze', _stage_analyze),
+        ('save', _stage_save),
+        ('notify', _stage_notify),
+    ],
+    workers=int(os.environ.get('SUBMISSION_WORKERS', '4')),
+    on_finish=_finish_submission_job,
+    # Com a candidatura já gravada, uma falha no email não a faz falhar
+    best_effort=['notify']
+)
+
+# Retomar candidaturas pendentes e processar novas com o conjunto de workers
+submission_jobs.start()
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     # Verificar formulários ativos
@@ -200,18 +314,14 @@ def form(form_id):
         
         logger.info(f"Arquivo CV válido: {file.filename}")
             
-        # Save file temporarily
+        # Guardar o CV com um nome único (candidaturas simultâneas com o mesmo nome de arquivo)
         filename = secure_filename(file.filename)
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        job_id = uuid.uuid4().hex
+        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{filename}")
         file.save(temp_path)
         logger.info(f"Arquivo salvo temporariamente em: {temp_path}")
         
         try:
-            # Upload to Google Drive
-            logger.info("Tentando fazer upload para o Google Drive...")
-            file_url = upload_file_to_drive(temp_path, filename)
-            logger.info(f"Upload concluído com sucesso. URL: {file_url}")
-            
             # Processar todos os campos do formulário dinâmico
             logger.info("Processando campos do formulário dinâmico...")
             processed_form_data = {}
@@ -229,86 +339,50 @@ def form(form_id):
                     # Campos simples
                     processed_form_data[field_id] = request.form.get(field_id, '')
             
-            # Analyze CV with AI
-            logger.info("Analisando CV com IA...")
-            cv_analysis = analyze_cv(temp_path, processed_form_data)
-            logger.info(f"Análise do CV concluída: {cv_analysis}")
-            
-            # Extrair classificação baseada na análise
-            analysis_text = cv_analysis.get('analysis', '')
-            
-            # Procurar pela pontuação na escala de 0 a 10
-            score_match = re.search(r'Em uma escala de 0 a 10,\s*(?:.*?)(\d+(?:\.\d+)?)', analysis_text, re.IGNORECASE)
-            score = float(score_match.group(1)) if score_match else 0
-            
-            # Procurar pela recomendação de entrevista
-            interview_match = re.search(r'O candidato deve ser chamado para entrevista\?\s*(.*?)(?:\.|$)', analysis_text, re.IGNORECASE)
-            interview_recommendation = interview_match.group(1) if interview_match else ""
-            
-            # Classificar candidato com base na pontuação
-            if score >= 7:
-                cv_analysis['classificacao'] = 'Aprovado'
-            elif score >= 4:
-                cv_analysis['classificacao'] = 'Revisão'
-            else:
-                cv_analysis['classificacao'] = 'Rejeitado'
+            # Upload, análise, gravação e email são feitos pelos workers da fila
+            submission_jobs.submit({
+                'form_id': form_id,
+                'file_path': temp_path,
+                'filename': filename,
+                'form_data': processed_form_data,
+                'questions': dynamic_questions,
+            }, job_id=job_id)
             
-            cv_analysis['justificacao'] = analysis_text
-            
-            # Preparar dados para salvar na planilha
-            logger.info("Preparando dados para salvar na planilha...")
-            
-            # Adicionar dados da análise de CV
-            processed_form_data.update({
-                'cv_url': file_url,
-                'classificacao': cv_analysis.get('classificacao', 'Desconhecido'),
-                'justificacao': cv_analysis.get('justificacao', ''),
-                'provider': cv_analysis.get('provider', 'Desconhecido')
-            })
-            
-            logger.info("Salvando dados do formulário dinâmico na planilha...")
-            save_dynamic_form_data(processed_form_data, dynamic_questions)
-            logger.info("Dados salvos com sucesso")
-            
-            # If candidate is approved, send email with available slots
-            if cv_analysis.get('classificacao') == 'Aprovado':
-                logger.info("Candidato aprovado. Buscando horários disponíveis...")
-                available_slots = get_available_slots()
-                
-                if available_slots:
-                    logger.info(f"Encontrados {len(available_slots)} horários disponíveis. Enviando email...")
-                    candidate_email = processed_form_data.get('email', '')
-                    candidate_name = processed_form_data.get('nome', '')
-                    send_email(candidate_email, candidate_name, available_slots)
-                    logger.info("Email enviado com sucesso")
-                    flash('Candidatura submetida com sucesso! Verifique o seu email.', 'success')
-                else:
-                    logger.warning("Não há horários disponíveis para o candidato")
-                    flash('Candidatura aprovada, mas não há horários disponíveis.', 'warning')
-            else:
-                logger.info("Candidato não aprovado automaticamente")
-                flash('Candidatura submetida com sucesso!', 'success')
-                
-            # Clean up temp file
-            logger.info(f"Limpando arquivo temporário: {temp_path}")
-            os.remove(temp_path)
-            
-            return render_template('form_dynamic.html', questions=dynamic_questions)
-        
         except Exception as e:
-            logger.error(f"Erro ao processar candidatura: {str(e)}")
+            logger.error(f"Erro ao registar candidatura: {str(e)}")
             logger.error(traceback.format_exc())
             
             # Clean up temp file
             if os.path.exists(temp_path):
                 logger.info(f"Limpando arquivo temporário após erro: {temp_path}")
                 os.remove(temp_path)
-                
+            
             flash(f'Erro ao processar candidatura: {str(e)}', 'danger')
             return render_template('form_dynamic.html', questions=dynamic_questions, form=current_form)
+        
+        status_url = url_for('job_status', job_id=job_id)
+        if request.accept_mimetypes.best == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': True, 'job_id': job_id, 'status_url': status_url}), 202
+        
+        flash('Candidatura recebida! Estamos a analisar o seu CV.', 'info')
+        return render_template('form_dynamic.html', questions=dynamic_questions, form=current_form,
+                               job_id=job_id, status_url=status_url)
     
     return render_template('form_dynamic.html', questions=dynamic_questions, form=current_form)
 
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    """Progresso de uma candidatura em processamento"""
+    status = submission_jobs.get_status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Candidatura não encontrada'}), 404
+    
+    # Não expor dados do candidato: apenas o estado e a mensagem final
+    if status['status'] == 'failed':
+        status['result'] = {'category': 'danger', 'message': 'Erro ao processar candidatura. Tente novamente.'}
+    status.pop('error', None)
+    return jsonify(dict(status, success=True))
+
 @app.route('/admin', methods=['GET', 'POST'])
 def admin():
     """Interface de administração para gerenciar candidaturas"""
@@ -334,31 +408,13 @@ def admin():
                 # Download do CV
                 cv_path = download_cv_for_processing(cv_url, f"temp_cv_{row_index}.pdf")
                 
-                # Reprocessar com Gemini
+                # Reprocessar (com 'force', ignorando o cache de análises)
                 logger.info(f"Reprocessando CV: {cv_path}")
-                cv_analysis = analyze_cv(cv_path, candidato_data)
+                cv_analysis = analyze_cv(cv_path, candidato_data, force='force' in request.form)
                 logger.info(f"Análise do CV concluída: {cv_analysis}")
                 
                 # Extrair classificação baseada na análise
-                analysis_text = cv_analysis.get('analysis', '')
-                
-                # Procurar pela pontuação na escala de 0 a 10
-                score_match = re.search(r'Em uma escala de 0 a 10,\s*(?:.*?)(\d+(?:\.\d+)?)', analysis_text, re.IGNORECASE)
-                score = float(score_match.group(1)) if score_match else 0
-                
-                # Procurar pela recomendação de entrevista
-                interview_match = re.search(r'O candidato deve ser chamado para entrevista\?\s*(.*?)(?:\.|$)', analysis_text, re.IGNORECASE)
-                interview_recommendation = interview_match.group(1) if interview_match else ""
-                
-                # Classificar candidato com base na pontuação
-                if score >= 7:
-                    cv_analysis['classificacao'] = 'Aprovado'
-                elif score >= 4:
-                    cv_analysis['classificacao'] = 'Revisão'
-                else:
-                    cv_analysis['classificacao'] = 'Rejeitado'
-                
-                cv_analysis['justificacao'] = analysis_text
+                classify_cv_analysis(cv_analysis)
                 
                 # Atualizar dados na planilha
                 update_candidate_analysis(row_index, cv_analysis)
@@ -435,31 +491,13 @@ def admin_reanalyze(index):
         # Download do CV
         cv_path = download_cv_for_processing(cv_url, f"temp_cv_{index}.pdf")
         
-        # Reprocessar com o provedor de IA atual
+        # Reprocessar com o provedor de IA atual (?force=1 ignora o cache de análises)
         logger.info(f"Reprocessando CV: {cv_path}")
-        cv_analysis = analyze_cv(cv_path, candidato)
+        cv_analysis = analyze_cv(cv_path, candidato, force=request.args.get('force') == '1')
         logger.info(f"Análise do CV concluída: {cv_analysis}")
         
         # Extrair classificação baseada na análise
-        analysis_text = cv_analysis.get('analysis', '')
-        
-        # Procurar pela pontuação na escala de 0 a 10
-        score_match = re.search(r'Em uma escala de 0 a 10,\s*(?:.*?)(\d+(?:\.\d+)?)', analysis_text, re.IGNORECASE)
-        score = float(score_match.group(1)) if score_match else 0
-        
-        # Procurar pela recomendação de entrevista
-        interview_match = re.search(r'O candidato deve ser chamado para entrevista\?\s*(.*?)(?:\.|$)', analysis_text, re.IGNORECASE)
-        interview_recommendation = interview_match.group(1) if interview_match else ""
-        
-        # Classificar candidato com base na pontuação
-        if score >= 7:
-            cv_analysis['classificacao'] = 'Aprovado'
-        elif score >= 4:
-            cv_analysis['classificacao'] = 'Revisão'
-        else:
-            cv_analysis['classificacao'] = 'Rejeitado'
-        
-        cv_analysis['justificacao'] = analysis_text
+        classify_cv_analysis(cv_analysis)
         
         # Atualizar dados na planilha
         success = update_candidate_analysis(index, cv_analysis)
@@ -522,12 +560,25 @@ def admin_cache_stats():
             'success': True,
             'stats': stats,
             'cache_ttl_config': {
-                'config_ttl': default_file_cache.ttl_config['config'],
-                'candidates_ttl': default_file_cache.ttl_config['candidates'],
-                'questions_ttl': default_file_cache.ttl_config['questions'],
-                'forms_ttl': default_file_cache.ttl_config['forms'],
+                'config_ttl': default_file_cache.namespaces['config']['ttl'],
+                'candidates_ttl': default_file_cache.namespaces['candidates']['ttl'],
+                'questions_ttl': default_file_cache.namespaces['questions']['ttl'],
+                'forms_ttl': default_file_cache.namespaces['forms']['ttl'],
                 'default_ttl': default_file_cache.default_ttl
-            }
+            },
+            'api_limiter': google_api_limiter.get_stats(),
+            'sheets_metadata': sheets_gateway.get_stats(),
+            'single_flight': {
+                'file_cache': file_cache_flights.get_stats(),
+                'candidate_store': cache_flights.get_stats()
+            },
+            'background_refresh': file_cache_refresher.get_stats(),
+            'candidate_store': candidate_store.get_stats(),
+            'text_extraction': text_extraction_cache.get_stats(),
+            'analysis_cache': get_analysis_cache_stats(),
+            'submission_jobs': submission_jobs.get_stats(),
+            'pdf_extraction': extraction_service.get_stats(),
+            'namespaces': default_file_cache.namespaces
         })
     except Exception as e:
         logger.error(f"Erro ao obter estatísticas do cache: {str(e)}")
@@ -550,11 +601,15 @@ def admin_cache_clear():
 def admin_cache_refresh():
     """Endpoint para forçar refresh do cache"""
     try:
+        from utils.sheets import get_all_forms
+
         # Forçar refresh das configurações e candidatos
-        get_config(force_refresh=True)
-        get_all_candidates(force_refresh=True)
-        get_dynamic_questions(force_refresh=True)
-        get_all_forms(force_refresh=True)
+        # (prioridade baixa na quota, para não atrasar submissões de candidatos)
+        with google_api_limiter.priority(PRIORITY_BACKGROUND):
+            get_config(force_refresh=True)
+            get_all_candidates(force_refresh=True)
+            get_dynamic_questions(force_refresh=True)
+            get_all_forms(force_refresh=True)
         
         flash("Cache atualizado com sucesso!", "success")
         logger.info("Cache atualizado manualmente via admin")
@@ -697,8 +752,6 @@ def admin_questions_edit():
             success = save_questions_to_sheet(questions_data)
             
             if success:
-                # Invalidar cache
-                default_file_cache.invalidate('questions_dynamic')
                 flash('Perguntas atualizadas com sucesso!', 'success')
             else:
                 flash('Erro ao salvar perguntas', 'danger')
@@ -743,7 +796,6 @@ def admin_questions_add():
         success = add_question_to_sheet(question_data)
         
         if success:
-            default_file_cache.invalidate('questions_dynamic')
             flash('Pergunta adicionada com sucesso!', 'success')
         else:
             flash('Erro ao adicionar pergunta', 'danger')
@@ -762,7 +814,6 @@ def admin_questions_delete(question_id):
         success = delete_question_from_sheet(question_id)
         
         if success:
-            default_file_cache.invalidate('questions_dynamic')
             flash('Pergunta removida com sucesso!', 'success')
         else:
             flash('Erro ao remover pergunta', 'danger')
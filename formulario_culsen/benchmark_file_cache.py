@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark dos formatos de serialização do FileCache
+
+Compara latência de escrita, latência de leitura (sem L1, como no primeiro
+acesso de um processo) e tamanho em disco de cada formato disponível com o
+formato JSON antigo (json.dump com indent=2).
+
+Uso: python benchmark_file_cache.py [numero_de_candidatos] [repeticoes]
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.cache_serializers import CacheSerializer, available_specs
+
+def gerar_candidatos(n):
+    """Gera dados semelhantes aos de 'candidates_all' (get_all_records + index)"""
+    random.seed(42)
+    palavras = "experiência projeto equipa cliente análise gestão desenvolvimento qualidade".split()
+    candidatos = []
+    for i in range(n):
+        candidatos.append({
+            'Carimbo de data/hora': f"2024-05-{i % 28 + 1:02d} 10:{i % 60:02d}:00",
+            'Nome Completo': f"Candidato {i}",
+            'Email': f"candidato{i}@exemplo.pt",
+            'Telefone': 912000000 + i,
+            'Link CV': f"https://drive.google.com/file/d/{i:033d}/view",
+            'Classificação': random.randint(0, 10),
+            'Justificação': ' '.join(random.choice(palavras) for _ in range(120)),
+            'Status': random.choice(['Novo', 'Analisado', 'Entrevista']),
+            'Provedor IA': random.choice(['openai', 'claude', 'deepseek']),
+            **{f"Pergunta {q}": ' '.join(random.choice(palavras) for _ in range(15)) for q in range(12)},
+            'index': i + 2,
+        })
+    return candidatos
+
+def medir(funcao, repeticoes):
+    """Retorna a mediana, em milissegundos, de várias execuções"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return tempos[len(tempos) // 2]
+
+def benchmark(n=2000, repeticoes=7):
+    cache_data = {'timestamp': time.time(), 'key': 'candidates_all', 'data': gerar_candidatos(n)}
+    with tempfile.TemporaryDirectory(prefix='benchmark_cache_') as pasta:
+
+        print(f"=== BENCHMARK DO FILE CACHE ({n} candidatos, mediana de {repeticoes}) ===")
+        print()
+        print(f"{'Formato':<16}{'Escrita (ms)':>14}{'Leitura (ms)':>14}{'Tamanho (KB)':>14}")
+        print("-" * 58)
+
+        # Formato antigo
+        caminho = os.path.join(pasta, 'antigo.json')
+
+        def escrever_json():
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+
+        def ler_json():
+            with open(caminho, 'r', encoding='utf-8') as f:
+                json.load(f)
+
+        escrita = medir(escrever_json, repeticoes)
+        leitura = medir(ler_json, repeticoes)
+        print(f"{'json (antigo)':<16}{escrita:>14.1f}{leitura:>14.1f}{os.path.getsize(caminho) / 1024:>14.1f}")
+
+        for spec in available_specs():
+            serializer = CacheSerializer(spec)
+            caminho = os.path.join(pasta, f"{spec}.cache")
+
+            def escrever():
+                with open(caminho, 'wb') as f:
+                    f.write(serializer.dumps(cache_data))
+
+            def ler():
+                with open(caminho, 'rb') as f:
+                    serializer.loads(f.read())
+
+            escrita = medir(escrever, repeticoes)
+            leitura = medir(ler, repeticoes)
+            print(f"{spec:<16}{escrita:>14.1f}{leitura:>14.1f}{os.path.getsize(caminho) / 1024:>14.1f}")
+
+        print()
+        print("Formatos indisponíveis (msgpack, zstd) requerem os pacotes 'msgpack' e 'zstandard'.")
+        print("Definir o formato com a variável de ambiente FILE_CACHE_FORMAT (ex: json+zlib).")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    benchmark(n, repeticoes)
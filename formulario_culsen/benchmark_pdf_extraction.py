@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark dos backends de extração de texto de PDF
+
+Corre cada backend disponível (PyPDF2, pdfplumber, pypdfium2) sobre uma pasta
+local de CVs de exemplo e mostra páginas por segundo, pico de memória (RSS) e
+caracteres extraídos. Cada backend corre num processo novo, para que o pico de
+memória de um não contamine o do seguinte.
+
+Um backend é considerado adequado se ler todos os arquivos que algum outro
+backend consegue ler e extrair pelo menos 90% dos caracteres do backend que
+mais extrai; o mais rápido dos adequados é o recomendado para
+PDF_EXTRACTION_BACKEND.
+
+Uso: python benchmark_pdf_extraction.py <pasta_de_cvs> [repeticoes]
+"""
+
+import sys
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.pdf_worker import extract_pdf_pages, available_backends
+from utils.text_extraction import normalize_text
+
+# Fração mínima dos caracteres do melhor backend para um backend ser adequado
+LIMIAR_ADEQUADO = 0.9
+
+# Backend -> pacote que o disponibiliza
+PACOTES = {'pypdf2': 'PyPDF2', 'pdfplumber': 'pdfplumber', 'pypdfium2': 'pypdfium2'}
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def pico_rss_mb():
+    """Pico de memória residente do processo atual, em MB (0 se indisponível)"""
+    if resource is None:
+        return 0.0
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB, macOS em bytes
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+def listar_pdfs(pasta):
+    """Lista os PDFs da pasta (e subpastas), por ordem"""
+    arquivos = []
+    for raiz, _, nomes in os.walk(pasta):
+        arquivos.extend(os.path.join(raiz, nome) for nome in nomes if nome.lower().endswith('.pdf'))
+    return sorted(arquivos)
+
+def medir_backend(backend, arquivos, repeticoes):
+    """Executado num processo próprio: extrai todos os arquivos e mede tempo e memória"""
+    rss_inicial = pico_rss_mb()
+    caracteres = {}
+    paginas = 0
+    erros = []
+    tempos = []
+
+    for repeticao in range(repeticoes):
+        inicio = time.perf_counter()
+        for arquivo in arquivos:
+            try:
+                texto = [normalize_text(pagina) for pagina in extract_pdf_pages(arquivo, backend)]
+            except Exception as e:
+                if repeticao == 0:
+                    erros.append(f"{os.path.basename(arquivo)}: {type(e).__name__}: {str(e)[:80]}")
+                continue
+            if repeticao == 0:
+                paginas += len(texto)
+                caracteres[arquivo] = sum(len(pagina) for pagina in texto)
+        tempos.append(time.perf_counter() - inicio)
+
+    tempos.sort()
+    mediana = tempos[len(tempos) // 2]
+    return {
+        'backend': backend,
+        'paginas': paginas,
+        'paginas_por_segundo': paginas / mediana if mediana else 0.0,
+        'tempo_ms': mediana * 1000,
+        'caracteres': caracteres,
+        'pico_rss_mb': pico_rss_mb(),
+        'rss_extracao_mb': pico_rss_mb() - rss_inicial,
+        'erros': erros,
+    }
+
+def benchmark(pasta, repeticoes=3):
+    arquivos = listar_pdfs(pasta)
+    if not arquivos:
+        print(f"Nenhum PDF encontrado em {pasta}")
+        return
+
+    backends = available_backends()
+    print(f"=== BENCHMARK DA EXTRAÇÃO DE PDF ({len(arquivos)} arquivos, mediana de {repeticoes}) ===")
+    print()
+
+    resultados = []
+    contexto = multiprocessing.get_context('spawn')
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+            resultados.append(executor.submit(medir_backend, backend, arquivos, repeticoes).result())
+
+    print(f"{'Backend':<12}{'Páginas/s':>12}{'Tempo (ms)':>12}{'Pico RSS (MB)':>15}{'Extração (MB)':>15}"
+          f"{'Caracteres':>12}{'Sem texto':>11}{'Erros':>7}")
+    print("-" * 96)
+    for resultado in resultados:
+        caracteres = resultado['caracteres']
+        sem_texto = sum(1 for total in caracteres.values() if total == 0)
+        print(f"{resultado['backend']:<12}{resultado['paginas_por_segundo']:>12.1f}{resultado['tempo_ms']:>12.0f}"
+              f"{resultado['pico_rss_mb']:>15.1f}{resultado['rss_extracao_mb']:>15.1f}"
+              f"{sum(caracteres.values()):>12}{sem_texto:>11}{len(resultado['erros']):>7}")
+
+    for resultado in resultados:
+        for erro in resultado['erros']:
+            print(f"  [{resultado['backend']}] {erro}")
+
+    # Caracteres extraídos por arquivo, para comparar a qualidade entre backends
+    print()
+    print(f"{'Arquivo':<40}" + ''.join(f"{resultado['backend']:>12}" for resultado in resultados))
+    print("-" * (40 + 12 * len(resultados)))
+    for arquivo in arquivos:
+        nome = os.path.basename(arquivo)
+        nome = nome if len(nome) <= 38 else nome[:35] + '...'
+        colunas = ''.join(
+            f"{resultado['caracteres'][arquivo]:>12}" if arquivo in resultado['caracteres'] else f"{'erro':>12}"
+            for resultado in resultados
+        )
+        print(f"{nome:<40}{colunas}")
+
+    # Arquivos que nenhum backend lê (ex: corrompidos) não contam contra nenhum
+    legiveis = set().union(*(resultado['caracteres'] for resultado in resultados))
+    melhor = max(sum(resultado['caracteres'].values()) for resultado in resultados)
+    adequados = [
+        resultado for resultado in resultados
+        if legiveis <= set(resultado['caracteres'])
+        and sum(resultado['caracteres'].values()) >= LIMIAR_ADEQUADO * melhor
+    ]
+
+    print()
+    if adequados:
+        escolhido = max(adequados, key=lambda resultado: resultado['paginas_por_segundo'])
+        print(f"Backend recomendado: {escolhido['backend']} (o mais rápido entre os que leem todos "
+              f"os arquivos e extraem pelo menos {LIMIAR_ADEQUADO:.0%} do texto)")
+        print(f"Definir com a variável de ambiente PDF_EXTRACTION_BACKEND={escolhido['backend']}")
+    else:
+        print("Nenhum backend leu todos os arquivos legíveis.")
+
+    indisponiveis = [pacote for backend, pacote in PACOTES.items() if backend not in backends]
+    if indisponiveis:
+        print(f"Backends indisponíveis requerem os pacotes: {', '.join(indisponiveis)}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    benchmark(sys.argv[1], repeticoes)
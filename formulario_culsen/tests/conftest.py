@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# As instâncias globais (ex: default_file_cache) são criadas ao importar os módulos:
+# os seus diretórios ficam num diretório temporário, fora da árvore do projeto
+_RUNTIME_DIR = tempfile.mkdtemp(prefix='formulario_culsen_tests_')
+for _variable, _path in (
+    ('FILE_CACHE_DIR', 'cache'),
+    ('JOB_QUEUE_DIR', 'jobs'),
+    ('SUBMISSION_QUEUE_DIR', 'queue'),
+    ('SHEETS_REPLICA_PATH', os.path.join('replica', 'sheets.db')),
+    ('RATE_LIMIT_DIR', 'ratelimit'),
+):
+    os.environ[_variable] = os.path.join(_RUNTIME_DIR, _path)
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_RUNTIME_DIR, ignore_errors=True)
+
+def wait_until(condition, timeout=5.0, interval=0.02):
+    """Espera até a condição ser verdadeira; retorna o último valor da condição"""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = condition()
+        if result or time.monotonic() >= deadline:
+            return result
+        time.sleep(interval)
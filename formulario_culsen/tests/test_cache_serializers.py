@@ -0,0 +1,64 @@
+import json
+import pickle
+
+import pytest
+
+from utils.cache_serializers import CacheSerializer, available_specs, DEFAULT_SPEC, DECODE_ERRORS
+from utils.file_cache import FileCache
+
+VALUE = {'Nome': 'Ana Sofia', 'Idade': 31, 'Notas': [1.5, None, True], 'Texto': 'ação'}
+
+@pytest.mark.parametrize('spec', available_specs())
+def test_round_trip(spec):
+    """Cada formato+compressão disponível devolve o mesmo valor, com o formato no cabeçalho"""
+    serializer = CacheSerializer(spec)
+    data = serializer.dumps(VALUE)
+
+    assert data.startswith(b"FCACHE1 " + serializer.format.encode())
+    assert serializer.loads(data) == VALUE
+
+def test_legacy_json_without_header_is_read():
+    """Arquivos do formato JSON antigo (sem cabeçalho) continuam legíveis"""
+    data = json.dumps(VALUE, indent=2).encode('utf-8')
+    assert CacheSerializer('json+zlib').loads(data) == VALUE
+
+def test_other_formats_are_read_regardless_of_configuration():
+    """Mudar o formato configurado não invalida os arquivos escritos noutro formato seguro"""
+    assert CacheSerializer('json').loads(CacheSerializer('json+zlib').dumps(VALUE)) == VALUE
+
+def test_default_and_unknown_specs_never_use_pickle():
+    """Por omissão e para formatos desconhecidos nunca se escreve pickle"""
+    assert CacheSerializer().spec == DEFAULT_SPEC != 'pickle'
+    assert CacheSerializer('yaml+brotli').spec == 'json'
+
+def test_pickle_is_read_only_when_configured():
+    """Um arquivo em pickle só é desserializado se pickle for o formato configurado"""
+    data = CacheSerializer('pickle').dumps(VALUE)
+
+    assert CacheSerializer('pickle').loads(data) == VALUE
+    with pytest.raises(ValueError):
+        CacheSerializer('json').loads(data)
+
+def test_planted_pickle_file_is_discarded_by_cache(tmp_path):
+    """Um arquivo pickle deixado no diretório de cache é tratado como corrompido"""
+    writer = FileCache(cache_dir=str(tmp_path), serializer='pickle', sync_interval=0)
+    writer.set('config', VALUE)
+
+    reader = FileCache(cache_dir=str(tmp_path), serializer='json', sync_interval=0)
+    assert reader.get('config') is None
+
+def test_truncated_data_raises_decode_error():
+    """Dados truncados dão um dos erros de DECODE_ERRORS"""
+    data = CacheSerializer('json+zlib').dumps(VALUE)
+    with pytest.raises(DECODE_ERRORS):
+        CacheSerializer('json+zlib').loads(data[:-5])
+
+def test_pickle_payload_is_not_executed_under_json():
+    """O conteúdo de um arquivo pickle não chega a ser desserializado com json configurado"""
+    class Payload:
+        def __reduce__(self):
+            return (pytest.fail, ("pickle executado",))
+
+    data = b"FCACHE1 pickle/none\n" + pickle.dumps(Payload())
+    with pytest.raises(ValueError):
+        CacheSerializer('json').loads(data)
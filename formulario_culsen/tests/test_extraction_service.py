@@ -0,0 +1,87 @@
+import os
+import time
+
+import pytest
+
+from utils.extraction_service import ExtractionService, ExtractionTimeout
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason="processos de extração requerem POSIX")
+
+# Funções executadas nos processos de extração (importadas por nome a partir deste módulo)
+
+def _size(path):
+    return os.path.getsize(path)
+
+def _pid(path):
+    return os.getpid()
+
+def _hang(path):
+    time.sleep(60)
+
+def _die(path):
+    os._exit(3)
+
+def _invalid(path):
+    raise ValueError(f"PDF inválido: {os.path.basename(path)}")
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    # Os processos de extração só têm a raiz do projeto no sys.path
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(os.path.abspath(__file__)))
+    service = ExtractionService(workers=2, timeout=2.0, memory_limit_mb=0)
+    yield service
+    service.shutdown()
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / 'cv.pdf'
+    path.write_bytes(b'%PDF-1.4 exemplo')
+    return str(path)
+
+def test_extraction_runs_in_reused_worker(service, document):
+    """A função corre noutro processo, que é reutilizado no pedido seguinte"""
+    assert service.run(_size, document) == os.path.getsize(document)
+
+    first = service.run(_pid, document)
+    assert first != os.getpid()
+    assert service.run(_pid, document) == first
+    assert service.get_stats()['completed'] == 3
+
+def test_extraction_error_keeps_worker(service, document):
+    """Um erro da extração chega ao chamador e o processo continua a servir"""
+    pid = service.run(_pid, document)
+
+    with pytest.raises(ValueError, match="PDF inválido: cv.pdf"):
+        service.run(_invalid, document)
+
+    assert service.run(_pid, document) == pid
+    assert service.get_stats()['worker_restarts'] == 0
+
+def test_timeout_replaces_worker(service, document):
+    """Um documento preso termina o seu processo; o pedido seguinte usa um processo novo"""
+    service.timeout = 0.5
+    pid = service.run(_pid, document)
+
+    with pytest.raises(ExtractionTimeout, match="0.5s: cv.pdf"):
+        service.run(_hang, document)
+
+    assert service.run(_pid, document) not in (pid, os.getpid())
+    stats = service.get_stats()
+    assert stats['timeouts'] == 1
+    assert stats['worker_restarts'] == 1
+
+def test_dead_worker_is_restarted(service, document):
+    """Um processo que morre a meio (ex: limite de memória) dá MemoryError e é substituído"""
+    pid = service.run(_pid, document)
+
+    with pytest.raises(MemoryError, match="cv.pdf"):
+        service.run(_die, document)
+
+    assert service.run(_pid, document) not in (pid, os.getpid())
+    assert service.get_stats()['worker_restarts'] == 1
+
+def test_without_workers_runs_inline(document):
+    """Com workers=0 a extração é feita na thread que a pede"""
+    service = ExtractionService(workers=0)
+    assert service.run(_pid, document) == os.getpid()
+    assert service.get_stats()['inline'] == 1
@@ -0,0 +1,85 @@
+import time
+import secrets
+
+import pytest
+
+from conftest import wait_until
+from utils.file_cache import FileCache
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+def _cache(cache_dir, **kwargs):
+    return FileCache(cache_dir=cache_dir, sync_interval=0, **kwargs)
+
+def _fill(cache, keys):
+    """Grava as chaves por ordem, com tempos de escrita distintos"""
+    for key in keys:
+        cache.set(key, {'key': key})
+        time.sleep(0.01)
+
+def test_lru_evicts_least_recently_used(cache_dir):
+    """Acima de max_entries sai a entrada usada há mais tempo, não a gravada há mais tempo"""
+    cache = _cache(cache_dir, max_entries=3, eviction='lru')
+    _fill(cache, ['candidate_a', 'candidate_b', 'candidate_c'])
+    assert cache.get('candidate_a') == {'key': 'candidate_a'}
+
+    cache.set('candidate_d', {'key': 'candidate_d'})
+
+    assert sorted(cache._manifest) == ['candidate_a', 'candidate_c', 'candidate_d']
+    assert cache.get_stats()['budget']['evicted'] == 1
+
+def test_lfu_evicts_least_frequently_used(cache_dir):
+    """Com lfu sai a entrada com menos acessos, mesmo que tenha sido usada há pouco"""
+    cache = _cache(cache_dir, max_entries=3, eviction='lfu')
+    _fill(cache, ['candidate_a', 'candidate_b', 'candidate_c'])
+    for _ in range(3):
+        cache.get('candidate_a')
+        cache.get('candidate_c')
+    cache.get('candidate_b')
+
+    cache.set('candidate_d', {'key': 'candidate_d'})
+
+    assert sorted(cache._manifest) == ['candidate_a', 'candidate_c', 'candidate_d']
+
+def test_byte_budget_keeps_newest_entry(cache_dir):
+    """O orçamento em bytes remove entradas antigas e nunca a que acabou de ser gravada"""
+    cache = _cache(cache_dir, max_bytes=2000, serializer='json')
+    _fill(cache, [f"cv_text_{i}" for i in range(5)])
+    cache.set('cv_text_grande', secrets.token_hex(800))
+
+    stats = cache.get_stats()
+    assert stats['total_size_bytes'] <= 2000
+    assert 'cv_text_grande' in cache._manifest
+    assert 'cv_text_0' not in cache._manifest
+
+def test_maintenance_persists_access_counts(cache_dir):
+    """Os acessos registados em memória chegam ao manifest na manutenção e sobrevivem a um reinício"""
+    cache = _cache(cache_dir)
+    cache.set('candidate_a', 1)
+    cache.get('candidate_a')
+    cache.get('candidate_a')
+
+    cache.run_maintenance()
+
+    assert _cache(cache_dir)._manifest['candidate_a']['hits'] == 2
+
+def test_janitor_removes_expired_and_enforces_lowered_budget(cache_dir):
+    """A thread de manutenção remove expirados e aplica um orçamento reduzido entretanto"""
+    cache = _cache(cache_dir)
+    _fill(cache, ['candidate_a', 'candidate_b', 'candidate_c', 'candidate_d'])
+    cache._manifest['candidate_a']['timestamp'] -= 3600
+    cache.max_entries = 2
+
+    cache.start_janitor(interval=0.05)
+    try:
+        assert wait_until(lambda: cache.get_stats()['budget']['runs'] >= 1)
+    finally:
+        cache.stop_janitor()
+
+    budget = cache.get_stats()['budget']
+    assert budget['expired'] == 1
+    assert budget['evicted'] == 1
+    assert sorted(cache._manifest) == ['candidate_c', 'candidate_d']
+    assert not budget['janitor_running']
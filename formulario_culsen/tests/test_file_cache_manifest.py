@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from utils.file_cache import FileCache, MANIFEST_FILENAME, MANIFEST_LOG_FILENAME
+from utils.process_lock import process_locks_available
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+def _cache(cache_dir, **kwargs):
+    return FileCache(cache_dir=cache_dir, sync_interval=0, **kwargs)
+
+def _log_lines(cache_dir):
+    with open(os.path.join(cache_dir, MANIFEST_LOG_FILENAME), 'rb') as f:
+        return f.read().splitlines()
+
+def test_writes_append_to_log_without_rewriting_snapshot(cache_dir):
+    """Cada escrita acrescenta uma linha ao log; o snapshot só muda na compactação"""
+    cache = _cache(cache_dir)
+    for i in range(20):
+        cache.set(f"candidate_{i}", {'id': i})
+    snapshot = os.stat(os.path.join(cache_dir, MANIFEST_FILENAME))
+
+    cache.set('candidate_0', {'id': 0, 'Status': 'Analisado'})
+    cache.invalidate('candidate_1')
+
+    assert os.stat(os.path.join(cache_dir, MANIFEST_FILENAME)).st_mtime_ns == snapshot.st_mtime_ns
+    assert len(_log_lines(cache_dir)) == 22
+
+def test_new_instance_replays_log(cache_dir):
+    """Um processo que arranca lê o snapshot e aplica-lhe o log"""
+    cache = _cache(cache_dir)
+    cache.set('candidate_1', 'Ana')
+    cache.set('candidate_2', 'Rui')
+    cache.invalidate('candidate_1')
+
+    restarted = _cache(cache_dir)
+    assert restarted.get('candidate_1') is None
+    assert restarted.get('candidate_2') == 'Rui'
+    assert restarted.get_stats()['total_files'] == 1
+
+def test_maintenance_compacts_log(cache_dir):
+    """A manutenção grava o snapshot completo e esvazia o log"""
+    cache = _cache(cache_dir)
+    cache.set('candidate_1', 'Ana')
+    cache.set('candidate_2', 'Rui')
+
+    cache.run_maintenance()
+
+    assert _log_lines(cache_dir) == []
+    assert _cache(cache_dir).get('candidate_2') == 'Rui'
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_other_process_reads_only_log_tail(cache_dir):
+    """Outro processo aplica só as linhas novas do log, e relê tudo após a compactação"""
+    writer = _cache(cache_dir)
+    reader = _cache(cache_dir)
+    writer.set('candidates_all', {'total': 1})
+    assert reader.get('candidates_all') == {'total': 1}
+
+    writer.set('candidates_all', {'total': 2})
+    assert reader.get('candidates_all') == {'total': 2}
+    assert reader.get_stats()['shared']['manifest_log_reads'] >= 1
+
+    writer.invalidate('candidates_all')
+    writer.run_maintenance()
+    assert reader.get('candidates_all') is None
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from utils.file_cache import FileCache
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+def _cache(cache_dir, **kwargs):
+    return FileCache(cache_dir=cache_dir, sync_interval=0, **kwargs)
+
+def test_patch_updates_value_and_keeps_age(cache_dir):
+    """patch altera o valor no lugar sem renovar o TTL da entrada"""
+    cache = _cache(cache_dir)
+    cache.set('candidates_all', [{'Nome': 'Ana', 'Status': 'Novo'}])
+    age_before = cache.entry_age('candidates_all')
+
+    time.sleep(0.05)
+    assert cache.patch('candidates_all', lambda rows: [dict(rows[0], Status='Analisado')])
+
+    assert cache.get('candidates_all') == [{'Nome': 'Ana', 'Status': 'Analisado'}]
+    assert cache.entry_age('candidates_all') >= age_before + 0.05
+    assert cache.get_stats()['shared']['patches'] == 1
+
+def test_patch_is_visible_to_other_instances(cache_dir):
+    """Outro processo (instância) com a entrada no L1 vê a versão alterada"""
+    writer = _cache(cache_dir)
+    reader = _cache(cache_dir)
+    writer.set('candidates_all', {'total': 1})
+    assert reader.get('candidates_all') == {'total': 1}
+
+    assert writer.patch('candidates_all', lambda value: {'total': value['total'] + 1})
+    assert reader.get('candidates_all') == {'total': 2}
+
+def test_patch_missing_or_declined(cache_dir):
+    """Sem entrada, ou se a função devolve None, nada é escrito"""
+    cache = _cache(cache_dir)
+    assert not cache.patch('candidates_all', lambda value: value)
+
+    cache.set('candidates_all', {'total': 1})
+    assert not cache.patch('candidates_all', lambda value: None)
+    assert cache.get('candidates_all') == {'total': 1}
+
+def test_patch_expired_entry_is_refused(cache_dir):
+    """Uma entrada já expirada não é ressuscitada por um patch"""
+    cache = _cache(cache_dir)
+    cache.register_namespace('curto', ttl=1)
+    cache.set('curto', 'antigo')
+    with cache._lock:
+        cache._manifest['curto']['timestamp'] -= 10
+        cache._l1.clear()
+
+    assert not cache.patch('curto', lambda value: 'novo')
+    assert cache.get('curto') is None
+
+def test_invalidate_tag_removes_only_tagged_entries(cache_dir):
+    """invalidate_tag remove as entradas da tag, em todas as instâncias, e deixa as restantes"""
+    cache = _cache(cache_dir)
+    other = _cache(cache_dir)
+    cache.set('candidates_all', [1, 2, 3])
+    cache.set('candidate_7', {'id': 7}, tags=['candidates'])
+    cache.set('config', {'MODO': 'teste'})
+    assert other.get('candidate_7') == {'id': 7}
+
+    assert cache.invalidate_tag('candidates') == 2
+
+    assert cache.get('candidates_all') is None
+    assert other.get('candidate_7') is None
+    assert other.get('config') == {'MODO': 'teste'}
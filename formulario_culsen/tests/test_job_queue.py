@@ -0,0 +1,165 @@
+import json
+import os
+import time
+
+import pytest
+
+from conftest import wait_until
+from utils.job_queue import JobQueue
+
+@pytest.fixture
+def jobs_dir(tmp_path):
+    return str(tmp_path / 'jobs')
+
+def _queue(jobs_dir, stages, **kwargs):
+    kwargs.setdefault('workers', 1)
+    kwargs.setdefault('max_backoff', 0.05)
+    return JobQueue(stages, jobs_dir=jobs_dir, **kwargs)
+
+def _finished(queue, job_id):
+    status = queue.get_status(job_id)
+    return status if status and status['status'] in ('done', 'failed') else None
+
+def _write_job(jobs_dir, **fields):
+    """Grava um trabalho como se tivesse ficado a meio noutro processo"""
+    now = time.time()
+    job = {
+        'id': 'pendente',
+        'status': 'running',
+        'stage': 'upload',
+        'completed_stages': [],
+        'attempts': 1,
+        'error': None,
+        'data': {},
+        'created_at': now,
+        'updated_at': now,
+    }
+    job.update(fields)
+    os.makedirs(jobs_dir, exist_ok=True)
+    with open(os.path.join(jobs_dir, f"{job['id']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    return job['id']
+
+def test_stages_run_in_order_and_share_data(jobs_dir):
+    """As etapas correm por ordem, partilham job['data'] e on_finish recebe o trabalho terminado"""
+    finished = []
+
+    def upload(job):
+        job['data']['url'] = 'https://drive/cv'
+
+    def save(job):
+        job['data']['result'] = {'saved': job['data']['url']}
+
+    queue = _queue(jobs_dir, [('upload', upload), ('save', save)], on_finish=finished.append)
+    try:
+        job_id = queue.submit({'nome': 'Ana'})
+        status = wait_until(lambda: _finished(queue, job_id))
+    finally:
+        queue.stop()
+
+    assert status['status'] == 'done'
+    assert status['completed_stages'] == ['upload', 'save']
+    assert status['progress'] == 1.0
+    assert status['result'] == {'saved': 'https://drive/cv'}
+    assert [job['id'] for job in finished] == [job_id]
+
+def test_failed_stage_is_retried_without_repeating_completed_ones(jobs_dir):
+    """Uma etapa que falha é repetida; as etapas já concluídas não voltam a correr"""
+    calls = []
+
+    def upload(job):
+        calls.append('upload')
+
+    def analyze(job):
+        calls.append('analyze')
+        if calls.count('analyze') < 3:
+            raise RuntimeError("provedor indisponível")
+
+    queue = _queue(jobs_dir, [('upload', upload), ('analyze', analyze)], max_attempts=3)
+    try:
+        job_id = queue.submit({})
+        status = wait_until(lambda: _finished(queue, job_id))
+    finally:
+        queue.stop()
+
+    assert status['status'] == 'done'
+    assert calls == ['upload', 'analyze', 'analyze', 'analyze']
+    assert status['error'] is None
+    assert queue.get_stats()['retries'] == 2
+
+def test_job_fails_after_max_attempts(jobs_dir):
+    """Esgotadas as tentativas, o trabalho fica 'failed' com o erro da etapa"""
+    def save(job):
+        raise RuntimeError("planilha indisponível")
+
+    queue = _queue(jobs_dir, [('save', save)], max_attempts=2)
+    try:
+        job_id = queue.submit({})
+        status = wait_until(lambda: _finished(queue, job_id))
+    finally:
+        queue.stop()
+
+    assert status['status'] == 'failed'
+    assert status['stage'] == 'save'
+    assert status['error'] == 'save: planilha indisponível'
+    assert queue.get_stats()['failed'] == 1
+
+def test_best_effort_stage_does_not_fail_job(jobs_dir):
+    """Uma etapa opcional que esgota as tentativas é ignorada e o trabalho termina 'done'"""
+    def save(job):
+        pass
+
+    def notify(job):
+        raise RuntimeError("SMTP indisponível")
+
+    queue = _queue(jobs_dir, [('save', save), ('notify', notify)], max_attempts=2, best_effort=['notify'])
+    try:
+        job_id = queue.submit({})
+        status = wait_until(lambda: _finished(queue, job_id))
+    finally:
+        queue.stop()
+
+    assert status['status'] == 'done'
+    assert status['completed_stages'] == ['save']
+    assert status['skipped_stages'] == ['notify']
+
+def test_interrupted_job_resumes_from_pending_stage(jobs_dir):
+    """Um trabalho interrompido (ex: reinício do processo) retoma na etapa em falta"""
+    calls = []
+    job_id = _write_job(jobs_dir, stage='analyze', completed_stages=['upload'])
+
+    queue = _queue(jobs_dir, [
+        ('upload', lambda job: calls.append('upload')),
+        ('analyze', lambda job: calls.append('analyze')),
+    ])
+    queue.start()
+    try:
+        status = wait_until(lambda: _finished(queue, job_id))
+    finally:
+        queue.stop()
+
+    assert status['status'] == 'done'
+    assert calls == ['analyze']
+    assert queue.get_stats()['recovered'] == 1
+
+def test_recovered_retry_waits_for_its_backoff(jobs_dir):
+    """Uma repetição em espera não é antecipada por outro processo que recupere os trabalhos"""
+    calls = []
+    job_id = _write_job(jobs_dir, status='retrying', retry_at=time.time() + 0.5)
+
+    queue = _queue(jobs_dir, [('upload', lambda job: calls.append(time.time()))])
+    started = time.time()
+    queue.start()
+    try:
+        status = wait_until(lambda: _finished(queue, job_id))
+    finally:
+        queue.stop()
+
+    assert status['status'] == 'done'
+    assert len(calls) == 1 and calls[0] - started >= 0.4
+
+def test_get_status_rejects_paths(jobs_dir):
+    """O identificador vem do URL: nomes com caminhos não são lidos"""
+    queue = _queue(jobs_dir, [('upload', lambda job: None)])
+    assert queue.get_status('../segredo') is None
+    assert queue.get_status('inexistente') is None
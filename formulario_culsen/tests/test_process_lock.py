@@ -0,0 +1,94 @@
+import os
+import sys
+import subprocess
+import threading
+
+import pytest
+
+from utils.process_lock import ProcessFileLock, process_locks_available
+
+requires_fcntl = pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+
+# Tenta obter o lock noutro processo; o código de saída indica se conseguiu
+_TRY_ACQUIRE = (
+    "import sys; from utils.process_lock import ProcessFileLock; "
+    "sys.exit(0 if ProcessFileLock(sys.argv[1]).acquire(timeout=0.1) else 1)"
+)
+
+def _acquired_by_other_process(path):
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', _TRY_ACQUIRE, path], cwd=project_dir, timeout=30)
+    return result.returncode == 0
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / 'teste.lock')
+
+def test_lock_is_exclusive_between_threads(lock_path):
+    """Só uma thread de cada vez está dentro da secção protegida"""
+    lock = ProcessFileLock(lock_path)
+    inside = []
+    overlaps = []
+
+    def worker():
+        for _ in range(50):
+            with lock:
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                inside.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []
+
+def test_acquire_times_out(lock_path):
+    """Com o lock ocupado, acquire com timeout retorna False em vez de bloquear"""
+    lock = ProcessFileLock(lock_path, poll_interval=0.01)
+    assert lock.acquire()
+    try:
+        result = []
+        thread = threading.Thread(target=lambda: result.append(lock.acquire(timeout=0.05)))
+        thread.start()
+        thread.join(5)
+        assert result == [False]
+    finally:
+        lock.release()
+
+    assert lock.acquire(timeout=0.05)
+    lock.release()
+
+@requires_fcntl
+def test_lock_is_exclusive_between_processes(lock_path):
+    """Outro processo não obtém o lock enquanto este o detém, e obtém-no depois de libertado"""
+    lock = ProcessFileLock(lock_path)
+    with lock:
+        assert not _acquired_by_other_process(lock_path)
+    assert _acquired_by_other_process(lock_path)
+
+def test_disabled_lock_only_excludes_threads(lock_path):
+    """Com enabled=False o lock não usa o arquivo e não bloqueia outros processos"""
+    lock = ProcessFileLock(lock_path, enabled=False)
+    with lock:
+        assert not lock.acquire(timeout=0.01)
+        if process_locks_available():
+            assert _acquired_by_other_process(lock_path)
+
+@requires_fcntl
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="requer fork")
+def test_forget_in_child_keeps_parent_lock(lock_path):
+    """Um processo filho que descarta o lock herdado não o liberta no processo pai"""
+    lock = ProcessFileLock(lock_path)
+    with lock:
+        pid = os.fork()
+        if pid == 0:
+            lock.forget()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        assert not _acquired_by_other_process(lock_path)
+    assert _acquired_by_other_process(lock_path)
@@ -0,0 +1,99 @@
+import pytest
+
+from utils.process_lock import process_locks_available
+from utils.rate_limiter import (
+    GoogleApiLimiter, TokenBucket, PRIORITY_WRITE, PRIORITY_READ, PRIORITY_BACKGROUND
+)
+
+class _ApiError(Exception):
+    """Erro com o código HTTP no formato do gspread (error.response.status_code)"""
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.response = type('Response', (), {'status_code': status})()
+
+def _take_all(bucket, priority):
+    """Consome tokens até o bucket recusar; retorna quantos obteve"""
+    taken = 0
+    while True:
+        try:
+            bucket.acquire(priority, timeout=0.01)
+        except TimeoutError:
+            return taken
+        taken += 1
+
+def _flaky(status, failures):
+    """Função que falha `failures` vezes com o código dado e depois devolve 'ok'"""
+    calls = []
+
+    def function():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise _ApiError(status)
+        return 'ok'
+    return function, calls
+
+def _limiter(**kwargs):
+    kwargs.setdefault('base_delay', 0.001)
+    kwargs.setdefault('max_delay', 0.001)
+    return GoogleApiLimiter({'sheets': {'per_minute': 6000, 'capacity': 100}}, **kwargs)
+
+def test_lower_priorities_leave_their_reserve():
+    """Leituras deixam 20% da capacidade livre e o fundo 50%; as escritas usam o resto"""
+    bucket = TokenBucket(per_minute=0.001, capacity=10)
+
+    assert _take_all(bucket, PRIORITY_BACKGROUND) == 5
+    assert _take_all(bucket, PRIORITY_READ) == 3
+    assert _take_all(bucket, PRIORITY_WRITE) == 2
+
+def test_waiting_higher_priority_goes_first():
+    """Com uma escrita à espera, uma leitura não consome tokens mesmo havendo disponíveis"""
+    bucket = TokenBucket(per_minute=0.001, capacity=10)
+    bucket._waiting[PRIORITY_WRITE] += 1
+
+    with pytest.raises(TimeoutError):
+        bucket.acquire(PRIORITY_READ, timeout=0.05)
+    assert bucket.available() == pytest.approx(10, abs=0.01)
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_shared_state_is_one_bucket(tmp_path):
+    """Dois buckets com o mesmo arquivo de estado (ex: dois workers) partilham os tokens"""
+    state_path = str(tmp_path / 'sheets.bucket')
+    first = TokenBucket(per_minute=0.001, capacity=3, state_path=state_path)
+    second = TokenBucket(per_minute=0.001, capacity=3, state_path=state_path)
+
+    assert _take_all(first, PRIORITY_WRITE) + _take_all(second, PRIORITY_WRITE) == 3
+
+def test_rate_is_divided_without_shared_state():
+    """Sem estado partilhado, cada processo fica com a sua parte da quota"""
+    limiter = GoogleApiLimiter({'sheets': {'per_minute': 54, 'capacity': 6}}, processes=3)
+    bucket = limiter.buckets['sheets']
+
+    assert bucket.rate == pytest.approx(18 / 60)
+    assert bucket.capacity == 2
+
+def test_server_errors_are_retried_only_when_idempotent():
+    """Um 5xx numa leitura é repetido; numa escrita é propagado sem repetir"""
+    limiter = _limiter()
+
+    read, read_calls = _flaky(503, failures=2)
+    assert limiter.call('sheets', read, idempotent=True) == 'ok'
+    assert len(read_calls) == 3
+
+    write, write_calls = _flaky(503, failures=1)
+    with pytest.raises(_ApiError):
+        limiter.call('sheets', write)
+    assert len(write_calls) == 1
+
+def test_quota_errors_are_retried_up_to_the_limit():
+    """Um 429 é repetido mesmo em escritas, até max_retries, e depois propagado"""
+    limiter = _limiter(max_retries=2)
+
+    write, calls = _flaky(429, failures=1)
+    assert limiter.call('sheets', write) == 'ok'
+
+    always, calls = _flaky(429, failures=10)
+    with pytest.raises(_ApiError):
+        limiter.call('sheets', always)
+    assert len(calls) == 3
+    assert limiter.get_stats()['sheets']['failures'] == 1
@@ -0,0 +1,137 @@
+import re
+
+import pytest
+
+from utils.sheet_replica import SheetReplica
+
+class FakeWorksheet:
+    def __init__(self, title, row_count=100, col_count=5):
+        self.title = title
+        self.row_count = row_count
+        self.col_count = col_count
+
+class FakeSpreadsheet:
+    """Planilha em memória com o subconjunto da API usado pela réplica"""
+
+    def __init__(self, tabs):
+        self.tabs = tabs
+        self.version = 1
+        self.batch_gets = []
+        self.before_batch_get = None
+
+    def edit(self, title, row_index, row):
+        values = self.tabs[title]
+        while len(values) < row_index:
+            values.append([])
+        values[row_index - 1] = row
+        self.version += 1
+
+    def get_lastUpdateTime(self):
+        return f"2026-01-01T00:00:{self.version:02d}Z"
+
+    def worksheets(self):
+        return [FakeWorksheet(title) for title in self.tabs]
+
+    def values_batch_get(self, ranges):
+        if self.before_batch_get:
+            self.before_batch_get()
+        self.batch_gets.append(list(ranges))
+        value_ranges = []
+        for range_name in ranges:
+            match = re.match(r"'(.+)'(?:!A(\d+):[A-Z]+(\d+))?$", range_name)
+            title, first, last = match.group(1), match.group(2), match.group(3)
+            values = self.tabs[title]
+            if first:
+                values = values[int(first) - 1:int(last)]
+            value_ranges.append({'values': [list(row) for row in values]})
+        return {'valueRanges': value_ranges}
+
+@pytest.fixture
+def spreadsheet():
+    return FakeSpreadsheet({
+        'Respostas': [['Nome', 'Status'], ['Ana', 'NOVO'], ['Rui', 'NOVO']],
+        'Config': [['MODO', 'teste']],
+    })
+
+def _replica(spreadsheet, db_path, **kwargs):
+    kwargs.setdefault('verify_interval', 3600)
+    return SheetReplica(
+        lambda: spreadsheet,
+        {'responses': ['Respostas'], 'config': ['Config']},
+        db_path=str(db_path),
+        **kwargs
+    )
+
+def test_first_sync_is_full_and_unchanged_sheet_is_skipped(spreadsheet, tmp_path):
+    """A primeira sincronização lê as abas por inteiro; sem alterações, não há pedido"""
+    replica = _replica(spreadsheet, tmp_path / 'sheets.db')
+
+    assert replica.sync() == 4
+    assert replica.get_values('responses') == [['Nome', 'Status'], ['Ana', 'NOVO'], ['Rui', 'NOVO']]
+
+    assert replica.sync() == 0
+    assert len(spreadsheet.batch_gets) == 1
+    assert replica.get_stats()['skipped_syncs'] == 1
+
+def test_new_rows_are_read_from_the_tail(spreadsheet, tmp_path):
+    """Linhas acrescentadas são lidas só a partir da última linha conhecida"""
+    replica = _replica(spreadsheet, tmp_path / 'sheets.db')
+    replica.sync()
+
+    spreadsheet.edit('Respostas', 4, ['Eva', 'NOVO'])
+    assert replica.sync() == 1
+
+    assert "'Respostas'!A4:E100" in spreadsheet.batch_gets[-1]
+    assert replica.get_records('responses')[-1] == {'Nome': 'Eva', 'Status': 'NOVO'}
+
+def test_edit_of_existing_row_is_seen_after_verify_interval(spreadsheet, tmp_path):
+    """Uma edição de uma linha existente noutro sítio é apanhada pela leitura completa de verificação"""
+    replica = _replica(spreadsheet, tmp_path / 'sheets.db', verify_interval=0)
+    replica.sync()
+
+    spreadsheet.edit('Respostas', 2, ['Ana', 'APROVADO'])
+    assert replica.sync() == 1
+
+    assert "'Respostas'" in spreadsheet.batch_gets[-1]
+    assert replica.get_row('responses', 2) == {'Nome': 'Ana', 'Status': 'APROVADO'}
+
+def test_reconcile_removes_deleted_rows(spreadsheet, tmp_path):
+    """A reconciliação completa apaga da réplica as linhas removidas da planilha e avisa on_change"""
+    changes = []
+    replica = _replica(spreadsheet, tmp_path / 'sheets.db', on_change=lambda name, rows: changes.append((name, rows)))
+    replica.sync()
+
+    del spreadsheet.tabs['Respostas'][2]
+    spreadsheet.version += 1
+    replica.sync(force_full=True)
+
+    assert replica.get_values('responses') == [['Nome', 'Status'], ['Ana', 'NOVO']]
+    assert ('responses', None) in changes
+
+def test_dirty_mark_is_shared_between_processes(spreadsheet, tmp_path):
+    """Uma linha marcada por um processo deixa de ser servida pela réplica em todos até à sincronização"""
+    writer = _replica(spreadsheet, tmp_path / 'sheets.db')
+    reader = _replica(spreadsheet, tmp_path / 'sheets.db')
+    writer.sync()
+
+    spreadsheet.edit('Config', 1, ['MODO', 'producao'])
+    writer.mark_dirty('config', 1)
+    assert reader.get_values('config') is None
+
+    reader.sync()
+    assert writer.get_values('config') == [['MODO', 'producao']]
+    assert writer.get_stats()['dirty_rows'] == 0
+
+def test_mark_made_during_sync_survives_it(spreadsheet, tmp_path):
+    """Uma linha marcada de novo enquanto a sincronização decorre continua marcada no fim"""
+    replica = _replica(spreadsheet, tmp_path / 'sheets.db')
+    replica.sync()
+    replica.mark_dirty('responses', 2)
+
+    spreadsheet.before_batch_get = lambda: replica.mark_dirty('responses', 2)
+    replica.sync()
+    spreadsheet.before_batch_get = None
+
+    assert replica.get_row('responses', 2) is None
+    replica.sync()
+    assert replica.get_row('responses', 2) == {'Nome': 'Ana', 'Status': 'NOVO'}
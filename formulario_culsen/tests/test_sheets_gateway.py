@@ -0,0 +1,92 @@
+import datetime
+import threading
+
+import gspread
+import pytest
+
+from conftest import wait_until
+from utils.sheets import SheetsGateway
+
+class FakeCredentials:
+    token = 'token'
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+class FakeSpreadsheet:
+    """Planilha cujo pedido de metadados pode ficar preso até release.set()"""
+
+    client = None
+
+    def __init__(self, titles):
+        self.titles = titles
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch_sheet_metadata(self, params):
+        self.calls += 1
+        metadata = {'sheets': [
+            {'properties': {'sheetId': i, 'title': title, 'index': i, 'gridProperties': {}}}
+            for i, title in enumerate(self.titles)
+        ]}
+        self.started.set()
+        assert self.release.wait(5)
+        return metadata
+
+@pytest.fixture
+def spreadsheet():
+    return FakeSpreadsheet(['Respostas', 'Config'])
+
+@pytest.fixture
+def gateway(spreadsheet):
+    gateway = SheetsGateway('planilha', [], metadata_ttl=300)
+    gateway._credentials = FakeCredentials()
+    gateway._client = object()
+    gateway._spreadsheet = spreadsheet
+    return gateway
+
+def _in_threads(count, function):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(function())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+def test_metadata_is_cached_for_ttl(gateway, spreadsheet):
+    """Os handles das abas vêm de um único pedido enquanto os metadados são válidos"""
+    assert gateway.worksheet('Config').title == 'Config'
+    assert gateway.resolve_worksheet('Inexistente', 'Respostas').title == 'Respostas'
+    with pytest.raises(gspread.exceptions.WorksheetNotFound):
+        gateway.worksheet('Inexistente')
+
+    assert spreadsheet.calls == 1
+
+def test_concurrent_fetches_are_coalesced_without_holding_lock(gateway, spreadsheet):
+    """Vários pedidos com os metadados expirados fazem uma só leitura, feita fora do lock"""
+    spreadsheet.release.clear()
+    threads, results = _in_threads(4, gateway.fetch_sheet_metadata)
+    try:
+        assert spreadsheet.started.wait(5)
+        # O lock está livre durante o pedido: get_stats não fica à espera
+        assert wait_until(lambda: gateway.get_stats()['metadata_coalesced'] == 3)
+    finally:
+        spreadsheet.release.set()
+        for thread in threads:
+            thread.join(5)
+
+    assert spreadsheet.calls == 1
+    assert [[handle.title for handle in result] for result in results] == [['Respostas', 'Config']] * 4
+
+def test_fetch_started_before_invalidation_is_not_cached(gateway, spreadsheet):
+    """Metadados lidos antes de forget_worksheet não substituem o descarte"""
+    spreadsheet.release.clear()
+    threads, results = _in_threads(1, gateway.fetch_sheet_metadata)
+    assert spreadsheet.started.wait(5)
+    gateway.forget_worksheet('Config')
+    spreadsheet.titles = ['Respostas']
+    spreadsheet.release.set()
+    threads[0].join(5)
+
+    assert [handle.title for handle in results[0]] == ['Respostas', 'Config']
+    assert [handle.title for handle in gateway.fetch_sheet_metadata()] == ['Respostas']
+    assert spreadsheet.calls == 2
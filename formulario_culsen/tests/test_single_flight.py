@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from conftest import wait_until
+from utils.file_cache import SingleFlight
+
+def _run_concurrently(flight, key, fetch_function, count):
+    """Chama flight.do a partir de várias threads; retorna (resultados, exceções)"""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fetch_function))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def test_concurrent_calls_share_one_fetch():
+    """Só a primeira thread busca; as restantes recebem o mesmo resultado"""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {'valor': 42}
+
+    threads, results, errors = _run_concurrently(flight, 'chave', fetch, 5)
+    assert wait_until(lambda: flight.get_stats()['in_flight'].get('chave') == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert errors == []
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    stats = flight.get_stats()
+    assert stats['leaders'] == 1
+    assert stats['coalesced_waiters'] == 4
+    assert stats['in_flight'] == {}
+
+def test_error_is_shared_with_waiters():
+    """A exceção da busca chega a todas as threads em espera, e a chave fica livre"""
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ValueError("API indisponível")
+
+    threads, results, errors = _run_concurrently(flight, 'chave', fetch, 3)
+    assert wait_until(lambda: flight.get_stats()['in_flight'].get('chave') == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == []
+    assert len(errors) == 3 and all(isinstance(error, ValueError) for error in errors)
+    assert flight.do('chave', lambda: 'ok') == 'ok'
+
+def test_waiter_fetches_itself_after_timeout():
+    """Uma thread que espera mais do que wait_timeout faz a busca ela própria"""
+    flight = SingleFlight(wait_timeout=0.1)
+    release = threading.Event()
+
+    leader = threading.Thread(target=lambda: flight.do('chave', lambda: release.wait(5) and 'lento'))
+    leader.start()
+    assert wait_until(lambda: 'chave' in flight.get_stats()['in_flight'])
+
+    try:
+        assert flight.do('chave', lambda: 'direto') == 'direto'
+        assert flight.get_stats()['wait_timeouts'] == 1
+    finally:
+        release.set()
+        leader.join(5)
+
+def test_different_keys_do_not_wait_for_each_other():
+    """Buscas de chaves diferentes correm em paralelo"""
+    flight = SingleFlight()
+    release = threading.Event()
+
+    leader = threading.Thread(target=lambda: flight.do('a', lambda: release.wait(5)))
+    leader.start()
+    assert wait_until(lambda: 'a' in flight.get_stats()['in_flight'])
+
+    try:
+        assert flight.do('b', lambda: 'b') == 'b'
+    finally:
+        release.set()
+        leader.join(5)
+
+    with pytest.raises(KeyError):
+        flight.do('c', lambda: {}['nada'])
@@ -0,0 +1,169 @@
+import json
+import os
+import multiprocessing
+
+import pytest
+
+from conftest import wait_until
+from utils.process_lock import process_locks_available
+from utils.submission_queue import SubmissionQueue
+
+def _failing_flush(title, rows):
+    raise RuntimeError("quota excedida")
+
+def _end_process(queue):
+    """Simula o fim do processo dono do journal: para a thread e liberta o lock do journal"""
+    queue.stop()
+    if queue._journal_lock is not None:
+        queue._journal_lock.release()
+
+def test_pending_rows_are_replayed_in_order_after_restart(tmp_path):
+    """Linhas não enviadas sobrevivem ao fim do processo e são enviadas pela ordem de chegada"""
+    first = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=0.05)
+    for i in range(3):
+        first.enqueue('Respostas', [f"linha {i}"])
+    _end_process(first)
+
+    sent = []
+    second = SubmissionQueue(lambda title, rows: sent.extend(rows), journal_dir=str(tmp_path), flush_interval=0.05)
+    assert second.pending_count() == 3
+
+    second.start()
+    try:
+        assert wait_until(lambda: second.pending_count() == 0)
+    finally:
+        second.stop()
+    assert sent == [["linha 0"], ["linha 1"], ["linha 2"]]
+
+def test_journal_is_compacted_after_ack(tmp_path):
+    """Depois de tudo enviado, o journal fica vazio e a confirmação guarda a última sequência"""
+    sent = []
+    queue = SubmissionQueue(lambda title, rows: sent.extend(rows), journal_dir=str(tmp_path), flush_interval=0.05)
+    for i in range(3):
+        queue.enqueue('Respostas', [i])
+    try:
+        assert wait_until(lambda: queue.pending_count() == 0)
+    finally:
+        _end_process(queue)
+
+    assert sorted(row[0] for row in sent) == [0, 1, 2]
+    assert os.path.getsize(queue.journal_path) == 0
+    with open(queue.ack_path, encoding='utf-8') as f:
+        assert int(f.read()) == 3
+
+    # Nada a reenviar num novo arranque
+    again = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path))
+    assert again.pending_count() == 0
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_live_journal_is_not_adopted(tmp_path):
+    """O journal de um processo ainda ativo não é lido nem compactado por outro"""
+    owner = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=60)
+    owner.enqueue('Respostas', ["do dono"])
+
+    other = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=60)
+    try:
+        assert other.journal_path != owner.journal_path
+        assert other.pending_count() == 0
+        assert owner.pending_count() == 1
+        assert os.path.getsize(owner.journal_path) > 0
+    finally:
+        _end_process(owner)
+        _end_process(other)
+
+def _enqueue_and_exit(journal_dir):
+    """Processo filho: grava duas linhas e termina sem as enviar"""
+    queue = SubmissionQueue(_failing_flush, journal_dir=journal_dir, flush_interval=60)
+    queue.enqueue('Respostas', ["a"])
+    queue.enqueue('Respostas', ["b"])
+    os._exit(0)
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_journal_of_finished_process_is_adopted(tmp_path):
+    """As linhas de um processo que terminou passam para o journal de outro, com novas sequências"""
+    child = multiprocessing.get_context('fork').Process(target=_enqueue_and_exit, args=(str(tmp_path),))
+    child.start()
+    child.join(10)
+    orphan_journals = [name for name in os.listdir(tmp_path) if name.endswith('.jsonl')]
+    assert len(orphan_journals) == 1
+
+    adopter = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=60)
+    try:
+        adopter.enqueue('Respostas', ["c"])
+        assert [entry['row'] for entry in adopter._pending] == [["a"], ["b"], ["c"]]
+        assert len({entry['seq'] for entry in adopter._pending}) == 3
+        assert not (tmp_path / orphan_journals[0]).exists()
+    finally:
+        _end_process(adopter)
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_legacy_shared_journal_is_adopted(tmp_path):
+    """O journal partilhado do formato antigo é adotado, sem as linhas já confirmadas"""
+    with open(tmp_path / 'submissions.jsonl', 'w', encoding='utf-8') as f:
+        for seq in (1, 2):
+            f.write(json.dumps({'seq': seq, 'worksheet': 'Respostas', 'row': [seq], 'timestamp': 0}) + "\n")
+    (tmp_path / 'submissions.ack').write_text('1')
+
+    queue = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=60)
+    try:
+        assert [entry['row'] for entry in queue._pending] == [[2]]
+        assert not (tmp_path / 'submissions.jsonl').exists()
+    finally:
+        _end_process(queue)
+
+def test_ack_failure_does_not_resend_batch(tmp_path):
+    """Se a confirmação falha depois do envio, é a confirmação que se repete, não o append"""
+    sent = []
+    queue = SubmissionQueue(lambda title, rows: sent.extend(rows), journal_dir=str(tmp_path), flush_interval=0.05)
+    write_ack = queue._write_ack
+    failures = []
+
+    def flaky_write_ack(seq):
+        if not failures:
+            failures.append(seq)
+            raise OSError("disco cheio")
+        write_ack(seq)
+
+    queue._write_ack = flaky_write_ack
+    queue.enqueue('Respostas', ["a"])
+    try:
+        assert wait_until(lambda: queue.get_stats()['acked_seq'] == 1)
+    finally:
+        _end_process(queue)
+
+    assert sent == [["a"]]
+    assert queue.get_stats()['ack_failures'] == 1
+
+def _write_entries(path, rows, claim=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        for seq, row in enumerate(rows, 1):
+            entry = {'seq': seq, 'worksheet': 'Respostas', 'row': row, 'timestamp': 0}
+            if claim:
+                entry['claim'] = claim
+            f.write(json.dumps(entry) + "\n")
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_unmerged_claim_of_finished_process_is_adopted(tmp_path):
+    """Um processo que terminou entre reclamar um journal e integrá-lo não perde as linhas"""
+    _write_entries(tmp_path / 'submissions.99999.claim-abc', [["a"], ["b"]])
+
+    queue = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=60)
+    try:
+        assert [entry['row'] for entry in queue._pending] == [["a"], ["b"]]
+        assert not (tmp_path / 'submissions.99999.claim-abc').exists()
+    finally:
+        _end_process(queue)
+
+@pytest.mark.skipif(not process_locks_available(), reason="requer fcntl")
+def test_merged_claim_is_not_replayed(tmp_path):
+    """Um processo que terminou depois de integrar uma reclamação, sem a apagar, não a duplica"""
+    claim = 'submissions.99999.claim-abc'
+    _write_entries(tmp_path / 'submissions.99999.jsonl', [["a"], ["b"]], claim=claim)
+    _write_entries(tmp_path / claim, [["a"], ["b"]])
+
+    queue = SubmissionQueue(_failing_flush, journal_dir=str(tmp_path), flush_interval=60)
+    try:
+        assert [entry['row'] for entry in queue._pending] == [["a"], ["b"]]
+        assert not [name for name in os.listdir(tmp_path) if '99999' in name]
+    finally:
+        _end_process(queue)
@@ -0,0 +1,126 @@
+import json
+import zlib
+import pickle
+import logging
+from typing import Any, Callable, Dict, Tuple
+
+logger = logging.getLogger('formulario_culsen.cache_serializers')
+
+# Dependências opcionais: os formatos só ficam disponíveis se estiverem instaladas
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Cabeçalho dos arquivos de cache: b"FCACHE1 <formato>/<compressão>\n" + conteúdo.
+# Arquivos sem cabeçalho (começam por '{') são do formato JSON antigo.
+HEADER_MAGIC = b"FCACHE1 "
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data.decode('utf-8'))
+
+def _pickle_dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=5)
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+# Formato -> (serializar, desserializar)
+FORMATS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    'json': (_json_dumps, _json_loads),
+    'pickle': (_pickle_dumps, pickle.loads),
+}
+if msgpack is not None:
+    FORMATS['msgpack'] = (_msgpack_dumps, _msgpack_loads)
+
+# Formato por omissão: nunca pickle, que executaria código de um arquivo
+# adulterado no diretório de cache
+DEFAULT_SPEC = 'msgpack' if msgpack is not None else 'json'
+
+# Compressão -> (comprimir, descomprimir)
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    'none': (lambda data: data, lambda data: data),
+    'zlib': (lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+if zstandard is not None:
+    CODECS['zstd'] = (
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+class CacheSerializer:
+    """
+    Serialização dos arquivos do FileCache num formato e compressão configuráveis.
+
+    O formato usado fica registado no cabeçalho de cada arquivo, pelo que a
+    leitura funciona para qualquer formato disponível (incluindo o JSON antigo,
+    sem cabeçalho) independentemente do formato configurado para escrita —
+    exceto o pickle, que só é lido se também for o formato de escrita
+    configurado. O pickle só deve ser usado num diretório de cache controlado
+    pela aplicação.
+    """
+
+    def __init__(self, spec: str = None):
+        """
+        Inicializa o serializador
+
+        Args:
+            spec: '<formato>[+<compressão>]', ex: 'json', 'pickle+zlib', 'msgpack+zstd'
+                  (por omissão, DEFAULT_SPEC)
+        """
+        spec = spec or DEFAULT_SPEC
+        fmt, _, codec = spec.partition('+')
+        codec = codec or 'none'
+
+        if fmt not in FORMATS or codec not in CODECS:
+            logger.warning(f"Formato de cache '{spec}' indisponível; a usar json")
+            fmt, codec = 'json', 'none'
+
+        self.format = fmt
+        self.codec = codec
+        self.spec = fmt if codec == 'none' else f"{fmt}+{codec}"
+        self._header = HEADER_MAGIC + f"{fmt}/{codec}\n".encode('ascii')
+
+    def dumps(self, value: Any) -> bytes:
+        """Serializa um valor para bytes (cabeçalho incluído)"""
+        return self._header + CODECS[self.codec][0](FORMATS[self.format][0](value))
+
+    def loads(self, data: bytes) -> Any:
+        """
+        Desserializa bytes escritos por qualquer CacheSerializer (ou JSON antigo)
+
+        Raises:
+            ValueError: Se o formato do arquivo for desconhecido, estiver indisponível
+                        ou for pickle sem pickle configurado
+        """
+        if not data.startswith(HEADER_MAGIC):
+            # Arquivo JSON antigo, sem cabeçalho
+            return _json_loads(data)
+
+        end = data.index(b"\n", len(HEADER_MAGIC))
+        fmt, _, codec = data[len(HEADER_MAGIC):end].decode('ascii').partition('/')
+        if fmt not in FORMATS or codec not in CODECS:
+            raise ValueError(f"Formato de cache indisponível: {fmt}/{codec}")
+        if fmt == 'pickle' and self.format != 'pickle':
+            raise ValueError("Arquivo de cache em pickle recusado: o formato configurado não é pickle")
+        return FORMATS[fmt][1](CODECS[codec][1](data[end + 1:]))
+
+def available_specs() -> list:
+    """Lista as combinações formato+compressão disponíveis nesta instalação"""
+    return [fmt if codec == 'none' else f"{fmt}+{codec}" for fmt in FORMATS for codec in CODECS]
+
+# Erros possíveis ao ler um arquivo corrompido ou truncado
+DECODE_ERRORS = (ValueError, KeyError, EOFError, pickle.UnpicklingError, zlib.error)
+if zstandard is not None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
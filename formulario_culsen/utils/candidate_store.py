@@ -0,0 +1,247 @@
+import re
+import time
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+import gspread
+
+from utils.sheet_schema import SheetSchema
+
+logger = logging.getLogger('formulario_culsen.candidate_store')
+
+class CandidateStore:
+    """
+    Armazenamento em memória das linhas da aba de respostas.
+
+    É carregado com uma única leitura em bloco (get_all_values) e indexado por
+    número de linha, email e telefone, para que abrir a ficha de um candidato
+    não precise de nenhum pedido à API quando a lista já foi lida.
+
+    As escritas da aplicação (novas submissões, análises) são aplicadas no lugar
+    (upsert_rows, patch_row) sem reiniciar o TTL; cada alteração incrementa a versão.
+    """
+
+    def __init__(self, ttl: int = 180, aliases: Dict[str, List[str]] = None):
+        """
+        Inicializa o armazenamento
+
+        Args:
+            ttl: Tempo em segundos durante o qual os dados carregados são válidos
+            aliases: Campo lógico -> cabeçalhos possíveis (usa 'email' e 'telefone' para os índices)
+        """
+        self.ttl = ttl
+        self.aliases = aliases or {}
+        self._lock = threading.Lock()
+        self._schema = SheetSchema([], self.aliases)
+        self._rows = {}
+        self._by_email = {}
+        self._by_phone = {}
+        self._loaded_at = None
+        self._version = 0
+        self._stats = {
+            'loads': 0,
+            'hits': 0,
+            'misses': 0,
+            'patches': 0,
+        }
+
+    @staticmethod
+    def normalize_email(email: Any) -> str:
+        """Normaliza um email para pesquisa (minúsculas, sem espaços)"""
+        return str(email or '').strip().lower()
+
+    @staticmethod
+    def normalize_phone(phone: Any) -> str:
+        """Normaliza um telefone para pesquisa (apenas dígitos, sem indicativo 351)"""
+        digits = re.sub(r'\D', '', str(phone or ''))
+        if len(digits) > 9 and digits.startswith('351'):
+            digits = digits[3:]
+        return digits
+
+    def _index_row(self, row_index: int, row: list, schema: SheetSchema, by_email: dict, by_phone: dict):
+        """Acrescenta a linha aos índices de email e telefone"""
+        email = self.normalize_email(schema.value(row, 'email'))
+        if email:
+            by_email.setdefault(email, []).append(row_index)
+
+        phone = self.normalize_phone(schema.value(row, 'telefone'))
+        if phone:
+            by_phone.setdefault(phone, []).append(row_index)
+
+    def _unindex_row(self, row_index: int, row: list):
+        """Retira a linha dos índices de email e telefone (chamar com lock)"""
+        for index, key in ((self._by_email, self.normalize_email(self._schema.value(row, 'email'))),
+                           (self._by_phone, self.normalize_phone(self._schema.value(row, 'telefone')))):
+            rows = index.get(key)
+            if rows and row_index in rows:
+                rows.remove(row_index)
+                if not rows:
+                    del index[key]
+
+    @staticmethod
+    def to_record(headers: List[str], row_index: int, row: list) -> Dict[str, Any]:
+        """Converte uma linha num registo como os de get_all_records(), com a chave 'index'"""
+        row = list(row) + [''] * (len(headers) - len(row))
+        record = dict(zip(headers, gspread.utils.numericise_all(row)))
+        record['index'] = row_index
+        return record
+
+    def load(self, values: List[list]):
+        """
+        Substitui o conteúdo a partir de todos os valores da aba (cabeçalho incluído)
+
+        Args:
+            values: Resultado de get_all_values(); a posição i corresponde à linha i + 1
+        """
+        schema = SheetSchema(values[0] if values else [], self.aliases)
+        rows = {}
+        by_email = {}
+        by_phone = {}
+
+        for row_index, row in enumerate(values[1:], start=2):
+            rows[row_index] = list(row)
+            self._index_row(row_index, row, schema, by_email, by_phone)
+
+        with self._lock:
+            self._schema = schema
+            self._rows = rows
+            self._by_email = by_email
+            self._by_phone = by_phone
+            self._loaded_at = time.time()
+            self._version += 1
+            self._stats['loads'] += 1
+
+        logger.info(f"Armazenamento de candidatos carregado: {len(rows)} linhas")
+
+    def is_warm(self) -> bool:
+        """Indica se há dados carregados e ainda dentro do TTL"""
+        with self._lock:
+            return self._loaded_at is not None and (time.time() - self._loaded_at) <= self.ttl
+
+    @property
+    def version(self) -> int:
+        """Versão dos dados, incrementada a cada carga ou alteração"""
+        with self._lock:
+            return self._version
+
+    def upsert_rows(self, rows: Dict[int, list]) -> bool:
+        """
+        Acrescenta ou substitui linhas inteiras (ex: linhas acabadas de enviar para a planilha)
+
+        Args:
+            rows: Número da linha -> valores da linha, pela ordem do cabeçalho
+
+        Returns:
+            True se as linhas foram aplicadas, False se o armazenamento não estiver carregado
+        """
+        if not self.is_warm():
+            return False
+
+        with self._lock:
+            # Cópia do dicionário: records() pode estar a percorrer a versão anterior
+            new_rows = dict(self._rows)
+            for row_index, row in rows.items():
+                previous = new_rows.get(row_index)
+                if previous is not None:
+                    self._unindex_row(row_index, previous)
+                new_rows[row_index] = list(row)
+                self._index_row(row_index, row, self._schema, self._by_email, self._by_phone)
+            self._rows = new_rows
+            self._version += 1
+            self._stats['patches'] += 1
+        return True
+
+    def patch_row(self, row_index: int, updates: Dict[str, Any]) -> bool:
+        """
+        Altera células de uma linha existente, por cabeçalho
+
+        Args:
+            row_index: Número da linha na planilha
+            updates: Cabeçalho -> novo valor
+
+        Returns:
+            True se a linha foi alterada; False se o armazenamento não estiver carregado,
+            a linha não existir ou algum cabeçalho for desconhecido
+        """
+        if not self.is_warm():
+            return False
+
+        with self._lock:
+            row = self._rows.get(row_index)
+            headers = self._schema.headers
+            if row is None or any(header not in headers for header in updates):
+                return False
+
+            row = row + [''] * (len(headers) - len(row))
+            for header, value in updates.items():
+                row[headers.index(header)] = '' if value is None else str(value)
+
+        return self.upsert_rows({row_index: row})
+
+    @property
+    def schema(self) -> SheetSchema:
+        """Esquema (cabeçalhos) da última carga"""
+        with self._lock:
+            return self._schema
+
+    def invalidate(self):
+        """Descarta os dados carregados (a próxima leitura volta a carregar a aba)"""
+        with self._lock:
+            self._loaded_at = None
+        logger.info("Armazenamento de candidatos invalidado")
+
+    def get_row(self, row_index: int) -> Optional[Dict[str, str]]:
+        """
+        Obtém uma linha como dicionário cabeçalho -> valor (texto, como row_values)
+
+        Args:
+            row_index: Número da linha na planilha (a linha 1 é o cabeçalho)
+
+        Returns:
+            Dicionário da linha ({} se a linha não existir), ou None se o armazenamento não estiver carregado
+        """
+        if not self.is_warm():
+            self._stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self._stats['hits'] += 1
+            values = self._rows.get(row_index)
+            if not values:
+                return {}
+            headers = self._schema.headers
+            return {h: (values[i] if i < len(values) else '') for i, h in enumerate(headers)}
+
+    def find_by_email(self, email: str) -> List[int]:
+        """Retorna os números de linha dos candidatos com este email"""
+        with self._lock:
+            return list(self._by_email.get(self.normalize_email(email), []))
+
+    def find_by_phone(self, phone: str) -> List[int]:
+        """Retorna os números de linha dos candidatos com este telefone"""
+        with self._lock:
+            return list(self._by_phone.get(self.normalize_phone(phone), []))
+
+    def records(self) -> List[Dict[str, Any]]:
+        """
+        Obtém todos os candidatos como get_all_records(), com a chave 'index' da linha
+
+        Returns:
+            Lista de dicionários, um por linha de dados
+        """
+        with self._lock:
+            headers = self._schema.headers
+            rows = self._rows
+
+        return [self.to_record(headers, row_index, rows[row_index]) for row_index in sorted(rows)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do armazenamento"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rows'] = len(self._rows)
+            stats['loaded_at'] = self._loaded_at
+            stats['version'] = self._version
+        stats['warm'] = self.is_warm()
+        return stats
@@ -8,6 +8,7 @@ import traceback
 import io
 import re
 from utils.credentials_helper import get_credentials
+from utils.rate_limiter import google_api_limiter, PRIORITY_WRITE
 
 # Importar a função get_config da utils.sheets
 from utils.sheets import get_config
@@ -52,7 +53,7 @@ def get_or_create_folder(service, folder_name):
         # Procurar pasta por nome
         query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
         logger.info(f"Query de busca: {query}")
-        response = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+        response = google_api_limiter.call('drive', service.files().list(q=query, spaces='drive', fields='files(id, name)').execute, idempotent=True)
         folders = response.get('files', [])
         
         # Se a pasta existir, retorna o ID
@@ -67,7 +68,7 @@ def get_or_create_folder(service, folder_name):
             'name': folder_name,
             'mimeType': 'application/vnd.google-apps.folder'
         }
-        folder = service.files().create(body=folder_metadata, fields='id').execute()
+        folder = google_api_limiter.call('drive', service.files().create(body=folder_metadata, fields='id').execute)
         folder_id = folder['id']
         logger.info(f"Nova pasta criada com sucesso. ID: {folder_id}")
         return folder_id
@@ -81,6 +82,12 @@ def upload_file_to_drive(file_path, original_filename):
     Upload a file to Google Drive
     Returns the sharable link of the uploaded file
     """
+    # O upload faz parte da submissão do candidato: prioridade de escrita na quota
+    with google_api_limiter.priority(PRIORITY_WRITE):
+        return _upload_file_to_drive(file_path, original_filename)
+
+def _upload_file_to_drive(file_path, original_filename):
+    """Faz o upload do ficheiro (ver upload_file_to_drive)"""
     try:
         logger.info(f"Iniciando upload de arquivo para o Google Drive: {file_path}")
         service = get_drive_client()
@@ -117,11 +124,11 @@ def upload_file_to_drive(file_path, original_filename):
         )
         
         logger.info("Enviando arquivo para o Google Drive...")
-        file = service.files().create(
+        file = google_api_limiter.call('drive', service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id,webViewLink'
-        ).execute()
+        ).execute)
         
         file_id = file.get('id')
         logger.info(f"Arquivo enviado com sucesso. ID: {file_id}")
@@ -134,10 +141,10 @@ def upload_file_to_drive(file_path, original_filename):
             'allowFileDiscovery': False
         }
         
-        service.permissions().create(
+        google_api_limiter.call('drive', service.permissions().create(
             fileId=file_id,
             body=permission
-        ).execute()
+        ).execute)
         logger.info("Permissões configuradas com sucesso")
         
         # Return the sharable link
@@ -185,7 +192,7 @@ def download_cv_for_processing(file_url, output_filename):
             downloader = MediaIoBaseDownload(f, request)
             done = False
             while not done:
-                status, done = downloader.next_chunk()
+                status, done = google_api_limiter.call('drive', downloader.next_chunk, idempotent=True)
                 logger.info(f"Download {int(status.progress() * 100)}% concluído")
         
         logger.info(f"Download concluído: {output_path}")
@@ -224,7 +231,7 @@ def download_file_from_drive(file_id, destination_path):
             downloader = MediaIoBaseDownload(f, request)
             done = False
             while not done:
-                status, done = downloader.next_chunk()
+                status, done = google_api_limiter.call('drive', downloader.next_chunk, idempotent=True)
                 logger.info(f"Download {int(status.progress() * 100)}% concluído")
         
         logger.info(f"Download concluído: {destination_path}")
@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import select
+import threading
+import subprocess
+import logging
+from typing import Any, Callable, Dict, List
+
+from utils.pdf_worker import extract_pdf_pages, resolve_backend, read_message, write_message, DEFAULT_BACKEND
+
+logger = logging.getLogger('formulario_culsen.extraction_service')
+
+# Raiz do projeto: os processos de extração importam utils.pdf_worker a partir daqui
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ExtractionTimeout(Exception):
+    """A extração de um documento excedeu o tempo máximo"""
+
+class WorkerDied(Exception):
+    """O processo de extração terminou a meio de um pedido"""
+
+class ExtractionWorker:
+    """
+    Um processo de extração: um interpretador Python novo que só importa
+    utils.pdf_worker e responde a pedidos pelo stdin/stdout (ver pdf_worker.serve).
+    """
+
+    def __init__(self, memory_limit_mb: int, generation: int):
+        """
+        Inicia o processo
+
+        Args:
+            memory_limit_mb: Memória adicional permitida ao processo, em MB (0 = sem limite)
+            generation: Geração do serviço em que o processo foi criado
+        """
+        self.generation = generation
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', f"from utils.pdf_worker import serve; serve({int(memory_limit_mb)})"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=PROJECT_DIR
+        )
+
+    def call(self, function: Callable[..., Any], args: tuple, timeout: float) -> Any:
+        """
+        Executa uma função de nível de módulo no processo
+
+        Raises:
+            ExtractionTimeout: Se não houver resposta dentro do timeout
+            WorkerDied: Se o processo terminar antes de responder
+        """
+        try:
+            write_message(self.process.stdin, (function.__module__, function.__name__, args))
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerDied(str(e))
+
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise ExtractionTimeout()
+
+        response = read_message(self.process.stdout)
+        if response is None:
+            raise WorkerDied(f"código de saída {self.process.wait()}")
+
+        ok, value = response
+        if not ok:
+            raise value
+        return value
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self, kill: bool = False):
+        """Termina o processo: fecha o stdin (fim normal) ou, com kill, termina-o já"""
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=5)
+            except Exception:
+                pass
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+class ExtractionService:
+    """
+    Extração de texto de documentos em processos separados.
+
+    A extração de PDF é trabalho de CPU em Python puro: numa thread do Flask
+    retém o GIL e atrasa todos os outros pedidos do processo. Aqui corre em
+    processos separados, com um tempo máximo por documento e um limite de
+    memória por processo. Só se submetem tantos documentos quantos os
+    processos, pelo que o tempo máximo conta apenas a execução e não a espera
+    por um processo livre.
+
+    Cada processo é um interpretador novo (sem fork de um processo com
+    threads, e sem voltar a importar app.py) e serve um documento de cada
+    vez: um documento que exceda o tempo ou a memória só faz terminar o seu
+    processo, que é substituído no pedido seguinte. Fora de POSIX, ou com
+    workers=0, a extração é feita na thread que a pede.
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 60.0, memory_limit_mb: int = 512,
+                 backend: str = DEFAULT_BACKEND):
+        """
+        Inicializa o serviço (os processos só são criados na primeira extração)
+
+        Args:
+            workers: Número de processos de extração (0 = extrair na thread que pede)
+            timeout: Tempo máximo por documento, em segundos
+            memory_limit_mb: Memória adicional permitida a cada processo, em MB (0 = sem limite)
+            backend: Backend de extração de PDF (ver utils.pdf_worker.available_backends)
+        """
+        self.backend = resolve_backend(backend)
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        # select() sobre pipes só existe em POSIX
+        self.workers = workers if os.name == 'posix' else 0
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1))
+        self._idle = []
+        self._generation = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'worker_restarts': 0,
+            'inline': 0,
+        }
+
+        if workers and not self.workers:
+            logger.warning("Processos de extração indisponíveis neste sistema: extração na thread do pedido")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _take_worker(self) -> ExtractionWorker:
+        """Obtém um processo livre, criando um novo se não houver (chamar com um slot)"""
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+                worker.close()
+            generation = self._generation
+        return ExtractionWorker(self.memory_limit_mb, generation)
+
+    def _return_worker(self, worker: ExtractionWorker):
+        """Devolve um processo à lista de livres (ou termina-o, se o serviço foi terminado entretanto)"""
+        with self._lock:
+            if worker.generation == self._generation:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def _discard_worker(self, worker: ExtractionWorker):
+        """Termina um processo preso ou morto; o próximo pedido cria outro"""
+        worker.close(kill=True)
+        self._count('worker_restarts')
+        logger.warning("Processo de extração reiniciado")
+
+    def run(self, function: Callable[..., Any], file_path: str, *args) -> Any:
+        """
+        Executa uma função de extração (de nível de módulo) num processo de extração
+
+        Args:
+            function: Função importável que recebe o caminho do arquivo
+            file_path: Caminho do arquivo
+            *args: Argumentos adicionais da função
+
+        Returns:
+            Resultado da função
+
+        Raises:
+            ExtractionTimeout: Se a extração exceder o tempo máximo
+            Exception: Erros da extração (MemoryError se exceder o limite de memória)
+        """
+        self._count('submitted')
+        if not self.workers:
+            self._count('inline')
+            result = function(file_path, *args)
+            self._count('completed')
+            return result
+
+        # Esperar por um processo livre antes de submeter: o tempo máximo só conta a execução
+        with self._slots:
+            worker = self._take_worker()
+            start = time.perf_counter()
+            try:
+                result = worker.call(function, (file_path,) + args, self.timeout)
+            except ExtractionTimeout:
+                self._count('timeouts')
+                self._discard_worker(worker)
+                raise ExtractionTimeout(f"Extração excedeu {self.timeout:g}s: {os.path.basename(file_path)}")
+            except WorkerDied:
+                # O processo morreu durante este documento (ex: limite de memória)
+                self._count('errors')
+                self._discard_worker(worker)
+                raise MemoryError(f"Processo de extração terminou ao processar {os.path.basename(file_path)}")
+            except Exception:
+                self._count('errors')
+                self._return_worker(worker)
+                raise
+
+        self._return_worker(worker)
+        self._count('completed')
+        logger.info(f"Extração de {os.path.basename(file_path)} em {(time.perf_counter() - start) * 1000:.0f} ms (processo)")
+        return result
+
+    def extract_pdf_pages(self, pdf_path: str) -> List[str]:
+        """Extrai o texto de cada página de um PDF num processo de extração, com o backend configurado"""
+        return self.run(extract_pdf_pages, pdf_path, self.backend)
+
+    def shutdown(self):
+        """Termina os processos livres; os ocupados terminam quando acabarem o documento atual"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._generation += 1
+        for worker in idle:
+            worker.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do serviço"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle_workers'] = len(self._idle)
+        stats['backend'] = self.backend
+        stats['workers'] = self.workers
+        stats['timeout'] = self.timeout
+        stats['memory_limit_mb'] = self.memory_limit_mb
+        return stats
+
+# Instância global do serviço de extração
+extraction_service = ExtractionService(
+    workers=int(os.environ.get('PDF_EXTRACTION_WORKERS', '2')),
+    timeout=float(os.environ.get('PDF_EXTRACTION_TIMEOUT', '60')),
+    memory_limit_mb=int(os.environ.get('PDF_EXTRACTION_MAX_MB', '512')),
+    backend=os.environ.get('PDF_EXTRACTION_BACKEND', DEFAULT_BACKEND)
+)
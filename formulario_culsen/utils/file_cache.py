@@ -1,160 +1,970 @@
 import os
 import json
+import zlib
+import pickle
 import time
+import queue
 import threading
 import logging
 import hashlib
-from typing import Any, Optional, Dict, Callable
+import contextlib
+from collections import OrderedDict
+from typing import Any, Optional, Dict, Callable, Tuple
 from datetime import datetime, timedelta
 
+from utils.cache_serializers import CacheSerializer, DECODE_ERRORS
+from utils.process_lock import ProcessFileLock, process_locks_available
+
 logger = logging.getLogger('formulario_culsen.file_cache')
 
+# Extensão dos arquivos de cache; '.json' são arquivos do formato antigo
+CACHE_FILE_EXTENSION = '.cache'
+CACHE_FILE_EXTENSIONS = (CACHE_FILE_EXTENSION, '.json')
+
+# Índice das entradas em disco (chave -> arquivo, timestamp, ttl, tamanho, tags):
+# um snapshot e um log, só de acréscimos, com as entradas alteradas desde então
+MANIFEST_FILENAME = '_manifest.idx'
+MANIFEST_LOG_FILENAME = '_manifest.log'
+
+# Alterações no log a partir das quais o manifest é compactado numa escrita
+# (também é compactado pela manutenção periódica)
+MANIFEST_LOG_MIN_ENTRIES = 1000
+
+# Espaços de nomes do cache: TTL fixo, tags para invalidação e, opcionalmente,
+# política stale-while-revalidate ('stale' segundos servidos após expirar;
+# atualização antecipada a partir de 'refresh_ahead' x TTL). Uma chave pertence
+# ao espaço de nomes igual a ela ou ao seu prefixo ('candidates_all' -> 'candidates').
+DEFAULT_NAMESPACES = {
+    'config': {'ttl': 1800, 'tags': ['config'], 'stale': 86400, 'refresh_ahead': 0.8},
+    'candidates': {'ttl': 300, 'tags': ['candidates'], 'stale': 300, 'refresh_ahead': 0.8},
+    'candidate': {'ttl': 300, 'tags': ['candidates']},
+    'questions': {'ttl': 600, 'tags': ['questions'], 'stale': 86400, 'refresh_ahead': 0.8},
+    'forms': {'ttl': 900, 'tags': ['forms'], 'stale': 86400, 'refresh_ahead': 0.8},
+    'prompt': {'ttl': 600, 'tags': ['prompt']},
+    'api_status': {'ttl': 120, 'tags': ['api_status']},
+    # Texto extraído de CVs, endereçado pelo SHA-256 do arquivo (nunca fica desatualizado)
+    'cv_text': {'ttl': 30 * 86400, 'tags': ['cv_text']},
+    # Resultados de análises de IA, pelas entradas da análise (ver utils.ia.analysis_cache_key)
+    'analysis': {'ttl': 30 * 86400, 'tags': ['analysis']},
+}
+
+class SingleFlight:
+    """
+    Coalescência de pedidos concorrentes por chave (single-flight).
+
+    Quando várias threads falham o cache da mesma chave ao mesmo tempo, só a
+    primeira executa a busca; as restantes esperam e recebem o mesmo resultado
+    (ou a mesma exceção).
+    """
+    
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+            self.waiters = 0
+    
+    def __init__(self, wait_timeout: float = 60.0):
+        """
+        Args:
+            wait_timeout: Tempo máximo de espera pelo resultado de outra thread;
+                          após esse tempo a thread faz a busca ela própria
+        """
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {
+            'leaders': 0,
+            'coalesced_waiters': 0,
+            'wait_timeouts': 0,
+        }
+    
+    def do(self, key: str, fetch_function: Callable) -> Any:
+        """
+        Executa fetch_function uma única vez por chave entre chamadas concorrentes
+        
+        Args:
+            key: Chave do pedido
+            fetch_function: Função que obtém os dados
+        
+        Returns:
+            Resultado da função (partilhado com as threads em espera)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._Call()
+                self._calls[key] = call
+                self._stats['leaders'] += 1
+            else:
+                call.waiters += 1
+                self._stats['coalesced_waiters'] += 1
+        
+        if not leader:
+            logger.info(f"Aguardando busca em curso para: {key}")
+            if not call.event.wait(self.wait_timeout):
+                with self._lock:
+                    self._stats['wait_timeouts'] += 1
+                logger.warning(f"Tempo de espera excedido para: {key}. Buscando diretamente.")
+                return fetch_function()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fetch_function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna contadores e as chaves com busca em curso (com o número de threads à espera)"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = {key: call.waiters for key, call in self._calls.items()}
+        return stats
+
 class FileCache:
     """
-    Sistema de cache em arquivo para otimizar carregamento de dados
+    Sistema de cache em dois níveis para otimizar carregamento de dados
+    
+    L1: objetos já desserializados em memória (LRU limitado a l1_max_entries).
+    L2: arquivos em disco, que sobrevivem a reinícios do processo, indexados
+    por um manifest com os metadados de cada entrada; estatísticas, limpeza e
+    invalidação por padrão consultam só o manifest, sem abrir os arquivos.
+    Cada escrita acrescenta ao log do manifest só as entradas que alterou; o
+    snapshot completo é regravado apenas na compactação.
+    Leituras quentes são servidas pelo L1 sem tocar no sistema de arquivos;
+    escritas e invalidações atualizam os dois níveis. Os valores do L1 são
+    partilhados entre chamadas e devem ser tratados como só de leitura.
+    
+    Concorrência: escritas e invalidações de uma chave serializam-se num lock
+    por faixa (lock striping), pelo que chaves independentes não competem; os
+    arquivos são gravados num temporário e renomeados atomicamente, e lidos
+    sem lock. O lock global protege apenas o L1 e o manifest (secções curtas).
+    
+    Modo partilhado (vários workers do gunicorn no mesmo diretório): os locks
+    por faixa e o do manifest passam a ser também locks de arquivo (fcntl), o
+    manifest é relido quando outro processo o altera (descartando do L1 as
+    entradas que mudaram) e cada busca é coalescida entre processos, pelo que
+    N workers fazem uma única leitura à planilha por chave e por TTL.
+    
+    Orçamento: o disco está limitado a max_bytes e max_entries; quando uma
+    escrita ou a thread de manutenção (janitor) encontra o limite excedido,
+    são removidas as entradas menos usadas (LRU) ou menos frequentes (LFU),
+    segundo os tempos e contagens de acesso registados no manifest.
     """
     
-    def __init__(self, cache_dir: str = None, default_ttl: int = 300):
+    def __init__(self, cache_dir: str = None, default_ttl: int = 300, l1_max_entries: int = 256,
+                 serializer: str = None, lock_stripes: int = 16, shared: bool = None,
+                 sync_interval: float = 0.5, max_bytes: int = None, max_entries: int = None,
+                 eviction: str = None):
         """
         Inicializa o sistema de cache
         
         Args:
-            cache_dir: Diretório para armazenar arquivos de cache
+            cache_dir: Diretório para armazenar arquivos de cache (por omissão, variável
+                       FILE_CACHE_DIR ou 'cache' na raiz do projeto)
             default_ttl: TTL padrão em segundos (5 minutos)
+            l1_max_entries: Número máximo de entradas mantidas em memória
+            serializer: Formato dos arquivos, ex: 'pickle+zlib', 'msgpack+zstd', 'json'
+                        (por omissão, variável FILE_CACHE_FORMAT ou msgpack/json; arquivos
+                        em pickle só são lidos com pickle configurado)
+            lock_stripes: Número de locks por chave (escritas de chaves na mesma faixa serializam-se)
+            shared: Sincronizar com outros processos (por omissão, variável FILE_CACHE_SHARED ou
+                    ativo; requer fcntl, indisponível no Windows)
+            sync_interval: Intervalo mínimo, em segundos, entre verificações do manifest em disco
+            max_bytes: Tamanho máximo dos arquivos em disco (por omissão, FILE_CACHE_MAX_MB ou 256 MB)
+            max_entries: Número máximo de entradas em disco (por omissão, FILE_CACHE_MAX_ENTRIES ou 2000)
+            eviction: Política de remoção ao exceder o orçamento: 'lru' ou 'lfu'
+                      (por omissão, FILE_CACHE_EVICTION ou 'lru')
         """
         if cache_dir is None:
             # Usar diretório cache na raiz do projeto
             current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            cache_dir = os.path.join(current_dir, 'cache')
+            cache_dir = os.environ.get('FILE_CACHE_DIR') or os.path.join(current_dir, 'cache')
         
         self.cache_dir = cache_dir
         self.default_ttl = default_ttl
+        self.l1_max_entries = l1_max_entries
+        self.serializer = CacheSerializer(serializer or os.environ.get('FILE_CACHE_FORMAT'))
+        if shared is None:
+            shared = os.environ.get('FILE_CACHE_SHARED', '1') != '0'
+        self.shared = shared and process_locks_available()
+        self.sync_interval = sync_interval
+        self.max_bytes = max_bytes or int(float(os.environ.get('FILE_CACHE_MAX_MB', 256)) * 1024 * 1024)
+        self.max_entries = max_entries or int(os.environ.get('FILE_CACHE_MAX_ENTRIES', 2000))
+        self.eviction = (eviction or os.environ.get('FILE_CACHE_EVICTION', 'lru')).lower()
+        if self.eviction not in ('lru', 'lfu'):
+            logger.warning(f"Política de remoção '{self.eviction}' desconhecida; a usar lru")
+            self.eviction = 'lru'
+        
+        # Criar diretórios de cache e de locks se não existirem
+        self.lock_dir = os.path.join(self.cache_dir, '.locks')
+        os.makedirs(self.lock_dir, exist_ok=True)
+        
         self._lock = threading.Lock()
+        self._stripes = [
+            ProcessFileLock(os.path.join(self.lock_dir, f"stripe_{i}.lock"), self.shared)
+            for i in range(lock_stripes)
+        ]
+        self._manifest_lock = ProcessFileLock(os.path.join(self.lock_dir, 'manifest.lock'), self.shared)
+        self._manifest_sig = None
+        self._manifest_checked_at = 0.0
+        # Log do manifest: (inode, posição já lida), alterações que contém e
+        # chaves alteradas na transação atual, ainda por registar
+        self._log_state = (None, 0)
+        self._log_entries = 0
+        self._manifest_changes = set()
+        self._shared_stats = {
+            'manifest_reloads': 0,
+            'manifest_log_reads': 0,
+            'remote_invalidations': 0,
+            'cross_process_coalesced': 0,
+            'patches': 0,
+        }
         
-        # TTLs específicos para diferentes tipos de dados
-        self.ttl_config = {
-            'config': 1800,      # 30 minutos para configurações
-            'candidates': 300,   # 5 minutos para candidatos
-            'questions': 600,    # 10 minutos para perguntas
-            'forms': 900,        # 15 minutos para formulários
-            'api_status': 120,   # 2 minutos para status de APIs
+        # Acessos ainda não registados no manifest: chave -> [último acesso, contagem]
+        self._access = {}
+        self._janitor = None
+        self._janitor_stop = threading.Event()
+        self._maintenance_stats = {
+            'runs': 0,
+            'expired': 0,
+            'evicted': 0,
         }
         
-        # Criar diretório de cache se não existir
-        os.makedirs(self.cache_dir, exist_ok=True)
+        # L1: chave -> (valor, timestamp, versão), por ordem de uso
+        self._l1 = OrderedDict()
+        self._l1_stats = {
+            'l1_hits': 0,
+            'l2_hits': 0,
+            'misses': 0,
+            'l1_evictions': 0,
+        }
+        
+        # Espaços de nomes declarados e resolução chave -> espaço de nomes (memorizada)
+        self.namespaces = {name: dict(config, tags=list(config.get('tags', []))) for name, config in DEFAULT_NAMESPACES.items()}
+        self._key_namespaces = {}
+        
+        self.manifest_path = os.path.join(self.cache_dir, MANIFEST_FILENAME)
+        self.manifest_log_path = os.path.join(self.cache_dir, MANIFEST_LOG_FILENAME)
+        self._manifest = self._load_manifest()
         
-        logger.info(f"FileCache inicializado em: {self.cache_dir}")
+        logger.info(f"FileCache inicializado em: {self.cache_dir} (formato: {self.serializer.spec}, partilhado: {self.shared})")
     
     def _get_cache_file_path(self, key: str) -> str:
         """Gera o caminho do arquivo de cache para uma chave"""
         # Criar hash da chave para evitar problemas com caracteres especiais
         key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
-        return os.path.join(self.cache_dir, f"{key_hash}.json")
+        return os.path.join(self.cache_dir, f"{key_hash}{CACHE_FILE_EXTENSION}")
+    
+    def _read_file(self, cache_file: str) -> Dict[str, Any]:
+        """Lê um arquivo de cache em qualquer formato suportado"""
+        with open(cache_file, 'rb') as f:
+            return self.serializer.loads(f.read())
+    
+    def _write_file(self, cache_file: str, cache_data: Dict[str, Any]) -> int:
+        """
+        Grava um arquivo de cache no formato configurado, de forma atómica
+        
+        O conteúdo vai para um temporário que depois substitui o arquivo com
+        os.replace, pelo que um leitor vê sempre a versão antiga ou a nova completa.
+        
+        Returns:
+            Tamanho em bytes
+        """
+        data = self.serializer.dumps(cache_data)
+        tmp_path = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return len(data)
+    
+    def _stripe(self, key: str) -> ProcessFileLock:
+        """Lock da faixa a que a chave pertence"""
+        # crc32 e não hash(): a faixa tem de ser igual em todos os processos
+        return self._stripes[zlib.crc32(key.encode('utf-8')) % len(self._stripes)]
+    
+    def fetch_lock(self, key: str) -> ProcessFileLock:
+        """Lock para buscar os dados de uma chave (coalescência entre processos)"""
+        key_hash = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return ProcessFileLock(os.path.join(self.lock_dir, f"fetch_{key_hash}.lock"), self.shared)
+    
+    # ----- Manifest -----
+    
+    def _read_manifest(self) -> Tuple[Dict[str, Dict[str, Any]], Tuple[int, int, int]]:
+        """
+        Lê o snapshot do manifest e aplica-lhe o log (atualiza o estado do log lido)
+        
+        Returns:
+            Manifest e assinatura do snapshot lido (inode, mtime, tamanho)
+        """
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            stat = os.fstat(f.fileno())
+            manifest = json.load(f)
+        
+        changes, log_inode, offset = self._read_log()
+        for key, meta in changes:
+            self._apply_change(manifest, key, meta)
+        self._log_state = (log_inode, offset)
+        self._log_entries = len(changes)
+        return manifest, (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _read_log(self, offset: int = 0) -> Tuple[list, Optional[int], int]:
+        """
+        Lê as alterações do log do manifest a partir de uma posição
+        
+        Returns:
+            Lista de (chave, metadados ou None se removida), inode do log e posição seguinte
+        """
+        try:
+            with open(self.manifest_log_path, 'rb') as f:
+                log_inode = os.fstat(f.fileno()).st_ino
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], None, 0
+        
+        # Uma última linha sem '\n' ainda está a ser escrita: fica para a próxima leitura
+        end = data.rfind(b'\n') + 1
+        changes = []
+        for line in data[:end].splitlines():
+            try:
+                key, meta = json.loads(line)
+            except (ValueError, TypeError):
+                # Linha truncada (ex: processo terminado a meio da escrita)
+                logger.warning("Linha inválida no log do manifest do cache ignorada")
+                continue
+            changes.append((key, meta))
+        return changes, log_inode, offset + end
+    
+    @staticmethod
+    def _apply_change(manifest: Dict[str, Dict[str, Any]], key: str, meta: Optional[Dict[str, Any]]):
+        if meta is None:
+            manifest.pop(key, None)
+        else:
+            manifest[key] = meta
+    
+    def _manifest_signature(self) -> Optional[Tuple[int, int, int]]:
+        """Assinatura do manifest atual em disco (muda a cada os.replace)"""
+        try:
+            stat = os.stat(self.manifest_path)
+            return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Carrega o manifest; se não existir ou estiver corrompido, reconstrói-o a partir dos arquivos"""
+        with self._manifest_lock:
+            try:
+                manifest, self._manifest_sig = self._read_manifest()
+                return manifest
+            except FileNotFoundError:
+                pass
+            except (ValueError, OSError) as e:
+                logger.warning(f"Manifest do cache inválido, a reconstruir: {str(e)}")
+            
+            manifest = self._rebuild_manifest()
+            self._compact_manifest(manifest)
+            return manifest
+    
+    def _sync_manifest(self, force: bool = False):
+        """
+        Recarrega o manifest se outro processo o alterou (chamar com lock)
+        
+        É assim que escritas e invalidações de outros workers chegam a este
+        processo: as entradas do L1 que mudaram ou desapareceram são descartadas.
+        Enquanto o snapshot não for compactado, só é lido o que foi acrescentado
+        ao log desde a última leitura. Sem force, o disco é consultado no máximo
+        a cada sync_interval segundos.
+        """
+        if not self.shared:
+            return
+        now = time.monotonic()
+        if not force and now - self._manifest_checked_at < self.sync_interval:
+            return
+        self._manifest_checked_at = now
+        
+        if self._manifest_signature() == self._manifest_sig:
+            log_inode, offset = self._log_state
+            try:
+                stat = os.stat(self.manifest_log_path)
+            except FileNotFoundError:
+                stat = None
+            if stat is None and log_inode is None:
+                return
+            if stat is not None and stat.st_ino == log_inode and stat.st_size >= offset:
+                if stat.st_size == offset:
+                    return
+                changes, read_inode, offset = self._read_log(offset)
+                if read_inode == log_inode:
+                    for key, meta in changes:
+                        self._apply_change(self._manifest, key, meta)
+                    self._log_state = (log_inode, offset)
+                    self._log_entries += len(changes)
+                    self._drop_changed_l1({key for key, _ in changes})
+                    self._shared_stats['manifest_log_reads'] += 1
+                    return
+            # Log compactado entretanto: reler tudo
+        
+        try:
+            manifest, signature = self._read_manifest()
+        except FileNotFoundError:
+            manifest, signature = {}, None
+        except (ValueError, OSError) as e:
+            logger.warning(f"Erro ao reler manifest do cache: {str(e)}")
+            return
+        
+        self._manifest = manifest
+        self._manifest_sig = signature
+        self._drop_changed_l1(list(self._l1))
+        self._shared_stats['manifest_reloads'] += 1
+    
+    def _drop_changed_l1(self, keys):
+        """Descarta do L1 as chaves cuja versão no manifest mudou ou desapareceu (chamar com lock)"""
+        for key in keys:
+            entry = self._l1.get(key)
+            if entry is None:
+                continue
+            meta = self._manifest.get(key)
+            if meta is None or meta['timestamp'] != entry[1] or meta.get('version', 0) != entry[2]:
+                del self._l1[key]
+                self._shared_stats['remote_invalidations'] += 1
+    
+    @contextlib.contextmanager
+    def _manifest_transaction(self):
+        """Secção que altera o manifest, exclusiva entre threads e processos, sobre a versão atual em disco"""
+        with self._lock, self._manifest_lock:
+            self._sync_manifest(force=True)
+            yield
+    
+    def _rebuild_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Lê uma única vez todos os arquivos existentes para reconstruir o manifest"""
+        manifest = {}
+        try:
+            filenames = os.listdir(self.cache_dir)
+        except OSError:
+            return manifest
+        
+        for filename in filenames:
+            if not filename.endswith(CACHE_FILE_EXTENSIONS):
+                continue
+            cache_file = os.path.join(self.cache_dir, filename)
+            try:
+                cache_data = self._read_file(cache_file)
+                key = cache_data.get('key', '')
+                manifest[key] = {
+                    'file': filename,
+                    'timestamp': cache_data.get('timestamp', 0),
+                    'ttl': self._get_ttl_for_key(key),
+                    'size': os.path.getsize(cache_file),
+                    'tags': self._get_tags_for_key(key),
+                    'version': cache_data.get('version', 0),
+                }
+            except (*DECODE_ERRORS, AttributeError, OSError):
+                # Arquivo corrompido, remover
+                try:
+                    os.remove(cache_file)
+                except OSError:
+                    pass
+        
+        if manifest:
+            logger.info(f"Manifest do cache reconstruído: {len(manifest)} entradas")
+        return manifest
+    
+    def _save_manifest(self):
+        """
+        Regista no log as entradas alteradas na transação (chamar dentro de _manifest_transaction)
+        
+        Cada escrita acrescenta só as suas entradas, em vez de regravar o
+        manifest inteiro; quando o log passa a ter mais alterações do que o
+        manifest tem entradas, é compactado.
+        """
+        changes, self._manifest_changes = self._manifest_changes, set()
+        if not changes:
+            return
+        if self._log_entries + len(changes) > max(MANIFEST_LOG_MIN_ENTRIES, len(self._manifest)):
+            self._compact_manifest()
+            return
+        
+        data = ''.join(
+            json.dumps([key, self._manifest.get(key)], ensure_ascii=False, separators=(',', ':')) + '\n'
+            for key in sorted(changes)
+        ).encode('utf-8')
+        try:
+            # Uma única escrita em O_APPEND: os leitores nunca veem linhas de escritas diferentes misturadas
+            fd = os.open(self.manifest_log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                stat = os.fstat(fd)
+            finally:
+                os.close(fd)
+            self._log_state = (stat.st_ino, stat.st_size)
+            self._log_entries += len(changes)
+        except OSError as e:
+            logger.error(f"Erro ao gravar log do manifest do cache: {str(e)}")
+    
+    def _compact_manifest(self, manifest: Dict[str, Dict[str, Any]] = None):
+        """Grava o snapshot completo do manifest e esvazia o log (chamar dentro de _manifest_transaction)"""
+        self._manifest_changes = set()
+        try:
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._manifest if manifest is None else manifest, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.manifest_path)
+            self._manifest_sig = self._manifest_signature()
+            
+            # Log novo (outro inode): quem leu o antigo relê o snapshot
+            tmp_path = f"{self.manifest_log_path}.tmp"
+            open(tmp_path, 'wb').close()
+            os.replace(tmp_path, self.manifest_log_path)
+            self._log_state = (os.stat(self.manifest_log_path).st_ino, 0)
+            self._log_entries = 0
+        except OSError as e:
+            logger.error(f"Erro ao gravar manifest do cache: {str(e)}")
+    
+    def _remove_entry(self, key: str) -> bool:
+        """Remove o arquivo e a entrada do manifest de uma chave, sem gravar o manifest (chamar com lock)"""
+        self._l1.pop(key, None)
+        self._access.pop(key, None)
+        meta = self._manifest.pop(key, None)
+        if meta is None:
+            return False
+        self._manifest_changes.add(key)
+        try:
+            os.remove(os.path.join(self.cache_dir, meta['file']))
+        except FileNotFoundError:
+            pass
+        return True
+    
+    def register_namespace(self, name: str, ttl: int, tags: list = None,
+                           stale: int = None, refresh_ahead: float = None):
+        """
+        Declara (ou substitui) um espaço de nomes do cache
+        
+        Args:
+            name: Nome do espaço de nomes (a chave ou o prefixo das chaves, ex: 'text' para 'text_<hash>')
+            ttl: TTL fixo das entradas, em segundos
+            tags: Tags aplicadas às entradas (por omissão, o próprio nome)
+            stale: Janela stale-while-revalidate, em segundos (None = sem SWR)
+            refresh_ahead: Fração do TTL a partir da qual a entrada é atualizada em segundo plano
+        """
+        config = {'ttl': ttl, 'tags': list(tags if tags is not None else [name])}
+        if stale is not None:
+            config.update(stale=stale, refresh_ahead=refresh_ahead or 0.8)
+        with self._lock:
+            self.namespaces[name] = config
+            self._key_namespaces.clear()
+    
+    def _namespace_for_key(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna a configuração do espaço de nomes da chave (resolvida uma vez por chave)"""
+        try:
+            name = self._key_namespaces[key]
+        except KeyError:
+            # Prefixo declarado mais longo (ex: 'candidates_all' -> 'candidates')
+            matches = [n for n in self.namespaces if key == n or key.startswith(n + '_')]
+            name = max(matches, key=len) if matches else None
+            self._key_namespaces[key] = name
+        return self.namespaces.get(name) if name else None
     
     def _get_ttl_for_key(self, key: str) -> int:
-        """Retorna o TTL apropriado baseado na chave"""
-        for cache_type, ttl in self.ttl_config.items():
-            if cache_type in key.lower():
-                return ttl
-        return self.default_ttl
+        """Retorna o TTL do espaço de nomes da chave"""
+        namespace = self._namespace_for_key(key)
+        return namespace['ttl'] if namespace else self.default_ttl
     
-    def get(self, key: str) -> Optional[Any]:
+    def _get_tags_for_key(self, key: str) -> list:
+        """Retorna as tags do espaço de nomes da chave"""
+        namespace = self._namespace_for_key(key)
+        return list(namespace['tags']) if namespace else []
+    
+    def _get_swr_for_key(self, key: str) -> Optional[Dict[str, float]]:
+        """Retorna a política stale-while-revalidate da chave (None se não tiver)"""
+        namespace = self._namespace_for_key(key)
+        if namespace and namespace.get('stale') is not None:
+            return namespace
+        return None
+    
+    def _get_max_age_for_key(self, key: str) -> int:
+        """Idade a partir da qual o arquivo é removido (TTL + janela stale)"""
+        policy = self._get_swr_for_key(key)
+        return self._get_ttl_for_key(key) + (policy['stale'] if policy else 0)
+    
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
         """
-        Obtém um valor do cache se ainda for válido
+        Obtém um valor do cache mesmo que expirado, dentro da janela stale da família
         
         Args:
             key: Chave do cache
             
         Returns:
-            Valor do cache ou None se não existir/expirado
+            Tuplo (valor, idade em segundos) ou None se não existir/fora da janela
         """
         with self._lock:
-            cache_file = self._get_cache_file_path(key)
+            self._sync_manifest()
+            l1_entry = self._l1.get(key)
+            if l1_entry is not None:
+                age = time.time() - l1_entry[1]
+                if age <= self._get_max_age_for_key(key):
+                    self._l1.move_to_end(key)
+                    self._l1_stats['l1_hits'] += 1
+                    self._record_access(key)
+                    return l1_entry[0], age
+                del self._l1[key]
             
-            if not os.path.exists(cache_file):
+            meta = self._manifest.get(key)
+            if meta is None:
+                self._l1_stats['misses'] += 1
                 return None
+            expired = time.time() - meta['timestamp'] > self._get_max_age_for_key(key)
+        
+        if expired:
+            # Cache expirado, remover arquivo
+            self._discard_entry(key, meta)
+            logger.info(f"Cache expirado removido: {key}")
+            return None
+        
+        # Leitura sem lock: o arquivo só é substituído por rename atómico
+        cache_file = os.path.join(self.cache_dir, meta['file'])
+        try:
+            cache_data = self._read_file(cache_file)
+        except (*DECODE_ERRORS, AttributeError, OSError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Erro ao ler cache {key}: {str(e)}")
+            # Arquivo corrompido ou removido entretanto
+            self._discard_entry(key, meta)
+            return None
+        
+        timestamp = cache_data.get('timestamp', 0)
+        with self._lock:
+            self._l1_stats['l2_hits'] += 1
+            self._record_access(key)
+            # Promover para o L1 com o timestamp original, salvo se a entrada mudou entretanto
+            if self._same_version(self._manifest.get(key), meta) and key not in self._l1:
+                self._l1_put(key, cache_data.get('data'), timestamp, meta.get('version', 0))
+        return cache_data.get('data'), time.time() - timestamp
+    
+    def entry_age(self, key: str) -> Optional[float]:
+        """
+        Idade de uma entrada em segundos, só a partir do manifest (sem ler o arquivo
+        nem contar como acesso para as estatísticas ou a política de remoção)
+        
+        Args:
+            key: Chave do cache
             
+        Returns:
+            Idade em segundos, ou None se a entrada não existir
+        """
+        with self._lock:
+            self._sync_manifest()
+            meta = self._manifest.get(key)
+        if meta is None:
+            return None
+        return time.time() - meta['timestamp']
+    
+    def written_since(self, key: str, since: float) -> bool:
+        """Indica se a chave foi gravada (por qualquer processo) depois do instante dado"""
+        with self._lock:
+            self._sync_manifest(force=True)
+            meta = self._manifest.get(key)
+            return meta is not None and meta['timestamp'] >= since
+    
+    @staticmethod
+    def _same_version(current: Optional[Dict[str, Any]], meta: Dict[str, Any]) -> bool:
+        """Indica se a entrada do manifest ainda é a mesma versão (ignora tempos de acesso)"""
+        return (current is not None and current['file'] == meta['file']
+                and current['timestamp'] == meta['timestamp']
+                and current.get('version', 0) == meta.get('version', 0))
+    
+    def _record_access(self, key: str):
+        """Regista um acesso em memória; é passado ao manifest na manutenção (chamar com lock)"""
+        access = self._access.get(key)
+        if access is None:
+            self._access[key] = [time.time(), 1]
+        else:
+            access[0] = time.time()
+            access[1] += 1
+    
+    def _merge_access_times(self) -> bool:
+        """Passa os acessos registados em memória para o manifest (chamar dentro de _manifest_transaction)"""
+        changed = False
+        for key, (accessed_at, hits) in self._access.items():
+            meta = self._manifest.get(key)
+            if meta is not None:
+                meta['atime'] = max(meta.get('atime', 0), accessed_at)
+                meta['hits'] = meta.get('hits', 0) + hits
+                self._manifest_changes.add(key)
+                changed = True
+        self._access.clear()
+        return changed
+    
+    def _enforce_budget(self, keep: str = None) -> int:
+        """
+        Remove entradas até cumprir max_bytes e max_entries (chamar dentro de _manifest_transaction)
+        
+        Args:
+            keep: Chave que não deve ser removida (ex: a que acabou de ser gravada)
+        
+        Returns:
+            Número de entradas removidas
+        """
+        total_bytes = sum(meta['size'] for meta in self._manifest.values())
+        if total_bytes <= self.max_bytes and len(self._manifest) <= self.max_entries:
+            return 0
+        
+        self._merge_access_times()
+        if self.eviction == 'lfu':
+            rank = lambda item: (item[1].get('hits', 0), item[1].get('atime', item[1]['timestamp']))
+        else:
+            rank = lambda item: item[1].get('atime', item[1]['timestamp'])
+        
+        evicted = 0
+        for key, meta in sorted(self._manifest.items(), key=rank):
+            if total_bytes <= self.max_bytes and len(self._manifest) <= self.max_entries:
+                break
+            if key == keep:
+                continue
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                
-                # Verificar se o cache expirou
-                cached_time = cache_data.get('timestamp', 0)
-                ttl = self._get_ttl_for_key(key)
-                
-                if time.time() - cached_time > ttl:
-                    # Cache expirado, remover arquivo
-                    os.remove(cache_file)
-                    logger.info(f"Cache expirado removido: {key}")
-                    return None
-                
-                logger.info(f"Cache hit para: {key}")
-                return cache_data.get('data')
-                
-            except (json.JSONDecodeError, KeyError, OSError) as e:
-                logger.warning(f"Erro ao ler cache {key}: {str(e)}")
-                # Remover arquivo corrompido
-                try:
-                    os.remove(cache_file)
-                except:
-                    pass
-                return None
+                self._remove_entry(key)
+            except OSError as e:
+                logger.error(f"Erro ao remover cache {key}: {str(e)}")
+                continue
+            total_bytes -= meta['size']
+            evicted += 1
+        
+        if evicted:
+            self._maintenance_stats['evicted'] += evicted
+            logger.info(f"Orçamento do cache excedido ({self.eviction}): {evicted} entradas removidas")
+        return evicted
+    
+    def _discard_entry(self, key: str, meta: Dict[str, Any]):
+        """Remove a entrada lida sem lock, se entretanto não tiver sido substituída, e conta a falha"""
+        with self._stripe(key), self._manifest_transaction():
+            if self._same_version(self._manifest.get(key), meta):
+                self._remove_entry(key)
+                self._save_manifest()
+            self._l1_stats['misses'] += 1
     
-    def set(self, key: str, value: Any) -> bool:
+    def _l1_put(self, key: str, value: Any, timestamp: float, version: int = 0):
+        """Guarda um valor no L1, descartando o menos usado se exceder o limite (chamar com lock)"""
+        self._l1[key] = (value, timestamp, version)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_max_entries:
+            self._l1.popitem(last=False)
+            self._l1_stats['l1_evictions'] += 1
+    
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Obtém um valor do cache se ainda for válido
+        
+        Args:
+            key: Chave do cache
+            
+        Returns:
+            Valor do cache ou None se não existir/expirado
+        """
+        entry = self.get_entry(key)
+        if entry is None or entry[1] > self._get_ttl_for_key(key):
+            return None
+        
+        logger.info(f"Cache hit para: {key}")
+        return entry[0]
+    
+    def set(self, key: str, value: Any, tags: list = None) -> bool:
         """
         Define um valor no cache
         
         Args:
             key: Chave do cache
             value: Valor a ser armazenado
+            tags: Tags adicionais (além das do espaço de nomes) registadas no manifest
             
         Returns:
             True se salvou com sucesso, False caso contrário
         """
-        with self._lock:
+        with self._stripe(key):
             cache_file = self._get_cache_file_path(key)
+            timestamp = time.time()
             
             try:
                 cache_data = {
-                    'timestamp': time.time(),
+                    'timestamp': timestamp,
                     'key': key,
                     'data': value
                 }
                 
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(cache_data, f, ensure_ascii=False, indent=2)
+                # Serialização e escrita fora do lock global
+                size = self._write_file(cache_file, cache_data)
+                
+                with self._manifest_transaction():
+                    previous = self._manifest.get(key)
+                    if previous and previous['file'] != os.path.basename(cache_file):
+                        # Entrada antiga noutro formato de arquivo (ex: .json)
+                        self._remove_entry(key)
+                    
+                    self._manifest[key] = {
+                        'file': os.path.basename(cache_file),
+                        'timestamp': timestamp,
+                        'ttl': self._get_ttl_for_key(key),
+                        'size': size,
+                        'tags': sorted(set(self._get_tags_for_key(key)) | set(tags or [])),
+                        'atime': timestamp,
+                        'hits': previous.get('hits', 0) if previous else 0,
+                        'version': 0,
+                    }
+                    self._manifest_changes.add(key)
+                    self._enforce_budget(keep=key)
+                    self._save_manifest()
+                    self._l1_put(key, value, timestamp)
                 
                 logger.info(f"Cache salvo para: {key}")
                 return True
                 
-            except (OSError, TypeError) as e:
+            except (OSError, TypeError, ValueError, pickle.PicklingError) as e:
                 logger.error(f"Erro ao salvar cache {key}: {str(e)}")
+                # Manter pelo menos em memória neste processo
+                with self._lock:
+                    self._l1_put(key, value, timestamp)
                 return False
     
+    def patch(self, key: str, patch_function: Callable[[Any], Any]) -> bool:
+        """
+        Altera o valor de uma entrada existente sem a buscar de novo (write-through)
+        
+        A entrada mantém o timestamp original (a idade não é reiniciada) e a
+        versão no manifest é incrementada, o que descarta a cópia em L1 dos
+        outros processos.
+        
+        Args:
+            key: Chave do cache
+            patch_function: Recebe o valor atual e devolve o novo valor, sem alterar
+                o original (None cancela a alteração)
+            
+        Returns:
+            True se a entrada foi alterada, False se não existia, expirou ou mudou entretanto
+        """
+        with self._stripe(key):
+            with self._lock:
+                self._sync_manifest(force=True)
+                meta = self._manifest.get(key)
+                if meta is None or time.time() - meta['timestamp'] > self._get_max_age_for_key(key):
+                    return False
+                meta = dict(meta)
+                l1_entry = self._l1.get(key)
+            
+            cache_file = os.path.join(self.cache_dir, meta['file'])
+            try:
+                if l1_entry is not None and l1_entry[1:] == (meta['timestamp'], meta.get('version', 0)):
+                    value = l1_entry[0]
+                else:
+                    value = self._read_file(cache_file).get('data')
+                
+                value = patch_function(value)
+                if value is None:
+                    return False
+                
+                version = meta.get('version', 0) + 1
+                size = self._write_file(cache_file, {
+                    'timestamp': meta['timestamp'],
+                    'key': key,
+                    'data': value,
+                    'version': version,
+                })
+            except (*DECODE_ERRORS, AttributeError, OSError, TypeError, pickle.PicklingError) as e:
+                logger.error(f"Erro ao alterar cache {key}: {str(e)}")
+                # A cópia em cache já não corresponde à planilha: descartá-la
+                with self._manifest_transaction():
+                    if self._same_version(self._manifest.get(key), meta):
+                        self._remove_entry(key)
+                        self._save_manifest()
+                return False
+            
+            with self._manifest_transaction():
+                if not self._same_version(self._manifest.get(key), meta):
+                    # Invalidada durante a escrita (ex: por tag): não ressuscitar a entrada
+                    with contextlib.suppress(OSError):
+                        os.remove(cache_file)
+                    return False
+                
+                self._manifest[key] = dict(self._manifest[key], size=size, version=version)
+                self._manifest_changes.add(key)
+                self._save_manifest()
+                self._l1_put(key, value, meta['timestamp'], version)
+                self._shared_stats['patches'] += 1
+        
+        logger.info(f"Cache alterado no lugar: {key} (versão {version})")
+        return True
+    
     def invalidate(self, key: str) -> bool:
         """
-        Remove uma chave específica do cache
+        Remove uma chave específica do cache (memória e disco)
         
         Args:
-            key: Chave a ser removida
+            key: Chave a ser removida, ou 'tag:<tag>' para invalidar todas as chaves da tag
             
         Returns:
             True se removeu com sucesso, False caso contrário
         """
-        with self._lock:
-            cache_file = self._get_cache_file_path(key)
+        if key.startswith('tag:'):
+            return self.invalidate_tag(key[4:]) > 0
+        
+        with self._stripe(key), self._manifest_transaction():
+            removed = key in self._l1
             
             try:
-                if os.path.exists(cache_file):
-                    os.remove(cache_file)
+                if self._remove_entry(key):
+                    removed = True
+                    self._save_manifest()
+                if removed:
                     logger.info(f"Cache invalidado: {key}")
-                    return True
-                return False
+                return removed
                 
             except OSError as e:
                 logger.error(f"Erro ao invalidar cache {key}: {str(e)}")
                 return False
     
+    def invalidate_tag(self, tag: str) -> int:
+        """
+        Remove todas as chaves com a tag (ex: 'candidates' remove a lista e cada 'candidate_*')
+        
+        Args:
+            tag: Tag a invalidar
+            
+        Returns:
+            Número de chaves removidas
+        """
+        removed_count = 0
+        
+        with self._manifest_transaction():
+            for key in [k for k in self._l1 if tag in self._get_tags_for_key(k)]:
+                del self._l1[key]
+            
+            for key in [k for k, meta in self._manifest.items() if tag in meta.get('tags', [])]:
+                try:
+                    if self._remove_entry(key):
+                        removed_count += 1
+                except OSError as e:
+                    logger.error(f"Erro ao invalidar cache {key}: {str(e)}")
+            
+            if removed_count:
+                self._save_manifest()
+        
+        logger.info(f"Invalidados {removed_count} caches com tag: {tag}")
+        return removed_count
+    
     def invalidate_pattern(self, pattern: str) -> int:
         """
         Remove todas as chaves que contêm o padrão
@@ -167,32 +977,20 @@ class FileCache:
         """
         removed_count = 0
         
-        with self._lock:
-            try:
-                for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.json'):
-                        cache_file = os.path.join(self.cache_dir, filename)
-                        
-                        try:
-                            with open(cache_file, 'r', encoding='utf-8') as f:
-                                cache_data = json.load(f)
-                            
-                            key = cache_data.get('key', '')
-                            if pattern.lower() in key.lower():
-                                os.remove(cache_file)
-                                logger.info(f"Cache invalidado por padrão: {key}")
-                                removed_count += 1
-                                
-                        except (json.JSONDecodeError, KeyError, OSError):
-                            # Arquivo corrompido, remover
-                            try:
-                                os.remove(cache_file)
-                                removed_count += 1
-                            except:
-                                pass
-                
-            except OSError as e:
-                logger.error(f"Erro ao invalidar por padrão {pattern}: {str(e)}")
+        with self._manifest_transaction():
+            for key in [k for k in self._l1 if pattern.lower() in k.lower()]:
+                del self._l1[key]
+            
+            for key in [k for k in self._manifest if pattern.lower() in k.lower()]:
+                try:
+                    if self._remove_entry(key):
+                        logger.info(f"Cache invalidado por padrão: {key}")
+                        removed_count += 1
+                except OSError as e:
+                    logger.error(f"Erro ao invalidar por padrão {pattern}: {str(e)}")
+            
+            if removed_count:
+                self._save_manifest()
         
         logger.info(f"Invalidados {removed_count} caches com padrão: {pattern}")
         return removed_count
@@ -206,10 +1004,14 @@ class FileCache:
         """
         removed_count = 0
         
-        with self._lock:
+        with self._manifest_transaction():
+            self._l1.clear()
+            self._manifest = {}
+            
             try:
+                # Listagem do diretório para apanhar também arquivos fora do manifest
                 for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.json'):
+                    if filename.endswith(CACHE_FILE_EXTENSIONS + ('.tmp',)) and filename != MANIFEST_FILENAME:
                         cache_file = os.path.join(self.cache_dir, filename)
                         try:
                             os.remove(cache_file)
@@ -219,6 +1021,8 @@ class FileCache:
                 
             except OSError as e:
                 logger.error(f"Erro ao limpar cache: {str(e)}")
+            
+            self._compact_manifest()
         
         logger.info(f"Cache limpo: {removed_count} arquivos removidos")
         return removed_count
@@ -233,44 +1037,78 @@ class FileCache:
         removed_count = 0
         current_time = time.time()
         
-        with self._lock:
-            try:
-                for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.json'):
-                        cache_file = os.path.join(self.cache_dir, filename)
-                        
-                        try:
-                            with open(cache_file, 'r', encoding='utf-8') as f:
-                                cache_data = json.load(f)
-                            
-                            cached_time = cache_data.get('timestamp', 0)
-                            key = cache_data.get('key', '')
-                            ttl = self._get_ttl_for_key(key)
-                            
-                            if current_time - cached_time > ttl:
-                                os.remove(cache_file)
-                                logger.info(f"Cache expirado removido: {key}")
-                                removed_count += 1
-                                
-                        except (json.JSONDecodeError, KeyError, OSError):
-                            # Arquivo corrompido, remover
-                            try:
-                                os.remove(cache_file)
-                                removed_count += 1
-                            except:
-                                pass
-                
-            except OSError as e:
-                logger.error(f"Erro ao limpar caches expirados: {str(e)}")
+        with self._manifest_transaction():
+            for key in [k for k, (_, ts, _) in self._l1.items() if current_time - ts > self._get_max_age_for_key(k)]:
+                del self._l1[key]
+            
+            expired = [key for key, meta in self._manifest.items()
+                       if current_time - meta['timestamp'] > self._get_max_age_for_key(key)]
+            for key in expired:
+                try:
+                    self._remove_entry(key)
+                    logger.info(f"Cache expirado removido: {key}")
+                    removed_count += 1
+                except OSError as e:
+                    logger.error(f"Erro ao limpar caches expirados: {str(e)}")
+            
+            if removed_count:
+                self._save_manifest()
         
         if removed_count > 0:
             logger.info(f"Limpeza de cache: {removed_count} arquivos expirados removidos")
         
         return removed_count
     
+    def run_maintenance(self) -> Dict[str, int]:
+        """
+        Executa a manutenção: remove expirados, regista os acessos no manifest,
+        aplica o orçamento e compacta o log do manifest
+        
+        Returns:
+            Dicionário com o número de entradas expiradas e removidas pelo orçamento
+        """
+        expired = self.cleanup_expired()
+        
+        with self._manifest_transaction():
+            changed = self._merge_access_times()
+            evicted = self._enforce_budget()
+            if changed or evicted or self._log_entries:
+                self._compact_manifest()
+            self._maintenance_stats['runs'] += 1
+            self._maintenance_stats['expired'] += expired
+        
+        return {'expired': expired, 'evicted': evicted}
+    
+    def start_janitor(self, interval: float = 300.0):
+        """
+        Inicia a thread de manutenção periódica, se ainda não estiver ativa
+        
+        Args:
+            interval: Segundos entre execuções
+        """
+        with self._lock:
+            if self._janitor is not None and self._janitor.is_alive():
+                return
+            self._janitor_stop.clear()
+            self._janitor = threading.Thread(target=self._janitor_loop, args=(interval,), name='file-cache-janitor', daemon=True)
+            self._janitor.start()
+    
+    def stop_janitor(self, timeout: float = 5.0):
+        """Pede à thread de manutenção para terminar"""
+        self._janitor_stop.set()
+        if self._janitor is not None:
+            self._janitor.join(timeout)
+    
+    def _janitor_loop(self, interval: float):
+        while not self._janitor_stop.wait(interval):
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                logger.error(f"Erro na manutenção do cache: {str(e)}")
+    
     def get_stats(self) -> Dict[str, Any]:
         """
-        Retorna estatísticas do cache
+        Retorna estatísticas do cache (a partir do manifest, sem abrir os arquivos)
         
         Returns:
             Dicionário com estatísticas
@@ -279,6 +1117,7 @@ class FileCache:
             'total_files': 0,
             'total_size_bytes': 0,
             'expired_files': 0,
+            'stale_files': 0,
             'valid_files': 0,
             'cache_keys': [],
             'cache_dir': self.cache_dir
@@ -286,44 +1125,229 @@ class FileCache:
         
         current_time = time.time()
         
-        try:
-            for filename in os.listdir(self.cache_dir):
-                if filename.endswith('.json'):
-                    cache_file = os.path.join(self.cache_dir, filename)
-                    
-                    try:
-                        file_size = os.path.getsize(cache_file)
-                        stats['total_files'] += 1
-                        stats['total_size_bytes'] += file_size
-                        
-                        with open(cache_file, 'r', encoding='utf-8') as f:
-                            cache_data = json.load(f)
-                        
-                        key = cache_data.get('key', '')
-                        cached_time = cache_data.get('timestamp', 0)
-                        ttl = self._get_ttl_for_key(key)
-                        
-                        if current_time - cached_time > ttl:
-                            stats['expired_files'] += 1
-                        else:
-                            stats['valid_files'] += 1
-                            stats['cache_keys'].append(key)
-                            
-                    except (json.JSONDecodeError, KeyError, OSError):
-                        stats['expired_files'] += 1
-                        
-        except OSError:
-            pass
+        with self._lock:
+            self._sync_manifest(force=True)
+            for key, meta in self._manifest.items():
+                stats['total_files'] += 1
+                stats['total_size_bytes'] += meta['size']
+                age = current_time - meta['timestamp']
+                
+                if age > self._get_max_age_for_key(key):
+                    stats['expired_files'] += 1
+                elif age > self._get_ttl_for_key(key):
+                    # Ainda servido enquanto é atualizado em segundo plano
+                    stats['stale_files'] += 1
+                else:
+                    stats['valid_files'] += 1
+                    stats['cache_keys'].append(key)
+            
+            stats['l1'] = dict(self._l1_stats, entries=len(self._l1), max_entries=self.l1_max_entries)
+            stats['shared'] = dict(self._shared_stats, enabled=self.shared)
+            stats['budget'] = dict(
+                self._maintenance_stats,
+                max_bytes=self.max_bytes,
+                max_entries=self.max_entries,
+                eviction=self.eviction,
+                janitor_running=self._janitor is not None and self._janitor.is_alive(),
+            )
         
         # Converter bytes para MB
         stats['total_size_mb'] = round(stats['total_size_bytes'] / 1024 / 1024, 2)
         
         return stats
 
+class CacheRefresher:
+    """
+    Atualização em segundo plano das entradas do file cache (stale-while-revalidate).
+
+    As funções de busca usadas em with_file_cache ficam registadas por chave.
+    Um agendador procura periodicamente entradas perto de expirar (refresh-ahead)
+    e um pequeno conjunto de workers volta a buscá-las, pelo que, depois do
+    aquecimento, os pedidos das famílias com política SWR não esperam pela API.
+    """
+    
+    def __init__(self, workers: int = 2, scan_interval: float = 15.0,
+                 refresh_context: Callable[[], Any] = None, idle_timeout: float = 900.0):
+        """
+        Inicializa o atualizador
+        
+        Args:
+            workers: Número de threads que executam as atualizações
+            scan_interval: Segundos entre verificações de entradas perto de expirar
+            refresh_context: Fábrica de gestor de contexto aplicado a cada atualização (ex: prioridade de quota)
+            idle_timeout: Segundos sem leituras após os quais uma chave deixa de ser atualizada antecipadamente
+        """
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.scan_interval = scan_interval
+        self.refresh_context = refresh_context or contextlib.nullcontext
+        
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+        self._registry = {}
+        self._last_read = {}
+        self._scheduled = set()
+        self._stats = {
+            'stale_served': 0,
+            'refresh_ahead': 0,
+            'refreshed': 0,
+            'failed': 0,
+        }
+    
+    def register(self, flight_key: str, cache_key: str, fetch_function: Callable, cache_instance: FileCache):
+        """Regista (ou substitui) a função de busca de uma chave com política SWR, a cada leitura"""
+        with self._lock:
+            self._registry[flight_key] = (cache_key, fetch_function, cache_instance)
+            self._last_read[flight_key] = time.time()
+        self.start()
+    
+    def schedule(self, flight_key: str, reason: str = 'refresh_ahead') -> bool:
+        """
+        Agenda a atualização de uma chave registada, se ainda não estiver agendada
+        
+        Args:
+            flight_key: Chave de coalescência da entrada
+            reason: 'stale_served' ou 'refresh_ahead' (para as estatísticas)
+        
+        Returns:
+            True se foi agendada agora
+        """
+        with self._lock:
+            if flight_key not in self._registry or flight_key in self._scheduled:
+                return False
+            self._scheduled.add(flight_key)
+            self._stats[reason] += 1
+        self._queue.put(flight_key)
+        return True
+    
+    def start(self):
+        """Inicia o agendador e os workers, se ainda não estiverem ativos"""
+        with self._lock:
+            if self._threads and all(thread.is_alive() for thread in self._threads):
+                return
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._scan_loop, name='cache-refresh-scan', daemon=True)]
+            self._threads += [
+                threading.Thread(target=self._worker, name=f'cache-refresh-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """Pede às threads para terminar"""
+        self._stop.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+    
+    def _scan_loop(self):
+        while not self._stop.wait(self.scan_interval):
+            try:
+                self.scan()
+            except Exception as e:
+                logger.error(f"Erro ao verificar entradas do cache a atualizar: {str(e)}")
+    
+    def scan(self) -> int:
+        """Agenda as entradas registadas, ainda lidas, que passaram o limiar de refresh-ahead"""
+        now = time.time()
+        with self._lock:
+            registry = {
+                flight_key: registered for flight_key, registered in self._registry.items()
+                if now - self._last_read.get(flight_key, 0) <= self.idle_timeout
+            }
+        
+        scheduled = 0
+        for flight_key, (cache_key, _, cache_instance) in registry.items():
+            policy = cache_instance._get_swr_for_key(cache_key)
+            if not policy:
+                continue
+            # Só metadados: a verificação não conta como leitura da entrada
+            age = cache_instance.entry_age(cache_key)
+            # Entradas removidas (invalidadas) só voltam a ser lidas a pedido
+            if age is not None and age >= cache_instance._get_ttl_for_key(cache_key) * policy['refresh_ahead']:
+                if self.schedule(flight_key):
+                    scheduled += 1
+        return scheduled
+    
+    def _worker(self):
+        while not self._stop.is_set():
+            flight_key = self._queue.get()
+            if flight_key is None:
+                return
+            try:
+                self.refresh(flight_key)
+            finally:
+                with self._lock:
+                    self._scheduled.discard(flight_key)
+    
+    def refresh(self, flight_key: str) -> bool:
+        """Volta a buscar uma chave registada e atualiza o cache"""
+        with self._lock:
+            registered = self._registry.get(flight_key)
+        if registered is None:
+            return False
+        
+        cache_key, fetch_function, cache_instance = registered
+        try:
+            with self.refresh_context():
+                file_cache_flights.do(flight_key, lambda: _fetch_and_store(cache_key, fetch_function, cache_instance))
+            with self._lock:
+                self._stats['refreshed'] += 1
+            return True
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+            logger.warning(f"Falha na atualização em segundo plano de {cache_key}: {str(e)}")
+            return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna contadores, chaves registadas e atualizações pendentes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['registered'] = sorted(key for key, _, _ in self._registry.values())
+            stats['idle'] = sum(1 for flight_key in self._registry
+                                if time.time() - self._last_read.get(flight_key, 0) > self.idle_timeout)
+            stats['scheduled'] = len(self._scheduled)
+        return stats
+
+def _fetch_and_store(cache_key: str, fetch_function: Callable, cache_instance: FileCache) -> Any:
+    """Busca dados frescos e grava-os no cache, uma única vez por chave entre processos"""
+    started = time.time()
+    fetch_lock = cache_instance.fetch_lock(cache_key)
+    locked = fetch_lock.acquire(timeout=file_cache_flights.wait_timeout)
+    if not locked:
+        logger.warning(f"Tempo de espera excedido pela busca de outro processo para: {cache_key}. Buscando diretamente.")
+    
+    try:
+        # Outro worker pode ter feito a busca enquanto esperávamos pelo lock
+        if locked and cache_instance.shared and cache_instance.written_since(cache_key, started):
+            entry = cache_instance.get_entry(cache_key)
+            if entry is not None:
+                with cache_instance._lock:
+                    cache_instance._shared_stats['cross_process_coalesced'] += 1
+                logger.info(f"Dados de {cache_key} obtidos por outro processo")
+                return entry[0]
+        
+        logger.info(f"Buscando dados frescos para: {cache_key}")
+        fresh_data = fetch_function()
+        cache_instance.set(cache_key, fresh_data)
+        return fresh_data
+    finally:
+        if locked:
+            fetch_lock.release()
+
 def with_file_cache(cache_key: str, fetch_function: Callable, force_refresh: bool = False, cache_instance: FileCache = None) -> Any:
     """
     Decorator/helper para implementar cache em arquivo com fallback
     
+    Nas famílias com política SWR (ver DEFAULT_NAMESPACES), uma entrada
+    expirada mas dentro da janela stale é devolvida de imediato e atualizada
+    em segundo plano; perto de expirar é atualizada antecipadamente.
+    
     Args:
         cache_key: Chave para o cache
         fetch_function: Função para buscar dados se não estiver em cache
@@ -337,21 +1361,31 @@ def with_file_cache(cache_key: str, fetch_function: Callable, force_refresh: boo
         # Usar instância global padrão
         cache_instance = default_file_cache
     
+    # Pedidos concorrentes para a mesma chave partilham uma única busca
+    flight_key = cache_key if cache_instance is default_file_cache else f"{cache_instance.cache_dir}:{cache_key}"
+    policy = cache_instance._get_swr_for_key(cache_key)
+    
     try:
         # Se não for refresh forçado, tentar cache primeiro
         if not force_refresh:
-            cached_data = cache_instance.get(cache_key)
-            if cached_data is not None:
-                return cached_data
-        
-        # Buscar dados frescos
-        logger.info(f"Buscando dados frescos para: {cache_key}")
-        fresh_data = fetch_function()
+            if policy:
+                file_cache_refresher.register(flight_key, cache_key, fetch_function, cache_instance)
+                entry = cache_instance.get_entry(cache_key)
+                if entry is not None:
+                    cached_data, age = entry
+                    ttl = cache_instance._get_ttl_for_key(cache_key)
+                    if age > ttl:
+                        logger.info(f"Servindo cache expirado de {cache_key} ({int(age - ttl)}s) e atualizando em segundo plano")
+                        file_cache_refresher.schedule(flight_key, 'stale_served')
+                    elif age >= ttl * policy['refresh_ahead']:
+                        file_cache_refresher.schedule(flight_key, 'refresh_ahead')
+                    return cached_data
+            else:
+                cached_data = cache_instance.get(cache_key)
+                if cached_data is not None:
+                    return cached_data
         
-        # Salvar no cache
-        cache_instance.set(cache_key, fresh_data)
-        
-        return fresh_data
+        return file_cache_flights.do(flight_key, lambda: _fetch_and_store(cache_key, fetch_function, cache_instance))
         
     except Exception as e:
         logger.error(f"Erro ao buscar dados frescos para {cache_key}: {str(e)}")
@@ -360,8 +1394,7 @@ def with_file_cache(cache_key: str, fetch_function: Callable, force_refresh: boo
         try:
             cache_file = cache_instance._get_cache_file_path(cache_key)
             if os.path.exists(cache_file):
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
+                cache_data = cache_instance._read_file(cache_file)
                 
                 logger.warning(f"Usando cache expirado devido a erro para: {cache_key}")
                 return cache_data.get('data')
@@ -374,12 +1407,19 @@ def with_file_cache(cache_key: str, fetch_function: Callable, force_refresh: boo
 # Instância global padrão
 default_file_cache = FileCache()
 
+# Instância global de coalescência de buscas do file cache
+file_cache_flights = SingleFlight()
+
+# Instância global de atualização em segundo plano (stale-while-revalidate)
+file_cache_refresher = CacheRefresher()
+
 # Função para limpeza automática (pode ser chamada periodicamente)
 def auto_cleanup():
-    """Executa limpeza automática de caches expirados"""
+    """Executa limpeza automática de caches expirados e aplica o orçamento de disco"""
     try:
-        removed = default_file_cache.cleanup_expired()
+        result = default_file_cache.run_maintenance()
+        removed = result['expired'] + result['evicted']
         if removed > 0:
-            logger.info(f"Limpeza automática: {removed} caches expirados removidos")
+            logger.info(f"Limpeza automática: {result['expired']} caches expirados e {result['evicted']} acima do orçamento removidos")
     except Exception as e:
         logger.error(f"Erro na limpeza automática: {str(e)}") 
\ No newline at end of file
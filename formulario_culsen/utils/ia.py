@@ -1,11 +1,11 @@
 import os
-import pdfplumber
 from google.cloud import aiplatform
 from google.oauth2.service_account import Credentials
 import json
+import hashlib
+import threading
 import logging
 import traceback
-import PyPDF2
 import requests
 import anthropic
 import openai
@@ -13,10 +13,34 @@ import google.generativeai as genai
 from anthropic import Anthropic
 
 from utils.sheets import get_config, get_custom_prompt, get_validation_prompt
+from utils.prompt_templates import compile_prompt
+from utils.text_extraction import text_extraction_cache, file_sha256
+from utils.extraction_service import extraction_service
+from utils.file_cache import default_file_cache
 
 # Configurar logger
 logger = logging.getLogger('formulario_culsen.ia')
 
+# Modelo usado por cada provedor na análise de CV (faz parte da chave do cache de análises)
+ANALYSIS_MODELS = {
+    'gemini': 'gemini-1.5-flash',
+    'openai': 'gpt-4',
+    'claude': 'claude-2',
+    'deepseek': 'deepseek-chat',
+}
+
+# Campos do formulário que não são respostas do candidato (fora da prompt e do hash das respostas)
+INTERNAL_FORM_FIELDS = ('justificacao', 'provider', 'cv_url', 'classificacao', 'prompt_hash', 'status', 'index')
+
+# Estatísticas do cache de análises
+_analysis_cache_lock = threading.Lock()
+_analysis_cache_stats = {
+    'hits': 0,
+    'misses': 0,
+    'bypassed': 0,
+    'stored': 0,
+}
+
 def extract_text_from_file(file_path):
     """Extract text from PDF or TXT file"""
     file_extension = os.path.splitext(file_path)[1].lower()
@@ -42,33 +66,20 @@ def extract_text_from_file(file_path):
 
 def extract_text_from_pdf(pdf_path):
     """
-    Extrai texto de um arquivo PDF usando PyPDF2
+    Extrai texto de um arquivo PDF com o backend configurado (PDF_EXTRACTION_BACKEND)
+    
+    O texto fica em cache pelo SHA-256 do arquivo: reanalisar ou revalidar o
+    mesmo documento não volta a processar o PDF. A extração corre no pool de
+    processos do serviço de extração, fora da thread do pedido.
     """
     try:
         logger.info(f"Extraindo texto do PDF: {pdf_path}")
         
-        # Desativar logs muito detalhados durante o processamento
-        logging.getLogger("pdfminer").setLevel(logging.ERROR)
-        logging.getLogger("pdfplumber").setLevel(logging.WARNING)
+        document = text_extraction_cache.extract(pdf_path, extraction_service.extract_pdf_pages, extraction_service.backend)
         
-        text = ""
-        total_chars = 0
-        
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            num_pages = len(pdf_reader.pages)
-            
-            for i in range(num_pages):
-                page = pdf_reader.pages[i]
-                page_text = page.extract_text()
-                chars = len(page_text) if page_text else 0
-                logger.info(f"Página {i+1}: {chars} caracteres extraídos")
-                if page_text:
-                    text += page_text + "\n\n"
-                    total_chars += chars
-        
-        logger.info(f"Extração de texto do PDF concluída. Total: {total_chars} caracteres")
-        return text
+        logger.info(f"Extração de texto do PDF concluída. Total: {document['total_chars']} caracteres "
+                    f"({len(document['pages'])} páginas)")
+        return document['text']
     except Exception as e:
         logger.error(f"Erro ao extrair texto do PDF: {str(e)}")
         logger.error(traceback.format_exc())
@@ -202,9 +213,48 @@ def get_ai_provider():
         logger.error(traceback.format_exc())
         return "gemini"  # Provedor padrão em caso de erro
 
-def analyze_cv(file_path, form_data):
+def _answers_hash(form_data):
+    """Hash das respostas do formulário (sem campos internos), independente da ordem"""
+    answers = {k: v for k, v in form_data.items() if k not in INTERNAL_FORM_FIELDS}
+    encoded = json.dumps(answers, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def analysis_cache_key(cv_hash, form_data, prompt_hash, provider, model):
+    """
+    Chave do cache de análises para um conjunto de entradas
+
+    Args:
+        cv_hash: SHA-256 do arquivo do CV
+        form_data: Respostas do formulário
+        prompt_hash: Versão da prompt usada
+        provider: Provedor de IA
+        model: Modelo do provedor
+
+    Returns:
+        Chave no espaço de nomes 'analysis' do file cache
+    """
+    parts = "\x1f".join([cv_hash, _answers_hash(form_data), prompt_hash, provider, model])
+    return f"analysis_{hashlib.sha256(parts.encode('utf-8')).hexdigest()}"
+
+def _count_analysis_cache(name):
+    with _analysis_cache_lock:
+        _analysis_cache_stats[name] += 1
+
+def get_analysis_cache_stats():
+    """Retorna estatísticas do cache de análises (inclui a taxa de acerto)"""
+    with _analysis_cache_lock:
+        stats = dict(_analysis_cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+def analyze_cv(file_path, form_data, force=False):
     """
     Analisa o currículo do candidato e retorna avaliação.
+    
+    O resultado fica em cache pelas entradas da análise (CV, respostas, versão
+    da prompt, provedor e modelo): repetir a análise sem alterações não chama
+    o provedor. Com force=True o cache é ignorado e o resultado substituído.
     """
     try:
         logger.info(f"Iniciando análise do CV: {file_path}")
@@ -226,38 +276,92 @@ def analyze_cv(file_path, form_data):
         
         # Obter o provedor de IA configurado
         provider = get_ai_provider()
+        if provider not in ANALYSIS_MODELS:
+            logger.error(f"Provedor de IA não suportado: {provider}")
+            return {"error": "Provedor de IA não suportado"}
+        
+        # Gerar o prompt uma única vez, registando a versão usada
+        prompt, prompt_hash = build_prompt(text, form_data)
+        
+        # Análise já feita com as mesmas entradas
+        cache_key = analysis_cache_key(file_sha256(file_path), form_data, prompt_hash, provider, ANALYSIS_MODELS[provider])
+        if force:
+            _count_analysis_cache('bypassed')
+            logger.info("Reanálise forçada: cache de análises ignorado")
+        else:
+            cached = default_file_cache.get(cache_key)
+            if cached is not None:
+                _count_analysis_cache('hits')
+                logger.info(f"Análise de CV obtida do cache (provedor: {provider}, prompt {prompt_hash})")
+                return dict(cached, cached=True)
+            _count_analysis_cache('misses')
         
         # Analisar o CV com o provedor selecionado
         result = None
         if provider == "gemini":
-            result = analyze_with_gemini(text, form_data)
+            result = analyze_with_gemini(text, form_data, prompt=prompt)
         elif provider == "openai":
-            result = analyze_with_openai(text, form_data)
+            result = analyze_with_openai(text, form_data, prompt=prompt)
         elif provider == "claude":
-            result = analyze_with_claude(text, form_data)
+            result = analyze_with_claude(text, form_data, prompt=prompt)
         elif provider == "deepseek":
-            result = analyze_with_deepseek(text, form_data)
+            result = analyze_with_deepseek(text, form_data, prompt=prompt)
         else:
             logger.error(f"Provedor de IA não suportado: {provider}")
             return {"error": "Provedor de IA não suportado"}
         
-        # Adicionar informação sobre o provedor usado na análise
+        # Adicionar informação sobre o provedor e a versão da prompt usados na análise
         if result and not isinstance(result, dict):
-            result = {"analysis": result, "provider": provider}
+            result = {"analysis": result, "provider": provider, "prompt_hash": prompt_hash}
         elif result and isinstance(result, dict) and not result.get("error"):
             result["provider"] = provider
+            result["prompt_hash"] = prompt_hash
         
-        logger.info(f"Análise de CV concluída com o provedor: {provider}")
+        # Guardar apenas análises bem-sucedidas (cópia: quem chama acrescenta a classificação)
+        if isinstance(result, dict) and not result.get("error"):
+            if default_file_cache.set(cache_key, dict(result)):
+                _count_analysis_cache('stored')
+        
+        logger.info(f"Análise de CV concluída com o provedor: {provider} (prompt {prompt_hash})")
         return result
     except Exception as e:
         logger.error(f"Erro durante a análise do CV: {str(e)}")
         logger.error(traceback.format_exc())
         return {"error": f"Erro durante a análise: {str(e)}"}
 
-def get_prompt(text, form_data):
+# Prompt padrão para análise de CV (usada quando não há prompt na aba Prompt)
+DEFAULT_ANALYSIS_PROMPT = """
+Analise o currículo abaixo para o candidato {nome} que está se aplicando para a vaga de {cargo}.
+
+Detalhes do candidato:
+- Nome: {nome}
+- Email: {email}
+- Telefone: {telefone}
+- Cargo pretendido: {cargo}
+
+Respostas completas do formulário:
+{respostas}
+
+Currículo:
+{text}
+
+Responda às seguintes perguntas:
+1. Quais são as principais habilidades e competências do candidato?
+2. O candidato tem experiência relevante para a vaga de {cargo}? Liste as experiências relevantes.
+3. O candidato tem formação adequada para a vaga? Descreva a formação.
+4. Quais são os pontos fortes do candidato que o tornam adequado para esta posição?
+5. Há alguma lacuna ou ponto de atenção no perfil do candidato?
+6. Em uma escala de 0 a 10, qual seria a pontuação deste candidato para a vaga, considerando o alinhamento do perfil?
+7. O candidato deve ser chamado para entrevista? Por quê?
+
+Forneça uma análise detalhada e objetiva baseada apenas nas informações do currículo.
+"""
+
+def build_prompt(text, form_data):
     """
     Gera o prompt para análise do CV usando os dados do formulário.
     Se existir uma prompt personalizada na planilha, usa ela. Caso contrário, usa a padrão.
+    Retorna um tuplo (prompt, hash da versão da prompt usada).
     """
     nome = form_data.get('nome', '')
     email = form_data.get('email', '')
@@ -267,25 +371,27 @@ def get_prompt(text, form_data):
     # Preparar um resumo de todas as respostas do formulário
     respostas = ""
     for chave, valor in form_data.items():
-        if chave not in ['justificacao', 'provider', 'cv_url', 'classificacao']:  # Excluir campos internos
+        if chave not in INTERNAL_FORM_FIELDS:  # Excluir campos internos
             respostas += f"- {chave}: {valor}\n"
     
-    # Tentar obter a prompt personalizada da planilha
+    values = {
+        'nome': nome,
+        'email': email,
+        'telefone': telefone,
+        'cargo': cargo,
+        'text': text,
+        'respostas': respostas
+    }
+    
+    # Tentar obter a prompt personalizada da planilha (em cache, já compilada)
     custom_prompt = get_custom_prompt()
     
     if custom_prompt:
-        logger.info("Usando prompt personalizada da planilha")
+        template = compile_prompt(custom_prompt)
+        logger.info(f"Usando prompt personalizada da planilha (versão {template.hash})")
         try:
             # Formatar a prompt personalizada com os dados do formulário
-            formatted_prompt = custom_prompt.format(
-                nome=nome,
-                email=email,
-                telefone=telefone,
-                cargo=cargo,
-                text=text,
-                respostas=respostas
-            )
-            return formatted_prompt
+            return template.render(**values), template.hash
         except Exception as e:
             logger.error(f"Erro ao formatar prompt personalizada: {str(e)}")
             logger.error("Usando prompt padrão como fallback")
@@ -294,35 +400,17 @@ def get_prompt(text, form_data):
         logger.info("Prompt personalizada não encontrada. Usando prompt padrão")
     
     # Se não existir prompt personalizada ou houve erro na formatação, usar a padrão
-    prompt = f"""
-Analise o currículo abaixo para o candidato {nome} que está se aplicando para a vaga de {cargo}.
-
-Detalhes do candidato:
-- Nome: {nome}
-- Email: {email}
-- Telefone: {telefone}
-- Cargo pretendido: {cargo}
-
-Respostas completas do formulário:
-{respostas}
-
-Currículo:
-{text}
+    template = compile_prompt(DEFAULT_ANALYSIS_PROMPT)
+    return template.render(**values), template.hash
 
-Responda às seguintes perguntas:
-1. Quais são as principais habilidades e competências do candidato?
-2. O candidato tem experiência relevante para a vaga de {cargo}? Liste as experiências relevantes.
-3. O candidato tem formação adequada para a vaga? Descreva a formação.
-4. Quais são os pontos fortes do candidato que o tornam adequado para esta posição?
-5. Há alguma lacuna ou ponto de atenção no perfil do candidato?
-6. Em uma escala de 0 a 10, qual seria a pontuação deste candidato para a vaga, considerando o alinhamento do perfil?
-7. O candidato deve ser chamado para entrevista? Por quê?
-
-Forneça uma análise detalhada e objetiva baseada apenas nas informações do currículo.
-"""
-    return prompt
+def get_prompt(text, form_data):
+    """
+    Gera o prompt para análise do CV usando os dados do formulário.
+    Se existir uma prompt personalizada na planilha, usa ela. Caso contrário, usa a padrão.
+    """
+    return build_prompt(text, form_data)[0]
 
-def analyze_with_gemini(text, form_data):
+def analyze_with_gemini(text, form_data, prompt=None):
     """
     Analisa o CV usando a API do Gemini.
     """
@@ -338,10 +426,11 @@ def analyze_with_gemini(text, form_data):
         # Configurar o cliente Gemini
         genai.configure(api_key=api_key)
         # Utilizar o modelo gemini-1.5-flash que está disponível
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = genai.GenerativeModel(ANALYSIS_MODELS['gemini'])
         
         # Gerar o prompt para análise
-        prompt = get_prompt(text, form_data)
+        if prompt is None:
+            prompt = get_prompt(text, form_data)
         
         # Enviar para análise
         logger.info("Enviando CV para análise com Gemini")
@@ -359,7 +448,7 @@ def analyze_with_gemini(text, form_data):
         logger.error(traceback.format_exc())
         return {"error": f"Erro durante a análise com Gemini: {str(e)}"}
 
-def analyze_with_openai(text, form_data):
+def analyze_with_openai(text, form_data, prompt=None):
     """
     Analisa o CV usando a API da OpenAI.
     """
@@ -376,12 +465,13 @@ def analyze_with_openai(text, form_data):
         client = openai.OpenAI(api_key=api_key)
         
         # Gerar o prompt para análise
-        prompt = get_prompt(text, form_data)
+        if prompt is None:
+            prompt = get_prompt(text, form_data)
         
         # Enviar para análise
         logger.info("Enviando CV para análise com OpenAI")
         response = client.chat.completions.create(
-            model="gpt-4",  # ou outro modelo como "gpt-3.5-turbo"
+            model=ANALYSIS_MODELS['openai'],
             messages=[
                 {"role": "system", "content": "Você é um assistente especializado em análise de currículos."},
                 {"role": "user", "content": prompt}
@@ -402,7 +492,7 @@ def analyze_with_openai(text, form_data):
         logger.error(traceback.format_exc())
         return {"error": f"Erro durante a análise com OpenAI: {str(e)}"}
 
-def analyze_with_claude(text, form_data):
+def analyze_with_claude(text, form_data, prompt=None):
     """
     Analisa o CV usando a API do Anthropic Claude.
     """
@@ -419,12 +509,13 @@ def analyze_with_claude(text, form_data):
         client = Anthropic(api_key=api_key)
         
         # Gerar o prompt para análise
-        prompt = get_prompt(text, form_data)
+        if prompt is None:
+            prompt = get_prompt(text, form_data)
         
         # Enviar para análise usando a API de Completions
         logger.info("Enviando CV para análise com Claude")
         response = client.completions.create(
-            model="claude-2",  # Usando modelo Claude 2 que é compatível com a API antiga
+            model=ANALYSIS_MODELS['claude'],  # Claude 2, compatível com a API de completions
             max_tokens_to_sample=1500,
             temperature=0.2,
             prompt=f"\n\nHuman: {prompt}\n\nAssistant:"
@@ -443,7 +534,7 @@ def analyze_with_claude(text, form_data):
         logger.error(traceback.format_exc())
         return {"error": f"Erro na análise com Claude: {error_msg}"}
 
-def analyze_with_deepseek(text, form_data):
+def analyze_with_deepseek(text, form_data, prompt=None):
     """
     Analisa o CV usando a API do DeepSeek via chamadas HTTP diretas.
     """
@@ -457,7 +548,8 @@ def analyze_with_deepseek(text, form_data):
             return {"error": "Chave API do DeepSeek não configurada"}
         
         # Gerar o prompt para análise
-        prompt = get_prompt(text, form_data)
+        if prompt is None:
+            prompt = get_prompt(text, form_data)
         
         # Configurar cabeçalhos e payload para a API DeepSeek
         headers = {
@@ -466,7 +558,7 @@ def analyze_with_deepseek(text, form_data):
         }
         
         payload = {
-            "model": "deepseek-chat",
+            "model": ANALYSIS_MODELS['deepseek'],
             "messages": [
                 {"role": "user", "content": prompt}
             ],
@@ -764,7 +856,7 @@ def validate_with_openai_file(file_path, custom_prompt=None):
         # Preparar prompt
         if custom_prompt:
             try:
-                prompt = custom_prompt.format(text=text[:2000] + "...")
+                prompt = compile_prompt(custom_prompt).render(text=text[:2000] + "...")
             except:
                 prompt = f"Analise o seguinte texto de um arquivo e determine se é um currículo válido:\n\n{text[:2000]}..."
         else:
@@ -804,9 +896,9 @@ def validate_with_claude_file(file_path, custom_prompt=None):
             return {"error": "Arquivo muito pequeno ou sem texto"}
         
         # Preparar prompt - sempre usar formato específico para Claude
-        if custom_prompt and '{text}' in custom_prompt:
+        if custom_prompt and 'text' in compile_prompt(custom_prompt).fields:
             try:
-                prompt = custom_prompt.format(text=text[:2000] + "...")
+                prompt = compile_prompt(custom_prompt).render(text=text[:2000] + "...")
             except:
                 prompt = f"Analise o seguinte texto extraído de um arquivo e determine se é um currículo válido:\n\n{text[:2000]}..."
         else:
@@ -846,7 +938,7 @@ def validate_with_deepseek_file(file_path, custom_prompt=None):
         # Preparar prompt
         if custom_prompt:
             try:
-                prompt = custom_prompt.format(text=text[:2000] + "...")
+                prompt = compile_prompt(custom_prompt).render(text=text[:2000] + "...")
             except:
                 prompt = f"Analise o seguinte texto de um arquivo e determine se é um currículo válido:\n\n{text[:2000]}..."
         else:
@@ -0,0 +1,402 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import random
+import threading
+import logging
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.process_lock import ProcessFileLock
+
+logger = logging.getLogger('formulario_culsen.job_queue')
+
+# Estados de um trabalho
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_RETRYING = 'retrying'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+class JobQueue:
+    """
+    Fila persistente de trabalhos em várias etapas, executados por um conjunto de workers.
+
+    Cada trabalho é um arquivo JSON (gravado com fsync e rename atómico) com os
+    dados partilhados pelas etapas, a etapa atual e as etapas concluídas. O
+    arquivo é regravado no fim de cada etapa, pelo que uma repetição (ou um
+    reinício do processo) retoma a partir da etapa que falhou. Um lock de
+    arquivo por trabalho impede que dois processos (ex: workers do gunicorn)
+    executem o mesmo trabalho.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Dict[str, Any]], Any]]],
+                 jobs_dir: str = None,
+                 workers: int = 4,
+                 max_attempts: int = 3,
+                 max_backoff: float = 60.0,
+                 retention: float = 7 * 86400,
+                 on_finish: Callable[[Dict[str, Any]], Any] = None,
+                 best_effort: List[str] = ()):
+        """
+        Inicializa a fila
+
+        Args:
+            stages: Lista (nome, função) das etapas; cada função recebe o trabalho e altera job['data']
+            jobs_dir: Diretório dos trabalhos (por omissão, variável JOB_QUEUE_DIR ou 'jobs' na raiz do projeto)
+            workers: Número de threads que executam trabalhos em paralelo
+            max_attempts: Tentativas por etapa antes de o trabalho falhar
+            max_backoff: Tempo máximo de espera entre tentativas, em segundos
+            retention: Segundos durante os quais trabalhos terminados ficam consultáveis
+            on_finish: Função chamada com o trabalho quando termina (com sucesso ou falha)
+            best_effort: Etapas que, esgotadas as tentativas, são ignoradas em vez de fazer falhar o trabalho
+        """
+        if jobs_dir is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            jobs_dir = os.environ.get('JOB_QUEUE_DIR') or os.path.join(current_dir, 'jobs')
+
+        self.jobs_dir = jobs_dir
+        self.stages = stages
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self.on_finish = on_finish
+        self.best_effort = set(best_effort)
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._timers = set()
+        self._last_purge = 0.0
+
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'retries': 0,
+            'recovered': 0,
+        }
+
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    # ----- Persistência -----
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _job_lock(self, job_id: str) -> ProcessFileLock:
+        return ProcessFileLock(os.path.join(self.jobs_dir, f"{job_id}.lock"))
+
+    def _save(self, job: Dict[str, Any]):
+        """Grava o trabalho de forma atómica"""
+        job['updated_at'] = time.time()
+        path = self._job_path(job['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Lê um trabalho do disco (None se não existir ou estiver corrompido)"""
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Erro ao ler trabalho {job_id}: {str(e)}")
+            return None
+
+    def _recover(self):
+        """Volta a pôr na fila os trabalhos não terminados (ex: após um reinício)"""
+        recovered = 0
+        now = time.time()
+        for filename in os.listdir(self.jobs_dir):
+            if not filename.endswith('.json'):
+                continue
+            job = self._load(filename[:-5])
+            if job is None or job['status'] in FINISHED_STATUSES:
+                continue
+
+            # Uma repetição ainda em espera mantém o seu atraso (o temporizador pode ser de outro processo)
+            retry_delay = self._retry_delay(job, now)
+            if retry_delay > 0:
+                self._schedule_retry(job['id'], retry_delay)
+            else:
+                self._queue.put(job['id'])
+            recovered += 1
+
+        if recovered:
+            self._stats['recovered'] += recovered
+            logger.info(f"Recuperados {recovered} trabalhos pendentes")
+
+    def _purge_finished(self):
+        """Remove os trabalhos terminados há mais tempo do que a retenção"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < 3600:
+                return
+            self._last_purge = now
+
+        removed = 0
+        for filename in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, filename)
+            if filename.endswith('.tmp'):
+                # Escrita interrompida
+                try:
+                    if now - os.path.getmtime(path) > 3600:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not filename.endswith('.json'):
+                continue
+            job = self._load(filename[:-5])
+            if job is not None and job['status'] in FINISHED_STATUSES and now - job['updated_at'] > self.retention:
+                for stale in (path, os.path.join(self.jobs_dir, f"{job['id']}.lock")):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                removed += 1
+
+        if removed:
+            logger.info(f"Removidos {removed} trabalhos terminados")
+
+    # ----- API pública -----
+
+    def submit(self, data: Dict[str, Any], job_id: str = None) -> str:
+        """
+        Grava um novo trabalho e coloca-o na fila; retorna de imediato
+
+        Args:
+            data: Dados do trabalho (serializáveis em JSON), partilhados pelas etapas
+            job_id: Identificador a usar (por omissão, um UUID gerado)
+
+        Returns:
+            Identificador do trabalho
+        """
+        now = time.time()
+        job = {
+            'id': job_id or uuid.uuid4().hex,
+            'status': STATUS_QUEUED,
+            'stage': self.stages[0][0],
+            'completed_stages': [],
+            'attempts': 0,
+            'error': None,
+            'data': data,
+            'created_at': now,
+        }
+        self._save(job)
+
+        with self._lock:
+            self._stats['submitted'] += 1
+
+        self.start()
+        self._queue.put(job['id'])
+        logger.info(f"Trabalho {job['id']} colocado na fila")
+        return job['id']
+
+    def get_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtém o progresso de um trabalho (lido do disco: serve qualquer processo)
+
+        Args:
+            job_id: Identificador do trabalho
+
+        Returns:
+            Dicionário com estado, etapa, progresso e resultado, ou None se não existir
+        """
+        # O identificador vem do URL: só nomes simples, sem caminhos
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', job_id or ''):
+            return None
+
+        job = self._load(job_id)
+        if job is None:
+            return None
+
+        return {
+            'job_id': job['id'],
+            'status': job['status'],
+            'stage': job['stage'],
+            'stages': [name for name, _ in self.stages],
+            'completed_stages': job['completed_stages'],
+            'skipped_stages': job.get('skipped_stages', []),
+            'progress': round((len(job['completed_stages']) + len(job.get('skipped_stages', []))) / len(self.stages), 2),
+            'attempts': job['attempts'],
+            'error': job['error'],
+            'result': job['data'].get('result'),
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+        }
+
+    def start(self):
+        """Inicia os workers (e recupera trabalhos pendentes), se ainda não estiverem ativos"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+        self._recover()
+        logger.info(f"Fila de trabalhos iniciada com {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        """Pede aos workers para terminar após o trabalho corrente"""
+        self._stop.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+            for timer in self._timers:
+                timer.cancel()
+            self._timers.clear()
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas da fila"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = self.workers
+            stats['running'] = bool(self._threads)
+            stats['waiting_retry'] = len(self._timers)
+        stats['queued'] = self._queue.qsize()
+        stats['jobs_dir'] = self.jobs_dir
+        return stats
+
+    # ----- Execução -----
+
+    @staticmethod
+    def _retry_delay(job: Dict[str, Any], now: float) -> float:
+        """Segundos que faltam até à próxima tentativa de um trabalho em espera (0 se já pode correr)"""
+        if job['status'] != STATUS_RETRYING:
+            return 0.0
+        return max(job.get('retry_at', 0) - now, 0.0)
+
+    def _schedule_retry(self, job_id: str, delay: float):
+        """Volta a pôr o trabalho na fila após o atraso, sem ocupar um worker"""
+        def _requeue():
+            with self._lock:
+                self._timers.discard(timer)
+            if not self._stop.is_set():
+                self._queue.put(job_id)
+
+        timer = threading.Timer(delay, _requeue)
+        timer.daemon = True
+        with self._lock:
+            self._timers.add(timer)
+        timer.start()
+
+    def _worker(self):
+        """Ciclo de um worker"""
+        while not self._stop.is_set():
+            try:
+                job_id = self._queue.get(timeout=60)
+            except queue.Empty:
+                self._purge_finished()
+                continue
+            if job_id is None:
+                break
+
+            lock = self._job_lock(job_id)
+            if not lock.acquire(timeout=0):
+                # Já em execução noutro processo
+                continue
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"Erro inesperado no trabalho {job_id}: {str(e)}")
+                logger.error(traceback.format_exc())
+            finally:
+                lock.release()
+
+    def _run_job(self, job_id: str):
+        """Executa as etapas em falta de um trabalho (chamar com o lock do trabalho)"""
+        # Reler do disco: outro processo pode ter avançado ou terminado o trabalho
+        job = self._load(job_id)
+        if job is None or job['status'] in FINISHED_STATUSES:
+            return
+
+        # Acordado antes do tempo (ex: por outro processo): esperar pelo resto do atraso
+        retry_delay = self._retry_delay(job, time.time())
+        if retry_delay > 0:
+            self._schedule_retry(job_id, retry_delay)
+            return
+
+        for name, function in self.stages:
+            if name in job['completed_stages'] or name in job.get('skipped_stages', ()):
+                continue
+
+            job['status'] = STATUS_RUNNING
+            job['stage'] = name
+            job['attempts'] += 1
+            self._save(job)
+
+            try:
+                logger.info(f"Trabalho {job_id}: etapa '{name}' (tentativa {job['attempts']})")
+                function(job)
+            except Exception as e:
+                logger.error(f"Trabalho {job_id}: erro na etapa '{name}': {str(e)}")
+                logger.error(traceback.format_exc())
+                job['error'] = f"{name}: {str(e)}"
+
+                if job['attempts'] < self.max_attempts:
+                    delay = min(2 ** job['attempts'], self.max_backoff) * (0.5 + random.random())
+                    job['status'] = STATUS_RETRYING
+                    job['retry_at'] = time.time() + delay
+                    self._save(job)
+                    with self._lock:
+                        self._stats['retries'] += 1
+                    logger.warning(f"Trabalho {job_id}: nova tentativa da etapa '{name}' em {delay:.1f}s")
+                    self._schedule_retry(job_id, delay)
+                    return
+
+                if name in self.best_effort:
+                    # Etapa opcional: o trabalho continua sem ela
+                    logger.warning(f"Trabalho {job_id}: etapa '{name}' ignorada após {job['attempts']} tentativas")
+                    job.setdefault('skipped_stages', []).append(name)
+                    job['attempts'] = 0
+                    self._save(job)
+                    continue
+
+                job['status'] = STATUS_FAILED
+                self._save(job)
+                with self._lock:
+                    self._stats['failed'] += 1
+                self._finish(job)
+                return
+
+            job['completed_stages'].append(name)
+            job['attempts'] = 0
+            job['error'] = None
+            self._save(job)
+
+        job['status'] = STATUS_DONE
+        self._save(job)
+        with self._lock:
+            self._stats['completed'] += 1
+        logger.info(f"Trabalho {job_id} concluído")
+        self._finish(job)
+
+    def _finish(self, job: Dict[str, Any]):
+        """Chama on_finish sem deixar que um erro aí afete o worker"""
+        if self.on_finish is None:
+            return
+        try:
+            self.on_finish(job)
+        except Exception as e:
+            logger.warning(f"Erro ao finalizar trabalho {job['id']}: {str(e)}")
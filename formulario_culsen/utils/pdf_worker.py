@@ -0,0 +1,194 @@
+"""
+Código executado nos processos de extração de PDF (ver utils.extraction_service).
+
+Mantido num módulo leve, sem dependências da aplicação, para que os processos
+do pool só carreguem o necessário para extrair texto. Os backends de
+extração disponíveis dependem das bibliotecas de PDF instaladas.
+
+Cada processo é um interpretador novo que executa serve(): lê pedidos
+(módulo, função, argumentos) do stdin e escreve as respostas no stdout,
+em mensagens pickle precedidas do tamanho.
+"""
+
+import os
+import sys
+import pickle
+import struct
+import importlib
+import logging
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+# resource só existe em sistemas POSIX; sem ele o limite de memória não é aplicado
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Backends de extração: cada um só fica disponível se a biblioteca estiver instalada
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+try:
+    import pdfplumber
+except ImportError:
+    pdfplumber = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+DEFAULT_BACKEND = 'pypdf2'
+
+logger = logging.getLogger('formulario_culsen.pdf_worker')
+
+def _address_space_size() -> int:
+    """Tamanho atual do espaço de endereçamento do processo, em bytes (0 se desconhecido)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def init_worker(memory_limit_mb: int = 0):
+    """
+    Inicializa um processo de extração
+
+    Args:
+        memory_limit_mb: Memória que o processo pode alocar além da que já usa ao arrancar, em MB (0 = sem limite)
+    """
+    # Desativar logs muito detalhados durante o processamento
+    logging.getLogger("pdfminer").setLevel(logging.ERROR)
+    logging.getLogger("pdfplumber").setLevel(logging.WARNING)
+
+    if memory_limit_mb and resource is not None:
+        # O limite conta a partir do interpretador e das bibliotecas já carregados
+        limit = _address_space_size() + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _pypdf2_pages(pdf_path: str) -> List[str]:
+    with open(pdf_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+
+def _pdfplumber_pages(pdf_path: str) -> List[str]:
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            pages.append(page.extract_text() or "")
+            # Libertar os objetos da página já processada
+            page.flush_cache()
+    return pages
+
+def _pypdfium2_pages(pdf_path: str) -> List[str]:
+    pages = []
+    pdf = pypdfium2.PdfDocument(pdf_path)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            text_page = page.get_textpage()
+            pages.append(text_page.get_text_range() or "")
+            text_page.close()
+            page.close()
+    finally:
+        pdf.close()
+    return pages
+
+# Backend -> função que devolve o texto de cada página
+BACKENDS: Dict[str, Callable[[str], List[str]]] = {}
+if PyPDF2 is not None:
+    BACKENDS['pypdf2'] = _pypdf2_pages
+if pdfplumber is not None:
+    BACKENDS['pdfplumber'] = _pdfplumber_pages
+if pypdfium2 is not None:
+    BACKENDS['pypdfium2'] = _pypdfium2_pages
+
+def available_backends() -> List[str]:
+    """Lista os backends de extração disponíveis neste ambiente"""
+    return list(BACKENDS)
+
+def resolve_backend(name: str) -> str:
+    """
+    Valida o nome de um backend
+
+    Args:
+        name: Nome do backend (ex: 'pypdf2', 'pdfplumber', 'pypdfium2')
+
+    Returns:
+        O próprio nome, ou o backend por omissão se não estiver disponível
+    """
+    name = (name or DEFAULT_BACKEND).lower()
+    if name not in BACKENDS:
+        logger.warning(f"Backend de extração '{name}' indisponível; a usar {DEFAULT_BACKEND}")
+        return DEFAULT_BACKEND
+    return name
+
+def extract_pdf_pages(pdf_path: str, backend: str = DEFAULT_BACKEND) -> List[str]:
+    """
+    Extrai o texto de cada página de um PDF
+
+    Args:
+        pdf_path: Caminho do PDF
+        backend: Backend de extração (ver available_backends)
+
+    Raises:
+        Exception: Se o PDF for inválido (MemoryError se exceder o limite de memória)
+    """
+    return BACKENDS[backend](pdf_path)
+
+# ----- Protocolo com o processo principal -----
+
+_HEADER = struct.Struct('>I')
+
+def write_message(stream: BinaryIO, message: Any):
+    """Escreve uma mensagem (pickle precedido do tamanho) e esvazia o buffer"""
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+def read_message(stream: BinaryIO) -> Optional[Any]:
+    """Lê uma mensagem; retorna None se o outro lado fechou o canal"""
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    size = _HEADER.unpack(header)[0]
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return pickle.loads(data)
+
+def _error_response(error: BaseException):
+    """Resposta de erro; exceções que não se serializam passam a RuntimeError com a mesma mensagem"""
+    try:
+        pickle.dumps(error)
+        return (False, error)
+    except Exception:
+        return (False, RuntimeError(f"{type(error).__name__}: {error}"))
+
+def serve(memory_limit_mb: int = 0):
+    """
+    Ciclo de um processo de extração, até o processo principal fechar o stdin
+
+    Args:
+        memory_limit_mb: Ver init_worker
+    """
+    # O stdout fica reservado ao protocolo: o que as bibliotecas escreverem vai para o stderr
+    requests = sys.stdin.buffer
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    init_worker(memory_limit_mb)
+
+    while True:
+        request = read_message(requests)
+        if request is None:
+            return
+        module_name, function_name, args = request
+        try:
+            function = getattr(importlib.import_module(module_name), function_name)
+            response = (True, function(*args))
+        except Exception as e:
+            response = _error_response(e)
+        write_message(responses, response)
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+import logging
+from typing import Optional
+
+logger = logging.getLogger('formulario_culsen.process_lock')
+
+# fcntl só existe em sistemas POSIX; no Windows os locks ficam limitados ao processo
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def process_locks_available() -> bool:
+    """Indica se é possível sincronizar processos com locks de arquivo (fcntl)"""
+    return fcntl is not None
+
+class ProcessFileLock:
+    """
+    Lock exclusivo entre threads e entre processos (ex: workers do gunicorn).
+
+    Combina um threading.Lock com flock() num arquivo de lock partilhado. Sem
+    fcntl (Windows) ou com enabled=False comporta-se como um lock entre threads.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, poll_interval: float = 0.05):
+        """
+        Inicializa o lock
+
+        Args:
+            path: Caminho do arquivo de lock (criado se não existir)
+            enabled: Se False, não sincroniza com outros processos
+            poll_interval: Intervalo entre tentativas quando há timeout
+        """
+        self.path = path
+        self.enabled = enabled and fcntl is not None
+        self.poll_interval = poll_interval
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Obtém o lock
+
+        Args:
+            timeout: Tempo máximo de espera em segundos (None = sem limite)
+
+        Returns:
+            True se obteve o lock, False se o tempo de espera foi excedido
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._thread_lock.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        if not self.enabled:
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            self._thread_lock.release()
+            raise
+
+        try:
+            if deadline is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            os.close(fd)
+                            self._thread_lock.release()
+                            return False
+                        time.sleep(self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+
+        self._fd = fd
+        return True
+
+    def release(self):
+        """Liberta o lock"""
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+
+    def forget(self):
+        """
+        Descarta um lock herdado de um fork sem o libertar
+
+        O flock pertence à descrição de arquivo partilhada com o processo pai:
+        fechar a cópia do descritor neste processo mantém o lock do pai.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
@@ -0,0 +1,87 @@
+import hashlib
+import string
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('formulario_culsen.prompt_templates')
+
+class PromptTemplate:
+    """
+    Prompt pré-processada uma única vez (equivalente a str.format).
+
+    O texto é decomposto em literais e campos no momento da compilação, pelo
+    que cada análise só faz a junção final. O hash identifica a versão da
+    prompt usada em cada análise.
+    """
+
+    def __init__(self, text: str):
+        """
+        Compila a prompt
+
+        Args:
+            text: Texto da prompt com campos no formato de str.format (ex: {nome})
+        """
+        self.text = text
+        self.hash = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        self.error = None
+        self._parts: List[Tuple[str, Optional[str], str, Optional[str]]] = []
+
+        try:
+            self._parts = list(string.Formatter().parse(text))
+        except ValueError as e:
+            # Chavetas desemparelhadas: a prompt não pode ser formatada
+            self.error = str(e)
+            logger.warning(f"Prompt {self.hash} inválida: {self.error}")
+
+        self.fields = {field for _, field, _, _ in self._parts if field}
+
+    def __str__(self) -> str:
+        return self.text
+
+    def render(self, **values: Any) -> str:
+        """
+        Preenche a prompt com os valores dados
+
+        Raises:
+            ValueError: Se a prompt for inválida
+            KeyError: Se faltar o valor de algum campo
+        """
+        if self.error:
+            raise ValueError(self.error)
+
+        if all(not spec and not conversion and (field is None or field in values)
+               for _, field, spec, conversion in self._parts):
+            # Caso comum: apenas campos simples, sem formatação
+            return ''.join(
+                literal + (str(values[field]) if field is not None else '')
+                for literal, field, _, _ in self._parts
+            )
+
+        return self.text.format(**values)
+
+
+_templates: Dict[str, PromptTemplate] = {}
+_templates_lock = threading.Lock()
+
+def compile_prompt(text: str) -> PromptTemplate:
+    """
+    Obtém a prompt compilada para o texto dado, compilando-a só na primeira vez
+
+    Args:
+        text: Texto da prompt
+
+    Returns:
+        PromptTemplate partilhado para este texto
+    """
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            # Poucas versões de prompt em uso; descartar as antigas se crescer
+            if len(_templates) >= 32:
+                _templates.clear()
+            template = PromptTemplate(text)
+            _templates[key] = template
+            logger.info(f"Prompt compilada (versão {template.hash}, campos: {sorted(template.fields)})")
+        return template
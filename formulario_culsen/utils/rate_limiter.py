@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import random
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+from utils.process_lock import ProcessFileLock, process_locks_available
+
+logger = logging.getLogger('formulario_culsen.rate_limiter')
+
+# Classes de prioridade (menor valor = mais prioritário)
+PRIORITY_WRITE = 0        # Escritas de candidatos (submissões, análises)
+PRIORITY_READ = 1         # Leituras interativas (páginas, formulários)
+PRIORITY_BACKGROUND = 2   # Refresh de cache pelo admin, sincronização da réplica
+
+PRIORITY_NAMES = {
+    PRIORITY_WRITE: 'write',
+    PRIORITY_READ: 'read',
+    PRIORITY_BACKGROUND: 'background',
+}
+
+# Quotas por utilizador: Sheets 60 pedidos/min; Drive 12000 pedidos/min.
+# Taxa + capacidade escolhidas para nunca passar a quota numa janela de 60s
+# (capacidade + taxa * 60 <= quota).
+DEFAULT_BUCKETS = {
+    'sheets': {'per_minute': 54, 'capacity': 6},
+    'drive': {'per_minute': 600, 'capacity': 20},
+}
+
+class TokenBucket:
+    """
+    Token bucket com classes de prioridade.
+
+    Cada classe abaixo da mais prioritária deixa uma reserva de tokens livre,
+    e nunca consome tokens enquanto houver pedidos mais prioritários à espera.
+
+    Com state_path, os tokens vivem num arquivo partilhado (sob lock entre
+    processos), para que todos os workers do gunicorn consumam do mesmo bucket
+    em vez de cada um ter a quota inteira.
+    """
+
+    def __init__(self, per_minute: float, capacity: int, reserve: Dict[int, float] = None,
+                 state_path: str = None):
+        """
+        Inicializa o bucket
+
+        Args:
+            per_minute: Tokens repostos por minuto
+            capacity: Número máximo de tokens acumulados (rajada)
+            reserve: Prioridade -> fração da capacidade que essa classe não pode usar
+            state_path: Arquivo com o estado partilhado entre processos (None = só neste processo)
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = capacity
+        self.reserve = reserve or {PRIORITY_WRITE: 0.0, PRIORITY_READ: 0.2, PRIORITY_BACKGROUND: 0.5}
+        self.state_path = state_path
+        self._state_lock = ProcessFileLock(f"{state_path}.lock") if state_path else None
+        # O relógio monotónico não é comparável entre processos
+        self._clock = time.time if state_path else time.monotonic
+        self._tokens = float(capacity)
+        self._updated = self._clock()
+        self._condition = threading.Condition()
+        self._waiting = {priority: 0 for priority in PRIORITY_NAMES}
+
+    def _load_state(self):
+        """Lê os tokens do arquivo partilhado (sem arquivo, o bucket começa cheio)"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self._tokens = float(state['tokens'])
+            self._updated = float(state['updated'])
+        except FileNotFoundError:
+            self._tokens = float(self.capacity)
+            self._updated = self._clock()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Estado do limitador ilegível em {self.state_path}: {str(e)}")
+
+    def _store_state(self):
+        """Grava os tokens no arquivo partilhado"""
+        try:
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump({'tokens': self._tokens, 'updated': self._updated}, f)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o estado do limitador em {self.state_path}: {str(e)}")
+
+    def _update(self, reserve: float = None) -> bool:
+        """
+        Repõe os tokens e, se reserve não for None, tenta consumir um deixando essa reserva livre
+
+        Args:
+            reserve: Tokens que têm de ficar livres depois do consumo (None = não consumir)
+
+        Returns:
+            True se consumiu um token
+        """
+        if self._state_lock is None:
+            return self._refill_and_take(reserve)
+
+        with self._state_lock:
+            self._load_state()
+            taken = self._refill_and_take(reserve)
+            self._store_state()
+            return taken
+
+    def _refill_and_take(self, reserve: float = None) -> bool:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + max(now - self._updated, 0.0) * self.rate)
+        self._updated = now
+        if reserve is not None and self._tokens - reserve >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def acquire(self, priority: int = PRIORITY_READ, timeout: float = None) -> float:
+        """
+        Obtém um token, esperando se necessário
+
+        Args:
+            priority: Classe de prioridade do pedido
+            timeout: Tempo máximo de espera em segundos (None = sem limite)
+
+        Returns:
+            Segundos esperados
+
+        Raises:
+            TimeoutError: Se não houver token disponível dentro do timeout
+        """
+        start = time.monotonic()
+        reserve = self.capacity * self.reserve.get(priority, 0.0)
+
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    higher_waiting = any(self._waiting[p] for p in self._waiting if p < priority)
+
+                    if self._update(None if higher_waiting else reserve):
+                        return time.monotonic() - start
+
+                    # Tempo até haver token suficiente para esta classe
+                    delay = max((1 + reserve - self._tokens) / self.rate, 0.01)
+                    if timeout is not None:
+                        remaining = timeout - (time.monotonic() - start)
+                        if remaining <= 0:
+                            raise TimeoutError("Quota da API esgotada: tempo de espera excedido")
+                        delay = min(delay, remaining)
+                    self._condition.wait(delay)
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def available(self) -> float:
+        """Tokens disponíveis neste momento"""
+        with self._condition:
+            self._update()
+            return self._tokens
+
+
+class GoogleApiLimiter:
+    """
+    Limitador partilhado para todos os pedidos às APIs Google (Sheets e Drive).
+
+    Cada chamada passa por um token bucket do serviço. Erros de quota (429)
+    são repetidos com backoff exponencial com jitter, curto, porque correm na
+    thread do pedido; erros de servidor (5xx) só em pedidos idempotentes
+    (leituras), já que uma escrita pode ter sido aplicada antes do erro — a
+    repetição de escritas fica a cargo da fila de submissões.
+    A prioridade é definida por thread com o gestor de contexto `priority`.
+
+    Os buckets são partilhados entre processos através de state_dir; sem
+    locks de arquivo, a taxa é dividida pelo número de processos.
+    """
+
+    def __init__(self, buckets: Dict[str, Dict[str, float]] = None,
+                 max_retries: int = 3,
+                 base_delay: float = 0.5,
+                 max_delay: float = 4.0,
+                 acquire_timeout: float = 120.0,
+                 state_dir: str = None,
+                 processes: int = 1):
+        """
+        Inicializa o limitador
+
+        Args:
+            buckets: Serviço -> {'per_minute', 'capacity'}
+            max_retries: Número máximo de repetições após erro de quota/servidor
+            base_delay: Espera inicial do backoff, em segundos
+            max_delay: Espera máxima do backoff, em segundos
+            acquire_timeout: Tempo máximo de espera por um token
+            state_dir: Diretório do estado dos buckets partilhado entre processos (None = por processo)
+            processes: Processos que partilham a quota, quando o estado não é partilhado
+        """
+        shared = state_dir is not None and process_locks_available()
+        if shared:
+            os.makedirs(state_dir, exist_ok=True)
+            processes = 1
+        processes = max(int(processes), 1)
+
+        self.buckets = {
+            service: TokenBucket(
+                config['per_minute'] / processes,
+                max(int(config['capacity'] // processes), 1),
+                state_path=os.path.join(state_dir, f"{service}.bucket") if shared else None
+            )
+            for service, config in (buckets or DEFAULT_BUCKETS).items()
+        }
+        self.shared = shared
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.acquire_timeout = acquire_timeout
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {
+            service: {
+                'calls': 0,
+                'throttled': 0,
+                'wait_seconds': 0.0,
+                'retries': 0,
+                'failures': 0,
+                'by_priority': {name: 0 for name in PRIORITY_NAMES.values()},
+            }
+            for service in self.buckets
+        }
+
+    # ----- Prioridade -----
+
+    def current_priority(self) -> int:
+        """Prioridade em vigor na thread atual"""
+        return getattr(self._local, 'priority', PRIORITY_READ)
+
+    @contextmanager
+    def priority(self, priority: int):
+        """Define a prioridade dos pedidos feitos dentro do bloco, nesta thread"""
+        previous = self.current_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    # ----- Chamadas -----
+
+    @staticmethod
+    def _status_code(error: Exception):
+        """Extrai o código HTTP de erros do gspread, googleapiclient ou requests"""
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        if status is None:
+            # googleapiclient.errors.HttpError: resp.status
+            resp = getattr(error, 'resp', None)
+            status = getattr(resp, 'status', None)
+        try:
+            return int(status) if status is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def is_retryable(cls, error: Exception, idempotent: bool = True) -> bool:
+        """
+        Indica se o erro pode ser repetido
+
+        Args:
+            error: Erro do pedido
+            idempotent: Se o pedido pode ser repetido sem efeitos duplicados
+
+        Returns:
+            True para quota (429) e, em pedidos idempotentes, erros de servidor (5xx)
+        """
+        status = cls._status_code(error)
+        if status is None:
+            return False
+        return status == 429 or (idempotent and status >= 500)
+
+    def call(self, service: str, function: Callable, *args, idempotent: bool = False, **kwargs) -> Any:
+        """
+        Executa uma chamada à API respeitando a quota do serviço
+
+        Args:
+            service: Nome do bucket ('sheets' ou 'drive')
+            function: Função que faz o pedido
+            *args, **kwargs: Argumentos da função
+            idempotent: Se True, erros de servidor (5xx) também são repetidos
+
+        Returns:
+            Resultado da função
+        """
+        bucket = self.buckets[service]
+        stats = self._stats[service]
+        priority = self.current_priority()
+        attempt = 0
+
+        while True:
+            waited = bucket.acquire(priority, timeout=self.acquire_timeout)
+            with self._lock:
+                stats['calls'] += 1
+                stats['by_priority'][PRIORITY_NAMES[priority]] += 1
+                if waited > 0.001:
+                    stats['throttled'] += 1
+                    stats['wait_seconds'] += waited
+
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                retryable = self.is_retryable(e, idempotent)
+                if not retryable or attempt >= self.max_retries:
+                    if retryable:
+                        with self._lock:
+                            stats['failures'] += 1
+                    raise
+
+                delay = min(self.base_delay * (2 ** attempt), self.max_delay) * (0.5 + random.random())
+                attempt += 1
+                with self._lock:
+                    stats['retries'] += 1
+                logger.warning(f"Erro {self._status_code(e)} da API {service}; tentativa {attempt}/{self.max_retries} em {delay:.1f}s")
+                time.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna os contadores por serviço"""
+        with self._lock:
+            stats = {
+                service: dict(values, by_priority=dict(values['by_priority']), wait_seconds=round(values['wait_seconds'], 2))
+                for service, values in self._stats.items()
+            }
+        for service, bucket in self.buckets.items():
+            stats[service]['tokens_available'] = round(bucket.available(), 2)
+            stats[service]['shared'] = self.shared
+        return stats
+
+# Instância global do limitador (estado partilhado pelos workers da mesma máquina)
+google_api_limiter = GoogleApiLimiter(
+    state_dir=os.environ.get('RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'formulario_culsen_ratelimit')),
+    processes=int(os.environ.get('WEB_CONCURRENCY', '1'))
+)
@@ -0,0 +1,530 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+import contextlib
+from typing import Any, Callable, Dict, List, Optional
+
+import gspread
+
+logger = logging.getLogger('formulario_culsen.sheet_replica')
+
+class SheetReplica:
+    """
+    Réplica local (SQLite) de abas da planilha, mantida por sincronização incremental.
+
+    Cada aba é guardada linha a linha, indexada por (aba, número da linha), com um hash
+    do conteúdo para só reescrever linhas que mudaram. Uma thread de fundo sincroniza:
+    - nada, se a planilha não foi modificada desde a última sincronização (Drive modifiedTime);
+    - as abas pequenas (configuração) por inteiro, num único batchGet;
+    - apenas as linhas novas (cauda) e as linhas marcadas como alteradas da aba de respostas;
+    - a aba de respostas por inteiro quando a planilha mudou desde a última leitura completa
+      (no máximo a cada verify_interval), para apanhar edições e remoções de linhas
+      existentes, e de qualquer forma a cada full_sync_interval.
+
+    As marcas de linhas alteradas ficam na base de dados, visíveis a todos os
+    processos, com um número de geração: uma sincronização só apaga as marcas
+    que leu, e não as feitas entretanto.
+    """
+
+    RESPONSES = 'responses'
+
+    def __init__(self, spreadsheet_provider: Callable[[], Any],
+                 tabs: Dict[str, List[Optional[str]]],
+                 db_path: str = None,
+                 sync_interval: int = 60,
+                 full_sync_interval: int = 1800,
+                 verify_interval: int = 120,
+                 max_staleness: int = 900,
+                 enabled: bool = True,
+                 sync_context: Callable[[], Any] = None,
+                 worksheets_provider: Callable[[], List[Any]] = None,
+                 on_change: Callable[[str, Optional[set]], Any] = None):
+        """
+        Inicializa a réplica
+
+        Args:
+            spreadsheet_provider: Função que devolve o handle da planilha
+            tabs: Nome lógico -> títulos candidatos (o primeiro existente é usado; None = primeira aba)
+            db_path: Caminho da base de dados SQLite (por omissão, variável SHEETS_REPLICA_PATH ou
+                'replica/sheets.db' na raiz do projeto)
+            sync_interval: Intervalo entre sincronizações, em segundos
+            full_sync_interval: Intervalo entre reconciliações completas da aba de respostas
+            verify_interval: Intervalo mínimo entre leituras completas da aba de respostas motivadas
+                por alterações na planilha (edições de linhas existentes ficam visíveis neste prazo)
+            max_staleness: Idade máxima (segundos) para servir leituras a partir da réplica
+            enabled: Se False, a réplica nunca serve leituras nem sincroniza
+            sync_context: Fábrica de gestor de contexto aplicado a cada sincronização (ex: prioridade de quota)
+            worksheets_provider: Função que devolve as abas atuais, com dimensões (por omissão, spreadsheet.worksheets())
+            on_change: Função chamada, para cada aba cujo conteúdo mudou numa sincronização, com o nome
+                lógico e os números das linhas alteradas (None se houve linhas removidas)
+        """
+        if db_path is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            db_path = os.environ.get('SHEETS_REPLICA_PATH') or os.path.join(current_dir, 'replica', 'sheets.db')
+
+        self.db_path = db_path
+        self.spreadsheet_provider = spreadsheet_provider
+        self.tabs = tabs
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.verify_interval = verify_interval
+        self.max_staleness = max_staleness
+        self.enabled = enabled
+        self.sync_context = sync_context or contextlib.nullcontext
+        self.worksheets_provider = worksheets_provider
+        self.on_change = on_change
+
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        self._stats = {
+            'syncs': 0,
+            'skipped_syncs': 0,
+            'rows_written': 0,
+            'errors': 0,
+            'last_error': None,
+        }
+
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._init_schema()
+            logger.info(f"Réplica SQLite inicializada em: {self.db_path}")
+
+    # ----- Base de dados -----
+
+    def _connection(self) -> sqlite3.Connection:
+        """Uma conexão por thread (WAL permite leitores concorrentes com um escritor)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tabs (
+                    name TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    row_count INTEGER NOT NULL DEFAULT 0,
+                    synced_at REAL NOT NULL DEFAULT 0,
+                    full_synced_at REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rows (
+                    tab TEXT NOT NULL,
+                    row_index INTEGER NOT NULL,
+                    row_hash TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (tab, row_index)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dirty_rows (
+                    tab TEXT NOT NULL,
+                    row_index INTEGER NOT NULL,
+                    generation INTEGER NOT NULL,
+                    PRIMARY KEY (tab, row_index)
+                ) WITHOUT ROWID
+            """)
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _get_tab(self, name: str) -> Optional[tuple]:
+        return self._connection().execute(
+            'SELECT title, row_count, synced_at, full_synced_at FROM tabs WHERE name = ?', (name,)
+        ).fetchone()
+
+    @staticmethod
+    def _row_hash(row: list) -> str:
+        return hashlib.sha1(json.dumps(row, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _upsert_rows(self, conn, name: str, first_row: int, values: List[list]) -> List[int]:
+        """Grava as linhas que mudaram a partir de first_row; retorna os números das linhas escritas"""
+        if not values:
+            return []
+
+        last_row = first_row + len(values) - 1
+        existing = dict(conn.execute(
+            'SELECT row_index, row_hash FROM rows WHERE tab = ? AND row_index BETWEEN ? AND ?',
+            (name, first_row, last_row)
+        ).fetchall())
+
+        changed = []
+        for offset, row in enumerate(values):
+            row_index = first_row + offset
+            row_hash = self._row_hash(row)
+            if existing.get(row_index) != row_hash:
+                changed.append((name, row_index, row_hash, json.dumps(row, ensure_ascii=False)))
+
+        if changed:
+            conn.executemany(
+                'INSERT OR REPLACE INTO rows (tab, row_index, row_hash, data) VALUES (?, ?, ?, ?)',
+                changed
+            )
+        return [row_index for _, row_index, _, _ in changed]
+
+    # ----- Sincronização -----
+
+    def _resolve_worksheets(self, spreadsheet) -> Dict[str, Any]:
+        """Resolve as abas reais (com dimensões) a partir de uma única leitura de metadados"""
+        worksheets = self.worksheets_provider() if self.worksheets_provider else spreadsheet.worksheets()
+        by_title = {ws.title: ws for ws in worksheets}
+        resolved = {}
+        for name, candidates in self.tabs.items():
+            for candidate in candidates:
+                if candidate is None and worksheets:
+                    resolved[name] = worksheets[0]
+                    break
+                if candidate in by_title:
+                    resolved[name] = by_title[candidate]
+                    break
+        return resolved
+
+    def mark_dirty(self, name: str, row_index: int):
+        """
+        Marca uma linha como alterada localmente, para ser relida na próxima sincronização
+
+        Até essa sincronização, as leituras desta aba deixam de ser servidas pela
+        réplica, em todos os processos que a partilham.
+        """
+        if not self.enabled:
+            return
+        conn = self._connection()
+        with conn:
+            # Incremento atómico: a escrita abre a transação antes da leitura
+            conn.execute("""
+                INSERT INTO meta (key, value) VALUES ('generation', '1')
+                ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """)
+            generation = int(self._get_meta('generation'))
+            conn.execute(
+                'INSERT OR REPLACE INTO dirty_rows (tab, row_index, generation) VALUES (?, ?, ?)',
+                (name, row_index, generation)
+            )
+        self.request_sync()
+
+    def request_sync(self):
+        """Antecipa a próxima sincronização da thread de fundo"""
+        self._wakeup.set()
+
+    def _is_dirty(self, name: str, row_index: int = None) -> bool:
+        """Indica se a aba (ou uma linha dela) tem alterações ainda não sincronizadas"""
+        if row_index is not None:
+            row = self._connection().execute(
+                'SELECT 1 FROM dirty_rows WHERE tab = ? AND row_index = ?', (name, row_index)
+            ).fetchone()
+        else:
+            row = self._connection().execute('SELECT 1 FROM dirty_rows WHERE tab = ? LIMIT 1', (name,)).fetchone()
+        return row is not None
+
+    def _clear_dirty(self, dirty_rows: Dict[tuple, int]):
+        """Apaga as marcas lidas no início da sincronização (as marcadas de novo entretanto ficam)"""
+        if not dirty_rows:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'DELETE FROM dirty_rows WHERE tab = ? AND row_index = ? AND generation <= ?',
+                [(name, row_index, generation) for (name, row_index), generation in dirty_rows.items()]
+            )
+
+    def sync(self, force_full: bool = False) -> int:
+        """
+        Sincroniza a réplica com a planilha
+
+        Args:
+            force_full: Se True, relê todas as abas por inteiro
+
+        Returns:
+            Número de linhas escritas na réplica
+        """
+        if not self.enabled:
+            return 0
+
+        with self._sync_lock, self.sync_context():
+            now = time.time()
+            spreadsheet = self.spreadsheet_provider()
+            conn = self._connection()
+
+            dirty_rows = {
+                (name, row_index): generation
+                for name, row_index, generation in conn.execute('SELECT tab, row_index, generation FROM dirty_rows')
+            }
+
+            modified_time = spreadsheet.get_lastUpdateTime()
+            responses_tab = self._get_tab(self.RESPONSES)
+            full_due = force_full or responses_tab is None or (now - responses_tab[3]) > self.full_sync_interval
+            # A planilha mudou desde a última leitura completa (ex: edição de uma linha existente)
+            if not full_due and modified_time != self._get_meta('verified_modified_time'):
+                full_due = (now - responses_tab[3]) >= self.verify_interval
+
+            if modified_time == self._get_meta('modified_time') and not full_due and not dirty_rows:
+                self._stats['skipped_syncs'] += 1
+                with conn:
+                    conn.execute('UPDATE tabs SET synced_at = ?', (now,))
+                return 0
+
+            worksheets = self._resolve_worksheets(spreadsheet)
+
+            # Montar todos os intervalos de um único batchGet
+            ranges = []
+            plan = []
+            for name, worksheet in worksheets.items():
+                title = worksheet.title
+                if name == self.RESPONSES and not full_due and responses_tab[0] == title:
+                    # Intervalos limitados à grelha da aba (leituras fora da grelha dão erro)
+                    last_col = gspread.utils.rowcol_to_a1(1, worksheet.col_count).rstrip('0123456789')
+                    start_row = responses_tab[1] + 1
+                    if start_row <= worksheet.row_count:
+                        ranges.append(gspread.utils.absolute_range_name(title, f"A{start_row}:{last_col}{worksheet.row_count}"))
+                        plan.append((name, title, 'tail', start_row))
+                    for dirty_name, row_index in sorted(dirty_rows):
+                        if dirty_name == name and row_index < start_row:
+                            ranges.append(gspread.utils.absolute_range_name(title, f"A{row_index}:{last_col}{row_index}"))
+                            plan.append((name, title, 'row', row_index))
+                else:
+                    ranges.append(gspread.utils.absolute_range_name(title))
+                    plan.append((name, title, 'full', 1))
+
+            if not ranges:
+                with conn:
+                    conn.execute('UPDATE tabs SET synced_at = ?', (now,))
+                    conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('modified_time', modified_time))
+                self._clear_dirty(dirty_rows)
+                return 0
+
+            response = spreadsheet.values_batch_get(ranges)
+            value_ranges = response.get('valueRanges', [])
+
+            written = 0
+            # Aba -> linhas alteradas (None quando houve linhas removidas)
+            changed_tabs = {}
+
+            def mark_changed(name, row_indexes):
+                if name in changed_tabs and changed_tabs[name] is None:
+                    return
+                if row_indexes is None:
+                    changed_tabs[name] = None
+                else:
+                    changed_tabs.setdefault(name, set()).update(row_indexes)
+
+            with conn:
+                for (name, title, mode, start_row), value_range in zip(plan, value_ranges):
+                    values = value_range.get('values', [])
+
+                    if mode == 'row':
+                        changed_rows = self._upsert_rows(conn, name, start_row, [values[0] if values else []])
+                        written += len(changed_rows)
+                        if changed_rows:
+                            mark_changed(name, changed_rows)
+                        continue
+
+                    changed_rows = self._upsert_rows(conn, name, start_row, values)
+                    written += len(changed_rows)
+                    if changed_rows:
+                        mark_changed(name, changed_rows)
+
+                    if mode == 'full':
+                        row_count = len(values)
+                        deleted = conn.execute('DELETE FROM rows WHERE tab = ? AND row_index > ?', (name, row_count))
+                        if deleted.rowcount:
+                            mark_changed(name, None)
+                        conn.execute(
+                            'INSERT OR REPLACE INTO tabs (name, title, row_count, synced_at, full_synced_at) VALUES (?, ?, ?, ?, ?)',
+                            (name, title, row_count, now, now)
+                        )
+                    else:
+                        row_count = max(responses_tab[1], start_row - 1 + len(values))
+                        conn.execute(
+                            'UPDATE tabs SET row_count = ?, synced_at = ? WHERE name = ?',
+                            (row_count, now, name)
+                        )
+
+                # Abas que deixaram de existir
+                for name in self.tabs:
+                    if name not in worksheets:
+                        deleted = conn.execute('DELETE FROM rows WHERE tab = ?', (name,))
+                        if deleted.rowcount:
+                            mark_changed(name, None)
+                        conn.execute('DELETE FROM tabs WHERE name = ?', (name,))
+
+                conn.execute('UPDATE tabs SET synced_at = ?', (now,))
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('modified_time', modified_time))
+                if full_due:
+                    conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                 ('verified_modified_time', modified_time))
+
+            self._clear_dirty(dirty_rows)
+
+            self._stats['syncs'] += 1
+            self._stats['rows_written'] += written
+            logger.info(f"Réplica sincronizada: {written} linhas atualizadas ({len(ranges)} intervalos num batchGet)")
+
+            if self.on_change:
+                for name in sorted(changed_tabs):
+                    try:
+                        self.on_change(name, changed_tabs[name])
+                    except Exception as e:
+                        logger.warning(f"Erro ao notificar alteração da aba '{name}': {str(e)}")
+            return written
+
+    def start(self):
+        """Inicia a thread de sincronização em segundo plano"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sheet-replica', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Pede à thread de sincronização para terminar"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self._stats['errors'] += 1
+                self._stats['last_error'] = str(e)
+                logger.warning(f"Erro ao sincronizar réplica: {str(e)}")
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+
+    # ----- Leitura -----
+
+    def is_ready(self, name: str) -> bool:
+        """Indica se a aba está na réplica e foi sincronizada há menos de max_staleness"""
+        if not self.enabled:
+            return False
+        tab = self._get_tab(name)
+        return tab is not None and (time.time() - tab[2]) <= self.max_staleness
+
+    def get_values(self, name: str) -> Optional[List[list]]:
+        """
+        Obtém todos os valores da aba (como get_all_values), incluindo o cabeçalho
+
+        Returns:
+            Lista de linhas, ou None se a réplica não puder servir esta aba
+        """
+        if not self.is_ready(name) or self._is_dirty(name):
+            return None
+
+        values = []
+        for row_index, data in self._connection().execute(
+            'SELECT row_index, data FROM rows WHERE tab = ? ORDER BY row_index', (name,)
+        ):
+            # Preencher linhas vazias intermédias para manter o alinhamento dos índices
+            while len(values) < row_index - 1:
+                values.append([])
+            values.append(json.loads(data))
+        return values
+
+    def get_records(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Obtém os registos da aba (como get_all_records), com o cabeçalho como chaves
+
+        Returns:
+            Lista de dicionários, ou None se a réplica não puder servir esta aba
+        """
+        values = self.get_values(name)
+        if values is None:
+            return None
+        if not values:
+            return []
+
+        headers = values[0]
+        records = []
+        for row in values[1:]:
+            row = list(row) + [''] * (len(headers) - len(row))
+            records.append(dict(zip(headers, gspread.utils.numericise_all(row))))
+        return records
+
+    def get_header(self, name: str) -> Optional[List[str]]:
+        """
+        Obtém a linha de cabeçalhos da aba (como row_values(1))
+
+        Returns:
+            Lista de cabeçalhos, ou None se a réplica não puder servir esta aba
+        """
+        if not self.is_ready(name) or self._is_dirty(name, 1):
+            return None
+
+        row = self._connection().execute('SELECT data FROM rows WHERE tab = ? AND row_index = 1', (name,)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def get_row(self, name: str, row_index: int) -> Optional[Dict[str, Any]]:
+        """
+        Obtém uma linha da aba como dicionário cabeçalho -> valor (sem conversão numérica)
+
+        Returns:
+            Dicionário da linha ({} se a linha estiver vazia), ou None se a réplica não puder servir esta aba
+        """
+        if not self.is_ready(name) or self._is_dirty(name, row_index) or self._is_dirty(name, 1):
+            return None
+
+        conn = self._connection()
+        header = conn.execute('SELECT data FROM rows WHERE tab = ? AND row_index = 1', (name,)).fetchone()
+        row = conn.execute('SELECT data FROM rows WHERE tab = ? AND row_index = ?', (name, row_index)).fetchone()
+        if header is None or row is None:
+            return {}
+
+        headers = json.loads(header[0])
+        values = json.loads(row[0])
+        return {h: (values[i] if i < len(values) else '') for i, h in enumerate(headers)}
+
+    def get_rows(self, name: str, row_indexes: List[int]) -> Optional[Dict[int, list]]:
+        """
+        Obtém os valores de algumas linhas da aba (como row_values), sem o cabeçalho
+
+        Returns:
+            Número da linha -> valores ([] se a linha estiver vazia), ou None se a réplica não puder servir esta aba
+        """
+        if not self.is_ready(name) or any(self._is_dirty(name, row_index) for row_index in row_indexes):
+            return None
+
+        rows = {row_index: [] for row_index in row_indexes}
+        conn = self._connection()
+        for row_index in row_indexes:
+            row = conn.execute('SELECT data FROM rows WHERE tab = ? AND row_index = ?', (name, row_index)).fetchone()
+            if row is not None:
+                rows[row_index] = json.loads(row[0])
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas da réplica"""
+        stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['db_path'] = self.db_path
+        if self.enabled:
+            stats['dirty_rows'] = self._connection().execute('SELECT COUNT(*) FROM dirty_rows').fetchone()[0]
+            stats['tabs'] = {
+                name: {'title': title, 'rows': row_count, 'synced_at': synced_at}
+                for name, title, row_count, synced_at in self._connection().execute(
+                    'SELECT name, title, row_count, synced_at FROM tabs'
+                )
+            }
+        return stats
@@ -0,0 +1,167 @@
+import time
+import hashlib
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger('formulario_culsen.sheet_schema')
+
+class SheetSchema:
+    """
+    Esquema (linha de cabeçalhos) de uma aba, com mapa cabeçalho -> coluna.
+
+    Os campos lógicos da aplicação são resolvidos uma única vez para as colunas
+    existentes através de uma lista de nomes alternativos (aliases), ficando as
+    consultas em O(1). Instâncias são imutáveis; a versão é derivada dos
+    cabeçalhos, pelo que qualquer alteração na linha 1 gera uma versão nova.
+    """
+
+    def __init__(self, headers: List[str], aliases: Dict[str, List[str]] = None):
+        """
+        Inicializa o esquema
+
+        Args:
+            headers: Cabeçalhos da aba, pela ordem das colunas
+            aliases: Campo lógico -> cabeçalhos possíveis, por ordem de preferência
+        """
+        self.headers = list(headers)
+        self.version = hashlib.sha1("\x1f".join(self.headers).encode('utf-8')).hexdigest()[:12]
+
+        # Cabeçalho -> número da coluna (1-based); em duplicados vale o primeiro
+        self._columns = {}
+        for i, header in enumerate(self.headers, start=1):
+            self._columns.setdefault(header, i)
+
+        # Campo -> cabeçalhos existentes na aba, pela ordem dos aliases
+        self._fields = {}
+        for field, names in (aliases or {}).items():
+            self._fields[field] = [name for name in names if name in self._columns]
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    def __contains__(self, header: str) -> bool:
+        return header in self._columns
+
+    def column(self, field_or_header: str) -> Optional[int]:
+        """
+        Obtém o número da coluna (1-based) de um campo lógico ou cabeçalho
+
+        Returns:
+            Número da coluna, ou None se não existir na aba
+        """
+        headers = self._fields.get(field_or_header)
+        if headers:
+            return self._columns[headers[0]]
+        return self._columns.get(field_or_header)
+
+    def header(self, field: str) -> Optional[str]:
+        """Obtém o cabeçalho existente que corresponde ao campo lógico"""
+        column = self.column(field)
+        return self.headers[column - 1] if column else None
+
+    def value(self, row: Union[Dict[str, Any], List[Any]], field: str, default: Any = '') -> Any:
+        """
+        Obtém o valor de um campo numa linha, tentando os aliases existentes por ordem
+
+        Args:
+            row: Linha como dicionário (cabeçalho -> valor) ou lista de valores
+            field: Campo lógico ou cabeçalho
+            default: Valor a devolver se nenhum alias tiver valor
+
+        Returns:
+            Primeiro valor não vazio encontrado, ou default
+        """
+        headers = self._fields.get(field) or ([field] if field in self._columns else [])
+        for header in headers:
+            if isinstance(row, dict):
+                value = row.get(header, '')
+            else:
+                index = self._columns[header] - 1
+                value = row[index] if index < len(row) else ''
+            if value not in ('', None):
+                return value
+        return default
+
+
+class SchemaRegistry:
+    """
+    Cache de esquemas por aba, reconstruídos apenas quando os cabeçalhos mudam.
+    """
+
+    def __init__(self, aliases: Dict[str, List[str]] = None, ttl: int = 600):
+        """
+        Inicializa o registo
+
+        Args:
+            aliases: Campo lógico -> cabeçalhos possíveis, partilhado por todas as abas
+            ttl: Tempo em segundos até voltar a ler os cabeçalhos da planilha
+        """
+        self.aliases = aliases or {}
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._schemas = {}
+        self._stats = {
+            'hits': 0,
+            'loads': 0,
+            'rebuilds': 0,
+        }
+
+    def _store(self, title: str, headers: List[str]) -> SheetSchema:
+        """Guarda o esquema da aba, reaproveitando o atual se a versão não mudou (chamar com lock)"""
+        current = self._schemas.get(title)
+        schema = SheetSchema(headers, self.aliases)
+        if current is not None and current[0].version == schema.version:
+            schema = current[0]
+        else:
+            self._stats['rebuilds'] += 1
+            logger.info(f"Esquema da aba '{title}' atualizado (versão {schema.version}, {len(schema)} colunas)")
+        self._schemas[title] = (schema, time.time())
+        return schema
+
+    def get(self, title: str, fetch_headers: Callable[[], List[str]], force_refresh: bool = False) -> SheetSchema:
+        """
+        Obtém o esquema da aba, lendo os cabeçalhos apenas se não estiver em cache
+
+        Args:
+            title: Título da aba
+            fetch_headers: Função que lê a linha de cabeçalhos (ex: worksheet.row_values(1))
+            force_refresh: Se True, ignora o cache
+        """
+        with self._lock:
+            current = self._schemas.get(title)
+            if not force_refresh and current is not None and (time.time() - current[1]) <= self.ttl:
+                self._stats['hits'] += 1
+                return current[0]
+
+        headers = fetch_headers()
+        with self._lock:
+            self._stats['loads'] += 1
+            return self._store(title, headers)
+
+    def observe(self, title: str, headers: List[str]) -> SheetSchema:
+        """Atualiza o esquema a partir de cabeçalhos já conhecidos (sem pedidos à API)"""
+        with self._lock:
+            return self._store(title, headers)
+
+    def add_column(self, title: str, header: str) -> SheetSchema:
+        """Regista localmente um cabeçalho acrescentado no fim da aba"""
+        with self._lock:
+            current = self._schemas.get(title)
+            headers = list(current[0].headers) if current else []
+            return self._store(title, headers + [header])
+
+    def invalidate(self, title: str = None):
+        """Descarta o esquema de uma aba (ou de todas)"""
+        with self._lock:
+            if title is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop(title, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do registo"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['schemas'] = {title: schema.version for title, (schema, _) in self._schemas.items()}
+        return stats
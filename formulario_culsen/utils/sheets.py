@@ -5,10 +5,19 @@ import os
 import logging
 import traceback
 import json
+import re
 import time
 import threading
+import requests
+from google.auth.exceptions import TransportError
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from utils.credentials_helper import get_credentials
-from utils.file_cache import with_file_cache, default_file_cache
+from utils.file_cache import with_file_cache, default_file_cache, SingleFlight, file_cache_refresher
+from utils.submission_queue import SubmissionQueue
+from utils.sheet_replica import SheetReplica
+from utils.candidate_store import CandidateStore
+from utils.sheet_schema import SchemaRegistry
+from utils.rate_limiter import google_api_limiter, PRIORITY_WRITE, PRIORITY_BACKGROUND
 
 # Configurar logger
 logger = logging.getLogger('formulario_culsen.sheets')
@@ -19,175 +28,631 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
+# ID da planilha da aplicação
+SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
+
 # Get current directory
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# ===== SISTEMA DE CACHE EM MEMÓRIA =====
-class MemoryCache:
-    def __init__(self):
-        self._cache = {}
-        self._timestamps = {}
-        self._lock = threading.Lock()
-        self.default_ttl = 300  # 5 minutos por padrão
-        self.config_ttl = 600   # 10 minutos para configurações
-        self.candidates_ttl = 180  # 3 minutos para candidatos
-        
-    def get(self, key):
-        """Obtém um valor do cache se ainda for válido"""
-        with self._lock:
-            if key not in self._cache:
-                return None
-                
-            # Verificar se o cache expirou
-            timestamp = self._timestamps.get(key, 0)
-            ttl = self._get_ttl_for_key(key)
-            
-            if time.time() - timestamp > ttl:
-                # Cache expirado, remover
-                del self._cache[key]
-                del self._timestamps[key]
-                logger.info(f"Cache expirado para chave: {key}")
-                return None
-                
-            logger.info(f"Cache hit para chave: {key}")
-            return self._cache[key]
-    
-    def set(self, key, value):
-        """Define um valor no cache"""
-        with self._lock:
-            self._cache[key] = value
-            self._timestamps[key] = time.time()
-            logger.info(f"Cache atualizado para chave: {key}")
-    
-    def invalidate(self, key):
-        """Remove uma chave específica do cache"""
-        with self._lock:
-            if key in self._cache:
-                del self._cache[key]
-                del self._timestamps[key]
-                logger.info(f"Cache invalidado para chave: {key}")
-    
-    def invalidate_pattern(self, pattern):
-        """Remove todas as chaves que contêm o padrão"""
-        with self._lock:
-            keys_to_remove = [k for k in self._cache.keys() if pattern in k]
-            for key in keys_to_remove:
-                del self._cache[key]
-                del self._timestamps[key]
-                logger.info(f"Cache invalidado para chave: {key}")
-    
-    def clear(self):
-        """Limpa todo o cache"""
-        with self._lock:
-            self._cache.clear()
-            self._timestamps.clear()
-            logger.info("Cache completamente limpo")
-    
-    def _get_ttl_for_key(self, key):
-        """Retorna o TTL apropriado baseado na chave"""
-        if 'config' in key.lower():
-            return self.config_ttl
-        elif 'candidates' in key.lower() or 'candidate_' in key.lower():
-            return self.candidates_ttl
-        else:
-            return self.default_ttl
-    
-    def get_stats(self):
-        """Retorna estatísticas do cache"""
-        with self._lock:
-            return {
-                'total_keys': len(self._cache),
-                'keys': list(self._cache.keys()),
-                'memory_usage_estimate': sum(len(str(v)) for v in self._cache.values())
-            }
+# ===== CACHE =====
+# O cache é o FileCache em dois níveis (memória L1 + disco L2) de utils.file_cache;
+# todas as chaves vivem num único espaço de nomes (ex: 'candidates_all').
+
+# Instância global de coalescência de buscas fora do file cache (ex: armazenamento de candidatos)
+cache_flights = SingleFlight()
 
-# Instância global do cache
-cache = MemoryCache()
+# Atualizações em segundo plano do file cache não competem com pedidos interativos
+file_cache_refresher.refresh_context = lambda: google_api_limiter.priority(PRIORITY_BACKGROUND)
 
 def with_cache_fallback(cache_key, fetch_function, force_refresh=False):
     """
     Decorator/helper para implementar cache com fallback
     
+    Mantido por compatibilidade: usa o mesmo cache em dois níveis de with_file_cache.
+    
     Args:
         cache_key: Chave para o cache
         fetch_function: Função para buscar dados se não estiver em cache
         force_refresh: Se True, força a atualização do cache
     """
-    try:
-        # Se não for refresh forçado, tentar cache primeiro
-        if not force_refresh:
-            cached_data = cache.get(cache_key)
-            if cached_data is not None:
-                return cached_data
-        
-        # Buscar dados frescos
-        logger.info(f"Buscando dados frescos para: {cache_key}")
-        fresh_data = fetch_function()
-        
-        # Salvar no cache
-        cache.set(cache_key, fresh_data)
-        
-        return fresh_data
-        
-    except Exception as e:
-        logger.error(f"Erro ao buscar dados frescos para {cache_key}: {str(e)}")
-        
-        # Em caso de erro, tentar usar cache mesmo que expirado
-        with cache._lock:
-            if cache_key in cache._cache:
-                logger.warning(f"Usando cache expirado devido a erro para: {cache_key}")
-                return cache._cache[cache_key]
-        
-        # Se não há cache, re-raise o erro
-        raise e
+    return with_file_cache(cache_key, fetch_function, force_refresh)
 
-def get_sheet_client():
-    """Returns an authenticated Google Sheets client"""
-    try:
+# ===== SESSÃO PARTILHADA COM O GOOGLE SHEETS =====
+class RateLimitedClient(gspread.Client):
+    """Cliente gspread cujos pedidos passam pelo limitador de quota partilhado"""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        # O gspread também usa a API do Drive (ex: data de modificação)
+        service = 'drive' if '/drive/' in endpoint else 'sheets'
+        # Só as leituras são repetidas em erros 5xx: um append pode já ter sido aplicado
+        return google_api_limiter.call(service, super().request, method, endpoint, *args,
+                                       idempotent=method.upper() == 'GET', **kwargs)
+
+class SheetsGateway:
+    """
+    Sessão única (por processo) com o Google Sheets.
+
+    Mantém um cliente autorizado, o handle da planilha e os metadados de
+    todas as abas (lidos com um único fetch_sheet_metadata e guardados com
+    TTL), evitando repetir authorize + open_by_key + pesquisa de abas em cada
+    chamada. Abas inexistentes ficam em cache como resultado negativo até ao
+    próximo refresh. O token é renovado proativamente antes de expirar.
+
+    Os metadados são lidos fora do lock (que só protege a troca dos valores em
+    cache), e leituras concorrentes após o TTL são coalescidas num só pedido.
+    """
+
+    def __init__(self, spreadsheet_id, scopes, refresh_margin=300, metadata_ttl=300):
+        """
+        Args:
+            spreadsheet_id: ID da planilha a abrir
+            scopes: Scopes OAuth a pedir nas credenciais
+            refresh_margin: Segundos antes da expiração em que o token é renovado
+            metadata_ttl: Segundos durante os quais os metadados das abas são válidos
+        """
+        self.spreadsheet_id = spreadsheet_id
+        self.scopes = scopes
+        self.refresh_margin = refresh_margin
+        self.metadata_ttl = metadata_ttl
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._client = None
+        self._spreadsheet = None
+        self._ordered_worksheets = []
+        self._metadata_at = None
+        self._metadata_fetches = 0
+        # Incrementada a cada alteração dos metadados em cache: uma leitura que
+        # começou antes não os substitui por uma versão mais antiga
+        self._metadata_epoch = 0
+        self._metadata_flights = SingleFlight()
+
+    def _authorize(self):
+        """Obtém credenciais e cria um novo cliente gspread"""
         logger.info("Tentando autenticar com Google Sheets")
-        
-        credentials = get_credentials(SCOPES)
+
+        credentials = get_credentials(self.scopes)
         if not credentials:
             raise FileNotFoundError("Não foi possível obter credenciais válidas")
-            
-        client = gspread.authorize(credentials)
+
+        self._credentials = credentials
+        self._client = gspread.authorize(credentials, client_factory=RateLimitedClient)
+        self._spreadsheet = None
+        self._invalidate_metadata()
         logger.info("Autenticação bem-sucedida")
-        return client
+
+    def _refresh_token_if_needed(self):
+        """Renova o token se estiver prestes a expirar"""
+        credentials = self._credentials
+        expiry = getattr(credentials, 'expiry', None)
+
+        if credentials.token and expiry is not None:
+            remaining = (expiry - datetime.datetime.utcnow()).total_seconds()
+            if remaining > self.refresh_margin:
+                return
+
+        logger.info("Renovando token de acesso do Google Sheets")
+        credentials.refresh(GoogleAuthRequest())
+
+    @property
+    def client(self):
+        """Cliente gspread autorizado e com token válido"""
+        with self._lock:
+            if self._client is None:
+                self._authorize()
+            self._refresh_token_if_needed()
+            return self._client
+
+    @property
+    def spreadsheet(self):
+        """Handle da planilha, aberto uma única vez"""
+        client = self.client
+        with self._lock:
+            if self._spreadsheet is None:
+                logger.info(f"Tentando abrir a planilha com ID: {self.spreadsheet_id}")
+                self._spreadsheet = client.open_by_key(self.spreadsheet_id)
+            return self._spreadsheet
+
+    def _invalidate_metadata(self):
+        """Descarta os metadados das abas (chamar com lock)"""
+        self._ordered_worksheets = []
+        self._metadata_at = None
+        self._metadata_epoch += 1
+
+    def fetch_sheet_metadata(self, force_refresh=False):
+        """
+        Obtém os handles de todas as abas, por ordem, com um único pedido de metadados
+
+        Args:
+            force_refresh: Se True, ignora os metadados em cache
+
+        Returns:
+            Lista de worksheets pela ordem das abas na planilha
+        """
+        with self._lock:
+            fresh = self._metadata_at is not None and (time.time() - self._metadata_at) <= self.metadata_ttl
+            if fresh and not force_refresh:
+                return list(self._ordered_worksheets)
+
+        # Um refresh forçado não aproveita uma leitura já em curso, que pode ser anterior à alteração
+        ordered = self._metadata_flights.do('force' if force_refresh else 'ttl', self._load_sheet_metadata)
+        return list(ordered)
+
+    def _load_sheet_metadata(self):
+        """Lê os metadados das abas (sem lock) e guarda-os, se entretanto não tiverem mudado"""
+        spreadsheet = self.spreadsheet
+        with self._lock:
+            epoch = self._metadata_epoch
+
+        logger.info("Lendo metadados das abas da planilha")
+        metadata = spreadsheet.fetch_sheet_metadata({'includeGridData': 'false', 'fields': 'sheets.properties'})
+        ordered = [gspread.Worksheet(spreadsheet, item['properties']) for item in metadata.get('sheets', [])]
+
+        with self._lock:
+            self._metadata_fetches += 1
+            if self._metadata_epoch == epoch:
+                self._ordered_worksheets = ordered
+                self._metadata_at = time.time()
+                self._metadata_epoch += 1
+        return ordered
+
+    def worksheet(self, title):
+        """
+        Obtém o handle de uma aba pelo título, a partir dos metadados em cache
+
+        Raises:
+            gspread.exceptions.WorksheetNotFound: se a aba não existir (resultado também em cache)
+        """
+        handle = self._find_worksheet(self.fetch_sheet_metadata(), title)
+        if handle is None:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return handle
+
+    @staticmethod
+    def _find_worksheet(worksheets, title):
+        """Procura uma aba pelo título numa lista de metadados (em títulos repetidos vale a primeira)"""
+        for handle in worksheets:
+            if handle.title == title:
+                return handle
+        return None
+
+    def first_worksheet(self):
+        """Obtém o handle da primeira aba da planilha (None se não houver abas)"""
+        worksheets = self.fetch_sheet_metadata()
+        return worksheets[0] if worksheets else None
+
+    def resolve_worksheet(self, *titles):
+        """
+        Obtém a primeira aba existente de uma lista de títulos candidatos
+
+        Args:
+            *titles: Títulos por ordem de preferência (None = primeira aba)
+
+        Returns:
+            Handle da aba, ou None se nenhum candidato existir
+        """
+        worksheets = self.fetch_sheet_metadata()
+        for title in titles:
+            if title is None:
+                return worksheets[0] if worksheets else None
+            handle = self._find_worksheet(worksheets, title)
+            if handle is not None:
+                return handle
+        return None
+
+    def add_worksheet(self, title, rows, cols):
+        """Cria uma nova aba e regista-a nos metadados em cache"""
+        try:
+            handle = self.spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+        except gspread.exceptions.APIError:
+            # A aba pode ter sido criada fora da aplicação depois da última leitura de metadados
+            handle = self._find_worksheet(self.fetch_sheet_metadata(force_refresh=True), title)
+            if handle is None:
+                raise
+            return handle
+        with self._lock:
+            if self._metadata_at is not None:
+                self._ordered_worksheets.append(handle)
+                self._metadata_epoch += 1
+        return handle
+
+    def forget_worksheet(self, title):
+        """Descarta os metadados em cache (ex: após uma aba ser apagada ou renomeada)"""
+        with self._lock:
+            self._invalidate_metadata()
+
+    def get_stats(self):
+        """Retorna estatísticas dos metadados em cache"""
+        with self._lock:
+            return {
+                'worksheets': [handle.title for handle in self._ordered_worksheets],
+                'metadata_fetches': self._metadata_fetches,
+                'metadata_coalesced': self._metadata_flights.get_stats()['coalesced_waiters'],
+                'metadata_age': round(time.time() - self._metadata_at, 1) if self._metadata_at else None,
+            }
+
+    def reset(self):
+        """Descarta cliente, planilha e handles; a próxima chamada volta a autenticar"""
+        with self._lock:
+            self._credentials = None
+            self._client = None
+            self._spreadsheet = None
+            self._invalidate_metadata()
+            logger.info("Sessão do Google Sheets reiniciada")
+
+# Instância global da sessão
+sheets_gateway = SheetsGateway(SPREADSHEET_ID, SCOPES)
+
+def get_sheet_client():
+    """Returns an authenticated Google Sheets client"""
+    try:
+        return sheets_gateway.client
     except Exception as e:
         logger.error(f"Erro ao autenticar com Google: {str(e)}")
         logger.error(traceback.format_exc())
         raise
 
+def get_spreadsheet():
+    """Returns the shared handle of the application spreadsheet"""
+    return sheets_gateway.spreadsheet
+
+def get_worksheet(title):
+    """Returns a worksheet handle by title from the shared registry"""
+    return sheets_gateway.worksheet(title)
+
+# Títulos possíveis da aba de respostas, por ordem de preferência (None = primeira aba)
+RESPONSES_TITLES = ["Respostas do Formulário 2", "Respostas do Formulário 1", None]
+
+def get_responses_worksheet(create=False):
+    """
+    Obtém a aba de respostas, tentando 'Respostas do Formulário 2',
+    depois 'Respostas do Formulário 1' e por fim a primeira aba
+    (resolvido a partir dos metadados em cache, sem pedidos por tentativa)
+    """
+    worksheet = sheets_gateway.resolve_worksheet(*RESPONSES_TITLES)
+    if worksheet is not None:
+        return worksheet
+    
+    if not create:
+        raise gspread.exceptions.WorksheetNotFound("Respostas do Formulário")
+    
+    logger.info("Nenhuma aba de respostas encontrada. Criando 'Respostas do Formulário'")
+    return sheets_gateway.add_worksheet("Respostas do Formulário", rows=1000, cols=50)
+
+# ===== FILA DE SUBMISSÕES (WRITE-BEHIND) =====
+def _is_retryable_sheets_error(error):
+    """Indica se um erro do Sheets é temporário (quota 429 ou 5xx) e deve ser repetido"""
+    if isinstance(error, gspread.exceptions.APIError):
+        status_code = getattr(error.response, 'status_code', None)
+        return status_code == 429 or (status_code is not None and status_code >= 500)
+    # Erros de rede, de renovação do token ou de espera pela quota local; os
+    # restantes (ex: dados inválidos) não melhoram com nova tentativa
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              TransportError, TimeoutError, ConnectionError))
+
+def _appended_first_row(response):
+    """Número da primeira linha escrita por append_rows (de updates.updatedRange), ou None"""
+    updated_range = ((response or {}).get('updates') or {}).get('updatedRange', '')
+    match = re.search(r'!\$?[A-Z]+\$?(\d+)', updated_range)
+    return int(match.group(1)) if match else None
+
+def _flush_submissions(worksheet_title, rows):
+    """Envia um lote de linhas da fila de submissões com um único append_rows"""
+    worksheet = get_worksheet(worksheet_title)
+    with google_api_limiter.priority(PRIORITY_WRITE):
+        response = worksheet.append_rows(rows)
+
+    # As linhas já estão na planilha: a partir daqui nenhum erro pode propagar,
+    # senão a fila de submissões repetiria o lote e duplicaria as linhas
+    try:
+        _update_caches_after_append(worksheet, worksheet_title, response, rows)
+    except Exception as e:
+        logger.error(f"Erro ao atualizar caches após envio de submissões: {str(e)}")
+        logger.error(traceback.format_exc())
+        _invalidate_candidate_caches()
+
+    try:
+        # Trazer as novas linhas para a réplica local sem esperar pelo intervalo
+        sheet_replica.request_sync()
+    except Exception as e:
+        logger.warning(f"Erro ao pedir sincronização da réplica: {str(e)}")
+
+def _update_caches_after_append(worksheet, worksheet_title, response, rows):
+    """Acrescenta as linhas enviadas aos caches de candidatos em vez de os invalidar"""
+    responses_sheet = sheets_gateway.resolve_worksheet(*RESPONSES_TITLES)
+    if responses_sheet is not None and responses_sheet.title == worksheet_title:
+        first_row = _appended_first_row(response)
+        headers = get_worksheet_schema(worksheet, 'responses').headers
+        if first_row is None or not headers or not _write_through_candidates(
+                headers, {first_row + offset: row for offset, row in enumerate(rows)}):
+            _invalidate_candidate_caches()
+
+def _invalidate_candidate_caches():
+    """Invalida os caches de candidatos (sem lançar exceções)"""
+    try:
+        default_file_cache.invalidate_tag('candidates')
+        candidate_store.invalidate()
+        logger.info("Cache de candidatos invalidado após envio de submissões")
+    except Exception as e:
+        logger.error(f"Erro ao invalidar cache de candidatos: {str(e)}")
+
+# Instância global da fila de submissões
+submission_queue = SubmissionQueue(_flush_submissions, is_retryable=_is_retryable_sheets_error)
+
+# ===== RÉPLICA LOCAL (SQLITE) =====
+# Abas replicadas: nome lógico -> títulos candidatos (None = primeira aba)
+REPLICA_TABS = {
+    'config': ["Config"],
+    'prompt': ["Prompt"],
+    'questions': ["Perguntas"],
+    'forms': ["Formularios"],
+    'slots': ["Horarios"],
+    'responses': RESPONSES_TITLES,
+}
+
+# Tag do file cache com as entradas derivadas de cada aba replicada
+REPLICA_CACHE_TAGS = {
+    'config': 'config',
+    'prompt': 'prompt',
+    'questions': 'questions',
+    'forms': 'forms',
+    'responses': 'candidates',
+}
+
+def _on_replica_change(name, rows=None):
+    """Invalida os caches derivados de uma aba cujo conteúdo mudou na planilha"""
+    if name == 'responses' and rows and 1 not in rows:
+        # Só mudaram linhas de dados: aplicá-las aos caches de candidatos
+        headers = sheet_replica.get_header(name)
+        values = sheet_replica.get_rows(name, sorted(rows))
+        if headers and values is not None and _write_through_candidates(headers, values):
+            logger.info(f"Aba '{name}' alterada na planilha: {len(rows)} linhas aplicadas aos caches")
+            return
+    
+    if name in REPLICA_CACHE_TAGS:
+        default_file_cache.invalidate_tag(REPLICA_CACHE_TAGS[name])
+    if name == 'responses':
+        candidate_store.invalidate()
+    invalidate_bootstrap_snapshot()
+    logger.info(f"Aba '{name}' alterada na planilha: caches derivados invalidados")
+
+# Instância global da réplica (desativar com SHEETS_REPLICA=0)
+sheet_replica = SheetReplica(
+    get_spreadsheet,
+    REPLICA_TABS,
+    sync_context=lambda: google_api_limiter.priority(PRIORITY_BACKGROUND),
+    worksheets_provider=lambda: sheets_gateway.fetch_sheet_metadata(force_refresh=True),
+    on_change=_on_replica_change,
+    enabled=os.environ.get('SHEETS_REPLICA', '1').lower() not in ('0', 'false', 'nao', 'não')
+)
+
+# ===== ESQUEMA DAS ABAS =====
+# Campo lógico -> cabeçalhos possíveis na planilha, por ordem de preferência
+FIELD_ALIASES = {
+    'nome': ['Nome completo:'],
+    'email': ['Email de contacto:', 'Endereço de email'],
+    'telefone': ['Número de telefone:'],
+    'cv_url': ['Erro: Link CV ausente ou inválido', 'Carregue aqui o seu CV'],
+    'classificacao': ['Classificacao IA', 'Classificação IA', 'classificacao', 'Classificacao'],
+    'justificacao': ['Justificacao IA', 'Justificação IA', 'justificacao', 'Justificacao'],
+    'status': ['STATUS', 'Status', 'status'],
+    'provider': ['Provedor IA', 'Provider IA', 'provider', 'Provedor'],
+    'prompt_hash': ['Versao Prompt', 'Versão Prompt'],
+}
+
+# Instância global do registo de esquemas (cabeçalho -> coluna por aba)
+schema_registry = SchemaRegistry(FIELD_ALIASES)
+
+def get_worksheet_schema(worksheet, replica_name=None, force_refresh=False):
+    """
+    Obtém o esquema (cabeçalhos) de uma aba, lendo a linha 1 apenas quando
+    não estiver em cache; usa a réplica local quando indicada e sincronizada
+    """
+    if not force_refresh and replica_name:
+        headers = sheet_replica.get_header(replica_name)
+        if headers is not None:
+            return schema_registry.observe(worksheet.title, headers)
+    
+    return schema_registry.get(worksheet.title, lambda: worksheet.row_values(1), force_refresh)
+
+# Instância global do armazenamento de candidatos (linhas da aba de respostas)
+candidate_store = CandidateStore(ttl=default_file_cache.namespaces['candidates']['ttl'], aliases=FIELD_ALIASES)
+
+# ===== AGRUPAMENTO DE ESCRITAS =====
+class SheetWriteBatch:
+    """
+    Agrupa atualizações de células/intervalos de uma operação lógica e envia-as
+    num único pedido values:batchUpdate.
+
+    Uso:
+        with SheetWriteBatch() as batch:
+            batch.update_cell(form_sheet, 2, 5, 'Aprovado')
+            batch.update_range(form_sheet, 'A1:B1', [['CHAVE', 'VALOR']])
+    """
+
+    def __init__(self, spreadsheet=None, value_input_option='USER_ENTERED'):
+        """
+        Args:
+            spreadsheet: Planilha destino (por omissão, a da sessão partilhada)
+            value_input_option: Modo de interpretação dos valores (igual ao update_cell)
+        """
+        self._spreadsheet = spreadsheet
+        self.value_input_option = value_input_option
+        self._updates = {}
+
+    def update_cell(self, worksheet, row, col, value):
+        """Regista a escrita de uma célula (a última escrita na mesma célula prevalece)"""
+        self.update_range(worksheet, gspread.utils.rowcol_to_a1(row, col), [[value]])
+
+    def update_range(self, worksheet, range_label, values):
+        """Regista a escrita de um intervalo em notação A1"""
+        range_name = gspread.utils.absolute_range_name(worksheet.title, range_label)
+        self._updates[range_name] = values
+
+    def __len__(self):
+        return len(self._updates)
+
+    def flush(self):
+        """
+        Envia todas as atualizações pendentes num único pedido
+
+        Returns:
+            Número de intervalos escritos
+        """
+        if not self._updates:
+            return 0
+
+        data = [{'range': range_name, 'values': values} for range_name, values in self._updates.items()]
+        spreadsheet = self._spreadsheet or get_spreadsheet()
+
+        logger.info(f"Enviando {len(data)} atualizações num único batchUpdate")
+        spreadsheet.values_batch_update(body={
+            'valueInputOption': self.value_input_option,
+            'data': data
+        })
+
+        self._updates.clear()
+        return len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+# ===== SNAPSHOT DE ARRANQUE =====
+# Abas de configuração lidas num único values:batchGet
+BOOTSTRAP_TABS = ["Config", "Prompt", "Perguntas", "Formularios"]
+
+_bootstrap_lock = threading.Lock()
+_bootstrap_state = {'loaded_at': 0, 'snapshot': {}}
+
+def _parse_config_values(all_values):
+    """Converte as linhas da aba Config (coluna A = chave, coluna B = valor) em dicionário"""
+    config = {}
+    for row in all_values:
+        if len(row) >= 2 and row[0]:  # Se tiver pelo menos duas colunas e a chave não estiver vazia
+            config[row[0]] = row[1] if row[1] else ""
+    return config
+
+def _records_from_values(all_values):
+    """Converte valores de uma aba em registos, como get_all_records"""
+    if not all_values:
+        return []
+    headers = all_values[0]
+    records = []
+    for row in all_values[1:]:
+        row = list(row) + [''] * (len(headers) - len(row))
+        records.append(dict(zip(headers, gspread.utils.numericise_all(row))))
+    return records
+
+def _parse_prompt_values(all_values):
+    """Extrai as prompts da aba Prompt (A1 = análise, A2 = validação)"""
+    return {
+        'analise': all_values[0][0] if len(all_values) > 0 and all_values[0] else None,
+        'validacao': all_values[1][0] if len(all_values) > 1 and all_values[1] else None,
+    }
+
+def load_bootstrap_snapshot(max_age=5):
+    """
+    Lê as abas Config, Prompt, Perguntas e Formularios num único values:batchGet
+    e preenche o file cache de todas as famílias (config_data, prompt_data,
+    questions_dynamic, forms_all) de uma só vez
+    
+    Args:
+        max_age: Segundos durante os quais o último snapshot é reutilizado
+                 (evita repetir o pedido quando várias funções falham o cache seguidas)
+    
+    Returns:
+        Dicionário chave de cache -> valor, apenas para as abas existentes e com dados
+    """
+    with _bootstrap_lock:
+        if time.time() - _bootstrap_state['loaded_at'] <= max_age:
+            return _bootstrap_state['snapshot']
+        
+        snapshot = {}
+        try:
+            titles = [title for title in BOOTSTRAP_TABS if sheets_gateway.resolve_worksheet(title) is not None]
+            if titles:
+                logger.info(f"Lendo snapshot de arranque num único pedido: {', '.join(titles)}")
+                ranges = [gspread.utils.absolute_range_name(title) for title in titles]
+                response = get_spreadsheet().values_batch_get(ranges)
+                values = {
+                    title: value_range.get('values', [])
+                    for title, value_range in zip(titles, response.get('valueRanges', []))
+                }
+                
+                if 'Config' in values:
+                    snapshot['config_data'] = _parse_config_values(values['Config'])
+                
+                # Abas vazias ficam de fora, para o caminho normal criar o template
+                if values.get('Prompt'):
+                    snapshot['prompt_data'] = _parse_prompt_values(values['Prompt'])
+                
+                if values.get('Perguntas'):
+                    records = _records_from_values(values['Perguntas'])
+                    snapshot['questions_dynamic'] = _sort_questions(q for q in records if str(q.get('Ativa', '')).lower() == 'sim')
+                
+                if values.get('Formularios'):
+                    snapshot['forms_all'] = _records_from_values(values['Formularios'])
+                
+                for key, value in snapshot.items():
+                    default_file_cache.set(key, value)
+                
+                logger.info(f"Snapshot de arranque carregado: {', '.join(snapshot)}")
+        except Exception as e:
+            logger.warning(f"Erro ao carregar snapshot de arranque: {str(e)}")
+        
+        _bootstrap_state['loaded_at'] = time.time()
+        _bootstrap_state['snapshot'] = snapshot
+        return snapshot
+
+def invalidate_bootstrap_snapshot():
+    """Descarta o último snapshot (chamar após escrever numa aba de configuração)"""
+    with _bootstrap_lock:
+        _bootstrap_state['loaded_at'] = 0
+
+def _get_prompt_data():
+    """Obtém as prompts (A1 e A2 da aba Prompt) da réplica, do cache ou do snapshot de arranque"""
+    all_values = sheet_replica.get_values('prompt')
+    if all_values:
+        return _parse_prompt_values(all_values)
+    
+    prompts = default_file_cache.get('prompt_data')
+    if prompts is None:
+        prompts = load_bootstrap_snapshot().get('prompt_data')
+    return prompts
+
+def _read_prompt_sheet(prompt_sheet):
+    """Lê A1:A2 da aba Prompt num único pedido e guarda as prompts no cache, mesmo vazias"""
+    prompts = _parse_prompt_values(prompt_sheet.get_values('A1:A2'))
+    default_file_cache.set('prompt_data', prompts)
+    return prompts
+
 def get_config(force_refresh=False):
     """Get configuration values from the Config sheet with file caching"""
     def _fetch_config():
         logger.info("Obtendo configurações da planilha...")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        logger.info(f"Tentando abrir a planilha com ID: {SPREADSHEET_ID}")
-        
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         try:
-            logger.info("Tentando acessar a aba 'Config'")
-            config_sheet = sheet.worksheet("Config")
+            # Servir da réplica local quando estiver sincronizada
+            all_values = None if force_refresh else sheet_replica.get_values('config')
             
-            # Obter todos os valores da planilha como células brutas
-            logger.info("Lendo todos os valores da aba Config")
-            all_values = config_sheet.get_all_values()
+            # Senão, ler todas as abas de configuração num único pedido
+            config = None if all_values is not None else load_bootstrap_snapshot().get('config_data')
             
-            # Converter para dicionário
-            config = {}
-            
-            # Processar diretamente cada linha, considerando que a coluna A contém a chave e a coluna B o valor
-            for row in all_values:
-                if len(row) >= 2 and row[0]:  # Se tiver pelo menos duas colunas e a chave não estiver vazia
-                    key = row[0]
-                    value = row[1] if len(row) > 1 and row[1] else ""
-                    config[key] = value
-                    logger.info(f"Configuração carregada: {key} = {value}")
+            if config is None:
+                if all_values is None:
+                    logger.info("Tentando acessar a aba 'Config'")
+                    config_sheet = get_worksheet("Config")
+                    
+                    # Obter todos os valores da planilha como células brutas
+                    logger.info("Lendo todos os valores da aba Config")
+                    all_values = config_sheet.get_all_values()
+                
+                # Converter para dicionário (coluna A = chave, coluna B = valor)
+                config = _parse_config_values(all_values)
             
             logger.info(f"Configurações carregadas com sucesso: {json.dumps(config, ensure_ascii=False)}")
             return config
@@ -201,29 +666,9 @@ def save_form_data(form_data):
     """Save form data to Google Sheets"""
     try:
         logger.info("Iniciando salvamento de dados do formulário")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        logger.info(f"Tentando abrir a planilha com ID: {SPREADSHEET_ID}")
         
-        sheet = client.open_by_key(SPREADSHEET_ID)
-        
-        try:
-            logger.info("Tentando acessar a aba 'Respostas do Formulário 2'")
-            form_sheet = sheet.worksheet("Respostas do Formulário 2")
-        except gspread.exceptions.WorksheetNotFound:
-            # Se a aba não existir, tenta Respostas do Formulário 1
-            logger.info("Aba 'Respostas do Formulário 2' não encontrada. Tentando 'Respostas do Formulário 1'")
-            try:
-                form_sheet = sheet.worksheet("Respostas do Formulário 1")
-            except gspread.exceptions.WorksheetNotFound:
-                # Se ainda não existir, tenta Sheet1 ou cria nova
-                logger.info("Tentando acessar a primeira aba ou criar nova aba")
-                try:
-                    form_sheet = sheet.get_worksheet(0)  # Primeira aba
-                except:
-                    form_sheet = sheet.add_worksheet(title="Respostas do Formulário", rows=1000, cols=50)
+        # Aba de respostas (Formulário 2 → Formulário 1 → primeira aba, ou cria nova)
+        form_sheet = get_responses_worksheet(create=True)
         
         # Define os cabeçalhos exatos da planilha existente
         expected_headers = [
@@ -263,13 +708,14 @@ def save_form_data(form_data):
         
         # Verificar se já existem cabeçalhos
         logger.info("Verificando cabeçalhos existentes")
-        headers = form_sheet.row_values(1)
-        logger.info(f"Cabeçalhos encontrados: {headers}")
+        schema = get_worksheet_schema(form_sheet, 'responses')
+        logger.info(f"Cabeçalhos encontrados: {len(schema)} colunas (versão {schema.version})")
         
         # Se não existem cabeçalhos, adiciona-os
-        if not headers:
+        if not len(schema):
             logger.info("Nenhum cabeçalho encontrado. Adicionando cabeçalhos.")
             form_sheet.append_row(expected_headers)
+            schema_registry.observe(form_sheet.title, expected_headers)
         
         # Prepare row data - usando os índices dos cabeçalhos esperados
         logger.info("Preparando dados da linha para inserção")
@@ -333,14 +779,11 @@ def save_form_data(form_data):
             # Não há coluna específica para o link do CV, mas poderíamos adicionar na coluna de erros ou outra
             row_data[25] = form_data.get('cv_url', '')                            # Usamos a coluna de erro para o link
         
-        # Append the row to the sheet
-        logger.info("Adicionando linha à planilha")
-        form_sheet.append_row(row_data)
-        logger.info("Dados salvos com sucesso na planilha")
-        
-        # Invalidar cache de candidatos após adicionar novo
-        cache.invalidate('all_candidates')
-        logger.info("Cache de candidatos invalidado após nova submissão")
+        # Gravar a linha no journal; o envio para a planilha é feito em lote
+        # (os caches de candidatos são atualizados quando o lote for enviado)
+        logger.info("Adicionando linha à fila de submissões")
+        submission_queue.enqueue(form_sheet.title, row_data)
+        logger.info("Dados gravados com sucesso na fila de submissões")
         
         return True
     except Exception as e:
@@ -355,27 +798,24 @@ def get_available_slots(days_ahead=7):
     """
     try:
         logger.info(f"Buscando horários disponíveis para os próximos {days_ahead} dias")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        logger.info(f"Tentando abrir a planilha com ID: {SPREADSHEET_ID}")
         
-        sheet = client.open_by_key(SPREADSHEET_ID)
-        
-        try:
-            logger.info("Tentando acessar a aba 'Horarios'")
-            horarios_sheet = sheet.worksheet("Horarios")
-        except gspread.exceptions.WorksheetNotFound:
-            logger.warning("Aba 'Horarios' não encontrada. Criando aba.")
-            horarios_sheet = sheet.add_worksheet(title="Horarios", rows=100, cols=10)
-            # Adicionar cabeçalhos
-            horarios_sheet.append_row(["Dia da Semana", "Início", "Fim", "Entrevistador", "Candidato", "Status"])
-            logger.info("Aba 'Horarios' criada com sucesso.")
+        # Servir da réplica local quando estiver sincronizada
+        records = sheet_replica.get_records('slots')
         
-        # Get all records from Horarios sheet
-        logger.info("Lendo registros da aba Horarios")
-        records = horarios_sheet.get_all_records()
+        if records is None:
+            try:
+                logger.info("Tentando acessar a aba 'Horarios'")
+                horarios_sheet = get_worksheet("Horarios")
+            except gspread.exceptions.WorksheetNotFound:
+                logger.warning("Aba 'Horarios' não encontrada. Criando aba.")
+                horarios_sheet = sheets_gateway.add_worksheet("Horarios", rows=100, cols=10)
+                # Adicionar cabeçalhos
+                horarios_sheet.append_row(["Dia da Semana", "Início", "Fim", "Entrevistador", "Candidato", "Status"])
+                logger.info("Aba 'Horarios' criada com sucesso.")
+            
+            # Get all records from Horarios sheet
+            logger.info("Lendo registros da aba Horarios")
+            records = horarios_sheet.get_all_records()
         logger.info(f"Encontrados {len(records)} registros de horários")
         
         # Get interview duration from Config
@@ -443,6 +883,27 @@ def get_available_slots(days_ahead=7):
         logger.error(traceback.format_exc())
         return [] 
 
+def _load_candidate_store(force_refresh=False):
+    """
+    Carrega o armazenamento de candidatos com uma única leitura da aba de respostas
+    (réplica local quando sincronizada, senão get_all_values)
+    """
+    def _load():
+        all_values = None if force_refresh else sheet_replica.get_values('responses')
+        
+        if all_values is None:
+            # Aba de respostas (Formulário 2 → Formulário 1 → primeira aba)
+            form_sheet = get_responses_worksheet()
+            
+            # Obter todas as linhas da planilha
+            logger.info("Lendo todas as entradas da planilha")
+            all_values = form_sheet.get_all_values()
+        
+        candidate_store.load(all_values)
+    
+    # Várias páginas de candidato abertas em simultâneo partilham a mesma leitura
+    cache_flights.do('candidate_store', _load)
+
 def get_all_candidates(force_refresh=False):
     """
     Obtém todos os candidatos da planilha com file cache
@@ -450,149 +911,156 @@ def get_all_candidates(force_refresh=False):
     """
     def _fetch_candidates():
         logger.info("Buscando todos os candidatos...")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        logger.info(f"Tentando abrir a planilha com ID: {SPREADSHEET_ID}")
-        
-        sheet = client.open_by_key(SPREADSHEET_ID)
-        
-        try:
-            logger.info("Tentando acessar a aba 'Respostas do Formulário 2'")
-            form_sheet = sheet.worksheet("Respostas do Formulário 2")
-        except gspread.exceptions.WorksheetNotFound:
-            # Se a aba não existir, tenta Respostas do Formulário 1
-            logger.info("Aba 'Respostas do Formulário 2' não encontrada. Tentando 'Respostas do Formulário 1'")
-            try:
-                form_sheet = sheet.worksheet("Respostas do Formulário 1")
-            except gspread.exceptions.WorksheetNotFound:
-                # Se ainda não existir, tenta a primeira aba
-                logger.info("Tentando acessar a primeira aba")
-                form_sheet = sheet.get_worksheet(0)  # Primeira aba
-        
-        # Obter todas as linhas da planilha
-        logger.info("Lendo todas as entradas da planilha")
-        all_records = form_sheet.get_all_records()
         
-        # Retornar a lista de candidatos com o índice
-        candidatos = []
-        for i, record in enumerate(all_records, start=2):  # Começa em 2 pois a linha 1 é o cabeçalho
-            candidato = record.copy()
-            candidato['index'] = i
-            candidatos.append(candidato)
+        _load_candidate_store(force_refresh)
+        candidatos = candidate_store.records()
         
         logger.info(f"Total de {len(candidatos)} candidatos encontrados")
         return candidatos
     
+    # Lista já carregada em memória: sem leitura de disco nem da planilha
+    if not force_refresh and candidate_store.is_warm():
+        return candidate_store.records()
+    
     return with_file_cache('candidates_all', _fetch_candidates, force_refresh)
 
+def _merge_candidate_records(candidatos, records):
+    """Lista de candidatos com os registos dados substituídos ou acrescentados (por 'index')"""
+    by_index = {candidato.get('index'): candidato for candidato in candidatos}
+    for record in records:
+        by_index[record['index']] = record
+    return sorted(by_index.values(), key=lambda candidato: candidato.get('index', 0))
+
+def _write_through_candidates(headers, rows):
+    """
+    Aplica linhas novas ou alteradas da aba de respostas ao armazenamento em memória
+    e à lista 'candidates_all' em cache, sem voltar a ler a aba (write-through)
+    
+    Args:
+        headers: Cabeçalhos da aba de respostas
+        rows: Número da linha -> valores da linha, pela ordem do cabeçalho
+        
+    Returns:
+        True se os caches ficaram atualizados, False se devem ser invalidados
+    """
+    if candidate_store.is_warm():
+        if candidate_store.schema.headers != list(headers):
+            return False
+        candidate_store.upsert_rows(rows)
+    
+    # Sem lista em cache (ou já expirada) não há nada a alterar
+    records = [CandidateStore.to_record(headers, row_index, rows[row_index]) for row_index in sorted(rows)]
+    default_file_cache.patch('candidates_all', lambda candidatos: _merge_candidate_records(candidatos, records))
+    
+    logger.info(f"Caches de candidatos atualizados no lugar: {len(rows)} linhas (versão {candidate_store.version})")
+    return True
+
+def _patch_candidate_row(row_index, updates):
+    """
+    Altera células de um candidato no armazenamento em memória e na lista em cache
+    
+    Args:
+        row_index: Número da linha na planilha
+        updates: Cabeçalho -> novo valor
+        
+    Returns:
+        True se os caches ficaram atualizados, False se devem ser invalidados
+    """
+    if candidate_store.is_warm() and not candidate_store.patch_row(row_index, updates):
+        return False
+    
+    found = []
+    
+    def _patch(candidatos):
+        patched = []
+        for candidato in candidatos:
+            if candidato.get('index') == row_index:
+                values = gspread.utils.numericise_all(['' if v is None else str(v) for v in updates.values()])
+                candidato = dict(candidato, **dict(zip(updates, values)))
+                found.append(row_index)
+            patched.append(candidato)
+        return patched if found else None
+    
+    if not default_file_cache.patch('candidates_all', _patch) and not found:
+        # Linha ausente da lista em cache: descartá-la se existir
+        default_file_cache.invalidate('candidates_all')
+    return True
+
+def find_candidate_indexes(email=None, telefone=None):
+    """
+    Procura candidatos por email e/ou telefone no armazenamento em memória
+    Retorna a lista de números de linha encontrados
+    """
+    if not candidate_store.is_warm():
+        _load_candidate_store()
+    
+    indexes = set()
+    if email:
+        indexes.update(candidate_store.find_by_email(email))
+    if telefone:
+        indexes.update(candidate_store.find_by_phone(telefone))
+    return sorted(indexes)
+
 def get_candidate_by_index(row_index, force_refresh=False):
     """
-    Obtém dados de um candidato específico pelo índice da linha com cache
+    Obtém dados de um candidato específico pelo índice da linha
+    (a partir do armazenamento de candidatos em memória)
     Retorna um dicionário com os dados do candidato
     """
-    def _fetch_candidate():
-        logger.info(f"Buscando candidato na linha {row_index}")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
-        
-        # Tenta encontrar a aba correta
-        try:
-            form_sheet = sheet.worksheet("Respostas do Formulário 2")
-        except gspread.exceptions.WorksheetNotFound:
-            try:
-                form_sheet = sheet.worksheet("Respostas do Formulário 1")
-            except gspread.exceptions.WorksheetNotFound:
-                form_sheet = sheet.get_worksheet(0)
-        
-        # Obter cabeçalhos
-        headers = form_sheet.row_values(1)
-        
-        # Obter valores da linha do candidato
-        values = form_sheet.row_values(row_index)
-        
-        # Se não tiver valores suficientes, retorna None
-        if not values:
-            logger.warning(f"Nenhum dado encontrado na linha {row_index}")
-            return None
-        
-        # Construir dicionário do candidato
-        candidato = {}
-        for i, header in enumerate(headers):
-            if i < len(values):
-                candidato[header] = values[i]
-            else:
-                candidato[header] = ""
-        
-        # Mapear para os campos usados na aplicação
-        form_data = {}
-        form_data['index'] = row_index
-        form_data['nome'] = candidato.get('Nome completo:', '')
-        form_data['email'] = candidato.get('Email de contacto:', '') or candidato.get('Endereço de email', '')
-        form_data['telefone'] = candidato.get('Número de telefone:', '')
-        form_data['morada'] = candidato.get('Morada completa:', '')
-        form_data['data_nascimento'] = candidato.get('Data de nascimento:', '')
-        form_data['cv_url'] = candidato.get('Erro: Link CV ausente ou inválido', '') or candidato.get('Carregue aqui o seu CV', '')
-        
-        # Buscar campos de análise IA com diferentes possibilidades de nomes
-        form_data['classificacao'] = (candidato.get('Classificacao IA', '') or 
-                                     candidato.get('Classificação IA', '') or 
-                                     candidato.get('classificacao', '') or
-                                     candidato.get('Classificacao', ''))
-        
-        form_data['justificacao'] = (candidato.get('Justificacao IA', '') or 
-                                    candidato.get('Justificação IA', '') or 
-                                    candidato.get('justificacao', '') or
-                                    candidato.get('Justificacao', ''))
-        
-        form_data['status'] = (candidato.get('STATUS', '') or 
-                              candidato.get('Status', '') or 
-                              candidato.get('status', ''))
-        
-        form_data['provider'] = (candidato.get('Provedor IA', '') or 
-                                candidato.get('Provider IA', '') or 
-                                candidato.get('provider', '') or
-                                candidato.get('Provedor', ''))
-        
-        # Log para debug
-        logger.info(f"Dados de análise IA encontrados - Classificação: '{form_data['classificacao']}', Justificação: {len(form_data['justificacao'])} chars, Provider: '{form_data['provider']}'")
-        
-        # Log dos cabeçalhos disponíveis para debug
-        logger.info(f"Cabeçalhos disponíveis: {list(candidato.keys())}")
-        
-        # Dados adicionais do formulário
-        form_data['carta_conducao'] = candidato.get('Tem carta de condução?', '')
-        form_data['experiencia'] = candidato.get('Tem experiência com cuidados a idosos e/ou pessoas dependentes?', '')
-        form_data['tipo_experiencia'] = candidato.get('Se sim, que tipo de experiência tem?', '')
-        form_data['duracao_experiencia'] = candidato.get('Há quanto tempo tem experiência nesta área?', '')
-        form_data['funcoes'] = candidato.get('Que funções já desempenhou?', '')
-        form_data['cidadao_portugues'] = candidato.get('É cidadão português?', '')
-        form_data['autorizacao_portugal'] = candidato.get('Se não, está legalmente autorizado(a) a trabalhar em Portugal?', '')
-        form_data['documento'] = candidato.get('Documento que possui:', '')
-        form_data['tempo_portugal'] = candidato.get('Há quanto tempo está em Portugal?', '')
-        form_data['recibos_verdes'] = candidato.get('Disponibilidade para trabalhar como prestador de serviços (recibos verdes)?', '')
-        form_data['formacao_area'] = candidato.get('Tem formação na área da saúde ou cuidados?', '')
-        form_data['tipo_formacao'] = candidato.get('Se sim, que tipo de formação tem?', '')
-        form_data['entidade_formadora'] = candidato.get('Entidade formadora:', '')
-        form_data['ano_conclusao'] = candidato.get('Ano de conclusão:', '')
-        form_data['formacao'] = candidato.get('Tem formação?', '')
-        form_data['dias_disponiveis'] = candidato.get('Que dias da semana tem disponibilidade?', '')
-        form_data['turnos_disponiveis'] = candidato.get('Que turnos tem disponibilidade?', '')
-        form_data['residencia'] = candidato.get('Zona de residência atual:', '')
-        form_data['data_submissao'] = candidato.get('Carimbo de data/hora', '')
-        
-        # Verificar se tem dados básicos
-        if not form_data['nome'] or not form_data['email']:
-            logger.warning(f"Dados incompletos para o candidato na linha {row_index}")
-        
-        logger.info(f"Candidato encontrado: {form_data['nome']}")
-        return form_data
+    row_index = int(row_index)
+    logger.info(f"Buscando candidato na linha {row_index}")
+    
+    candidato = None if force_refresh else candidate_store.get_row(row_index)
     
-    return with_file_cache(f'candidate_{row_index}', _fetch_candidate, force_refresh)
+    if candidato is None:
+        # Armazenamento vazio ou expirado: uma leitura em bloco serve todas as linhas
+        _load_candidate_store(force_refresh)
+        candidato = candidate_store.get_row(row_index) or {}
+    
+    # Se não tiver valores suficientes, retorna None
+    if not any(candidato.values()):
+        logger.warning(f"Nenhum dado encontrado na linha {row_index}")
+        return None
+    
+    # Mapear para os campos usados na aplicação (aliases resolvidos pelo esquema)
+    schema = candidate_store.schema
+    form_data = {}
+    form_data['index'] = row_index
+    for field in ('nome', 'email', 'telefone', 'cv_url', 'classificacao', 'justificacao', 'status', 'provider'):
+        form_data[field] = schema.value(candidato, field)
+    form_data['morada'] = candidato.get('Morada completa:', '')
+    form_data['data_nascimento'] = candidato.get('Data de nascimento:', '')
+    
+    # Log para debug
+    logger.info(f"Dados de análise IA encontrados - Classificação: '{form_data['classificacao']}', Justificação: {len(form_data['justificacao'])} chars, Provider: '{form_data['provider']}'")
+    
+    # Dados adicionais do formulário
+    form_data['carta_conducao'] = candidato.get('Tem carta de condução?', '')
+    form_data['experiencia'] = candidato.get('Tem experiência com cuidados a idosos e/ou pessoas dependentes?', '')
+    form_data['tipo_experiencia'] = candidato.get('Se sim, que tipo de experiência tem?', '')
+    form_data['duracao_experiencia'] = candidato.get('Há quanto tempo tem experiência nesta área?', '')
+    form_data['funcoes'] = candidato.get('Que funções já desempenhou?', '')
+    form_data['cidadao_portugues'] = candidato.get('É cidadão português?', '')
+    form_data['autorizacao_portugal'] = candidato.get('Se não, está legalmente autorizado(a) a trabalhar em Portugal?', '')
+    form_data['documento'] = candidato.get('Documento que possui:', '')
+    form_data['tempo_portugal'] = candidato.get('Há quanto tempo está em Portugal?', '')
+    form_data['recibos_verdes'] = candidato.get('Disponibilidade para trabalhar como prestador de serviços (recibos verdes)?', '')
+    form_data['formacao_area'] = candidato.get('Tem formação na área da saúde ou cuidados?', '')
+    form_data['tipo_formacao'] = candidato.get('Se sim, que tipo de formação tem?', '')
+    form_data['entidade_formadora'] = candidato.get('Entidade formadora:', '')
+    form_data['ano_conclusao'] = candidato.get('Ano de conclusão:', '')
+    form_data['formacao'] = candidato.get('Tem formação?', '')
+    form_data['dias_disponiveis'] = candidato.get('Que dias da semana tem disponibilidade?', '')
+    form_data['turnos_disponiveis'] = candidato.get('Que turnos tem disponibilidade?', '')
+    form_data['residencia'] = candidato.get('Zona de residência atual:', '')
+    form_data['data_submissao'] = candidato.get('Carimbo de data/hora', '')
+    
+    # Verificar se tem dados básicos
+    if not form_data['nome'] or not form_data['email']:
+        logger.warning(f"Dados incompletos para o candidato na linha {row_index}")
+    
+    logger.info(f"Candidato encontrado: {form_data['nome']}")
+    return form_data
 
 def update_candidate_analysis(row_index, cv_analysis):
     """
@@ -600,47 +1068,33 @@ def update_candidate_analysis(row_index, cv_analysis):
     """
     try:
         logger.info(f"Atualizando análise para candidato na linha {row_index}")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         # Tenta encontrar a aba correta
-        try:
-            form_sheet = sheet.worksheet("Respostas do Formulário 2")
-        except gspread.exceptions.WorksheetNotFound:
-            try:
-                form_sheet = sheet.worksheet("Respostas do Formulário 1")
-            except gspread.exceptions.WorksheetNotFound:
-                form_sheet = sheet.get_worksheet(0)
-        
-        # Obter cabeçalhos para encontrar as colunas corretas
-        headers = form_sheet.row_values(1)
-        
-        # Encontrar índices das colunas
-        classificacao_col = None
-        justificacao_col = None
-        status_col = None
-        provider_col = None
-        
-        for i, header in enumerate(headers, start=1):
-            if header == 'Classificacao IA':
-                classificacao_col = i
-            elif header == 'Justificacao IA':
-                justificacao_col = i
-            elif header == 'STATUS':
-                status_col = i
-            elif header == 'Provedor IA':
-                provider_col = i
+        form_sheet = get_responses_worksheet()
+        
+        # Encontrar as colunas pelo esquema da aba (sem ler a linha 1 a cada escrita)
+        schema = get_worksheet_schema(form_sheet, 'responses')
+        classificacao_col = schema.column('classificacao')
+        justificacao_col = schema.column('justificacao')
+        status_col = schema.column('status')
+        provider_col = schema.column('provider')
+        
+        # Agrupar todas as escritas num único pedido
+        batch = SheetWriteBatch()
+        # Cabeçalho -> novo valor, para atualizar os caches no lugar
+        updates = {}
+        
+        def update_cell(col, value):
+            batch.update_cell(form_sheet, row_index, col, value)
+            updates[schema.headers[col - 1]] = value
         
         # Atualizar células
         if classificacao_col:
-            form_sheet.update_cell(row_index, classificacao_col, cv_analysis.get('classificacao', 'Desconhecido'))
+            update_cell(classificacao_col, cv_analysis.get('classificacao', 'Desconhecido'))
             logger.info(f"Classificação atualizada: {cv_analysis.get('classificacao', 'Desconhecido')}")
         
         if justificacao_col:
-            form_sheet.update_cell(row_index, justificacao_col, cv_analysis.get('justificacao', ''))
+            update_cell(justificacao_col, cv_analysis.get('justificacao', ''))
             logger.info(f"Justificação atualizada")
         
         if status_col:
@@ -655,27 +1109,41 @@ def update_candidate_analysis(row_index, cv_analysis):
             else:
                 status = 'NOVO'
             
-            form_sheet.update_cell(row_index, status_col, status)
+            update_cell(status_col, status)
             logger.info(f"Status atualizado: {status}")
         
+        # Registar a versão da prompt usada, se a aba tiver essa coluna
+        prompt_hash_col = schema.column('prompt_hash')
+        if prompt_hash_col and cv_analysis.get('prompt_hash'):
+            update_cell(prompt_hash_col, cv_analysis['prompt_hash'])
+        
         # Atualizar o provedor de IA
         if 'provider' in cv_analysis:
             if provider_col:
-                form_sheet.update_cell(row_index, provider_col, cv_analysis.get('provider', ''))
+                update_cell(provider_col, cv_analysis.get('provider', ''))
                 logger.info(f"Provedor IA atualizado: {cv_analysis.get('provider', '')}")
             else:
                 # Adicionar nova coluna para o provedor se não existir
-                headers.append('Provedor IA')
-                form_sheet.update_cell(1, len(headers), 'Provedor IA')
-                form_sheet.update_cell(row_index, len(headers), cv_analysis.get('provider', ''))
+                provider_col = len(schema) + 1
+                batch.update_cell(form_sheet, 1, provider_col, 'Provedor IA')
+                batch.update_cell(form_sheet, row_index, provider_col, cv_analysis.get('provider', ''))
+                schema_registry.add_column(form_sheet.title, 'Provedor IA')
+                sheet_replica.mark_dirty('responses', 1)
+                updates = None
                 logger.info(f"Coluna de Provedor IA adicionada e valor atualizado: {cv_analysis.get('provider', '')}")
         
+        with google_api_limiter.priority(PRIORITY_WRITE):
+            batch.flush()
         logger.info(f"Análise atualizada com sucesso para o candidato na linha {row_index}")
         
-        # Invalidar cache relacionado
-        cache.invalidate(f'candidate_{row_index}')
-        cache.invalidate('all_candidates')
-        logger.info("Cache invalidado após atualização de análise")
+        # Reler a linha (e o cabeçalho, se mudou) na próxima sincronização da réplica
+        sheet_replica.mark_dirty('responses', row_index)
+        
+        # Atualizar os caches no lugar; com uma coluna nova, invalidá-los
+        if updates is None or not _patch_candidate_row(row_index, updates):
+            candidate_store.invalidate()
+            default_file_cache.invalidate_tag('candidates')
+            logger.info("Cache invalidado após atualização de análise")
         
         return True
     
@@ -691,19 +1159,14 @@ def update_config(config_updates):
     """
     try:
         logger.info(f"Atualizando configurações: {json.dumps(config_updates, ensure_ascii=False)}")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         # Verificar se a aba Config existe, caso contrário, criar
         try:
-            config_sheet = sheet.worksheet("Config")
+            config_sheet = get_worksheet("Config")
             logger.info("Aba Config encontrada")
         except gspread.exceptions.WorksheetNotFound:
             logger.info("Aba Config não encontrada. Criando nova aba.")
-            config_sheet = sheet.add_worksheet(title="Config", rows=50, cols=2)
+            config_sheet = sheets_gateway.add_worksheet("Config", rows=50, cols=2)
             # Adicionar cabeçalhos
             config_sheet.append_row(["CHAVE", "VALOR"])
         
@@ -722,22 +1185,32 @@ def update_config(config_updates):
             if len(row) >= 1:
                 key_to_row[row[0]] = i + 1  # +1 porque a linha 1 é o cabeçalho
         
-        # Atualizar valores existentes e adicionar novos
+        # Atualizar valores existentes (num único batchUpdate) e adicionar novos
         updates_made = 0
+        batch = SheetWriteBatch()
+        new_rows = []
         
         for key, value in config_updates.items():
             if key in key_to_row:
                 # Atualizar valor existente
                 row_idx = key_to_row[key]
                 logger.info(f"Atualizando configuração existente: {key}={value} na linha {row_idx}")
-                config_sheet.update_cell(row_idx, 2, value)  # Coluna 2 = VALOR
+                batch.update_cell(config_sheet, row_idx, 2, value)  # Coluna 2 = VALOR
                 updates_made += 1
             else:
                 # Adicionar nova configuração
                 logger.info(f"Adicionando nova configuração: {key}={value}")
-                config_sheet.append_row([key, value])
+                new_rows.append([key, value])
                 updates_made += 1
         
+        batch.flush()
+        if new_rows:
+            config_sheet.append_rows(new_rows)
+        # Não servir a aba a partir da réplica até à próxima sincronização
+        sheet_replica.mark_dirty('config', 1)
+        default_file_cache.invalidate_tag('config')
+        invalidate_bootstrap_snapshot()
+        
         logger.info(f"Total de {updates_made} configurações atualizadas")
         return True
     
@@ -753,20 +1226,22 @@ def get_custom_prompt():
     """
     try:
         logger.info("Tentando obter prompt personalizada da planilha...")
-        client = get_sheet_client()
         
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
+        # Servir do cache / snapshot de arranque quando disponível
+        prompts = _get_prompt_data()
+        if prompts is not None:
+            if not prompts.get('analise'):
+                logger.warning("Prompt não encontrada ou vazia na célula A1 da aba Prompt")
+            return prompts.get('analise') or None
         
         # Verificar se a aba Prompt existe
         try:
-            prompt_sheet = sheet.worksheet("Prompt")
+            prompt_sheet = get_worksheet("Prompt")
             logger.info("Aba Prompt encontrada")
         except gspread.exceptions.WorksheetNotFound:
             # Se a aba não existir, criar nova com um template de prompt
             logger.info("Aba Prompt não encontrada. Criando nova aba com template de prompt.")
-            prompt_sheet = sheet.add_worksheet(title="Prompt", rows=50, cols=1)
+            prompt_sheet = sheets_gateway.add_worksheet("Prompt", rows=50, cols=1)
             
             # Template de prompt padrão para análise de CV
             default_prompt = """
@@ -819,13 +1294,13 @@ Seguido de uma breve explicação (máximo 50 palavras).
 Formato da resposta: VÁLIDO/INVÁLIDO - explicação
 """
             
-            # Adicionar os templates às células A1 e A2
-            prompt_sheet.update_cell(1, 1, default_prompt)
-            prompt_sheet.update_cell(2, 1, validation_prompt)
+            # Adicionar os templates às células A1 e A2 (num único pedido)
+            with SheetWriteBatch() as batch:
+                batch.update_range(prompt_sheet, 'A1:A2', [[default_prompt], [validation_prompt]])
             logger.info("Templates de prompt adicionados à aba Prompt (A1: análise, A2: validação)")
         
-        # Ler o conteúdo da célula A1
-        prompt_text = prompt_sheet.cell(1, 1).value
+        # Ler o conteúdo da célula A1 (e A2, que fica em cache para a validação)
+        prompt_text = _read_prompt_sheet(prompt_sheet).get('analise')
         
         if not prompt_text:
             logger.warning("Prompt não encontrada ou vazia na célula A1 da aba Prompt")
@@ -846,22 +1321,26 @@ def get_validation_prompt():
     """
     try:
         logger.info("Tentando obter prompt de validação da planilha...")
-        client = get_sheet_client()
         
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
+        # Servir do cache / snapshot de arranque quando disponível
+        prompts = _get_prompt_data()
+        if prompts is not None:
+            if not prompts.get('validacao'):
+                logger.warning("Prompt de validação não encontrada ou vazia na célula A2 da aba Prompt")
+            return prompts.get('validacao') or None
         
         # Verificar se a aba Prompt existe
         try:
-            prompt_sheet = sheet.worksheet("Prompt")
+            prompt_sheet = get_worksheet("Prompt")
             logger.info("Aba Prompt encontrada")
         except gspread.exceptions.WorksheetNotFound:
             logger.warning("Aba Prompt não encontrada. Usando prompt de validação padrão.")
+            # Resultado negativo também fica em cache até a aba ser criada ou o TTL expirar
+            default_file_cache.set('prompt_data', {'analise': None, 'validacao': None})
             return None
         
-        # Ler o conteúdo da célula A2
-        prompt_text = prompt_sheet.cell(2, 1).value
+        # Ler o conteúdo da célula A2 (e A1, que fica em cache para a análise)
+        prompt_text = _read_prompt_sheet(prompt_sheet).get('validacao')
         
         if not prompt_text:
             logger.warning("Prompt de validação não encontrada ou vazia na célula A2 da aba Prompt")
@@ -875,6 +1354,10 @@ def get_validation_prompt():
         logger.error(traceback.format_exc())
         return None 
 
+def _sort_questions(records):
+    """Ordena as perguntas pela coluna 'Ordem' (valores inválidos vão para o fim)"""
+    return sorted(records, key=lambda x: int(x.get('Ordem', 999)) if str(x.get('Ordem', '')).isdigit() else 999)
+
 def get_dynamic_questions(force_refresh=False):
     """
     Obtém as perguntas dinâmicas da aba 'Perguntas' da planilha com file cache
@@ -882,20 +1365,28 @@ def get_dynamic_questions(force_refresh=False):
     """
     def _fetch_questions():
         logger.info("Tentando obter perguntas dinâmicas da planilha...")
-        client = get_sheet_client()
         
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
+        # Servir da réplica local quando estiver sincronizada
+        records = None if force_refresh else sheet_replica.get_records('questions')
+        if records is not None:
+            active_questions = _sort_questions(q for q in records if str(q.get('Ativa', '')).lower() == 'sim')
+            logger.info(f"Encontradas {len(active_questions)} perguntas ativas (réplica local)")
+            return active_questions
+        
+        # Senão, ler todas as abas de configuração num único pedido
+        active_questions = load_bootstrap_snapshot().get('questions_dynamic')
+        if active_questions is not None:
+            logger.info(f"Encontradas {len(active_questions)} perguntas ativas (snapshot de arranque)")
+            return active_questions
         
         # Verificar se a aba Perguntas existe
         try:
-            questions_sheet = sheet.worksheet("Perguntas")
+            questions_sheet = get_worksheet("Perguntas")
             logger.info("Aba Perguntas encontrada")
         except gspread.exceptions.WorksheetNotFound:
             # Se a aba não existir, criar nova com template
             logger.info("Aba Perguntas não encontrada. Criando nova aba com template.")
-            questions_sheet = sheet.add_worksheet(title="Perguntas", rows=100, cols=10)
+            questions_sheet = sheets_gateway.add_worksheet("Perguntas", rows=100, cols=10)
             
             # Template de perguntas padrão
             headers = [
@@ -985,8 +1476,7 @@ def get_dynamic_questions(force_refresh=False):
                 return []
         
         # Filtrar apenas perguntas ativas e ordenar
-        active_questions = [q for q in records if q.get('Ativa', '').lower() == 'sim']
-        active_questions.sort(key=lambda x: int(x.get('Ordem', 999)) if str(x.get('Ordem', '')).isdigit() else 999)
+        active_questions = _sort_questions(q for q in records if q.get('Ativa', '').lower() == 'sim')
         
         logger.info(f"Encontradas {len(active_questions)} perguntas ativas")
         return active_questions
@@ -1004,20 +1494,15 @@ def save_dynamic_form_data(form_data, questions):
     """
     try:
         logger.info("Iniciando salvamento de dados do formulário dinâmico")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         # Verificar se existe aba "Respostas Dinâmicas"
         try:
-            responses_sheet = sheet.worksheet("Respostas Dinâmicas")
+            responses_sheet = get_worksheet("Respostas Dinâmicas")
             logger.info("Aba 'Respostas Dinâmicas' encontrada")
         except gspread.exceptions.WorksheetNotFound:
             # Criar nova aba
             logger.info("Aba 'Respostas Dinâmicas' não encontrada. Criando nova aba.")
-            responses_sheet = sheet.add_worksheet(title="Respostas Dinâmicas", rows=1000, cols=50)
+            responses_sheet = sheets_gateway.add_worksheet("Respostas Dinâmicas", rows=1000, cols=50)
             
             # Criar cabeçalhos baseados nas perguntas
             headers = ["Data/Hora", "Status", "Classificação IA", "Justificação IA", "Provedor IA"]
@@ -1028,15 +1513,22 @@ def save_dynamic_form_data(form_data, questions):
                 headers.append(question['Pergunta'])
             
             # Adicionar cabeçalhos extras
-            headers.extend(["CV URL", "Email Enviado"])
+            headers.extend(["CV URL", "Email Enviado", "Versão Prompt"])
             
             responses_sheet.append_row(headers)
+            schema_registry.observe(responses_sheet.title, headers)
             logger.info("Cabeçalhos criados na aba 'Respostas Dinâmicas'")
         
-        # Obter cabeçalhos existentes
-        headers = responses_sheet.row_values(1)
+        # Obter cabeçalhos existentes (esquema em cache)
+        schema = get_worksheet_schema(responses_sheet)
+        headers = schema.headers
         logger.info(f"Cabeçalhos encontrados: {len(headers)} colunas")
         
+        # Mapa pergunta -> configuração (em duplicados vale a primeira)
+        questions_by_header = {}
+        for question in questions:
+            questions_by_header.setdefault(question['Pergunta'], question)
+        
         # Preparar dados da linha
         row_data = [""] * len(headers)
         
@@ -1053,21 +1545,20 @@ def save_dynamic_form_data(form_data, questions):
                 continue
                 
             # Procurar pergunta correspondente
-            for question in questions:
-                if question['Pergunta'] == header:
-                    question_id = question['ID']
-                    
-                    # Verificar se é campo de múltipla escolha (checkbox)
-                    if question['Tipo'] == 'checkbox':
-                        # Dados de checkbox vêm como lista
-                        values = form_data.get(f"{question_id}[]", [])
-                        if isinstance(values, list):
-                            row_data[i] = "; ".join(values)
-                        else:
-                            row_data[i] = values
+            question = questions_by_header.get(header)
+            if question is not None:
+                question_id = question['ID']
+                
+                # Verificar se é campo de múltipla escolha (checkbox)
+                if question['Tipo'] == 'checkbox':
+                    # Dados de checkbox vêm como lista
+                    values = form_data.get(f"{question_id}[]", [])
+                    if isinstance(values, list):
+                        row_data[i] = "; ".join(values)
                     else:
-                        row_data[i] = form_data.get(question_id, '')
-                    break
+                        row_data[i] = values
+                else:
+                    row_data[i] = form_data.get(question_id, '')
             
             # Campos especiais
             if header == "CV URL":
@@ -1075,15 +1566,22 @@ def save_dynamic_form_data(form_data, questions):
             elif header == "Email Enviado":
                 row_data[i] = "Não"
         
-        # Adicionar linha à planilha
-        logger.info("Adicionando linha à planilha dinâmica")
-        responses_sheet.append_row(row_data)
-        logger.info("Dados salvos com sucesso na planilha dinâmica")
-        
-        # Invalidar cache
-        default_file_cache.invalidate('candidates_all')
-        default_file_cache.invalidate('questions_dynamic')
-        logger.info("Cache invalidado após nova submissão")
+        # Registar a versão da prompt usada na análise
+        if form_data.get('prompt_hash'):
+            prompt_hash_col = schema.column('prompt_hash')
+            if not prompt_hash_col:
+                # Adicionar nova coluna para a versão da prompt se não existir
+                prompt_hash_col = len(headers) + 1
+                with SheetWriteBatch() as batch:
+                    batch.update_cell(responses_sheet, 1, prompt_hash_col, 'Versão Prompt')
+                schema_registry.add_column(responses_sheet.title, 'Versão Prompt')
+                row_data.append('')
+            row_data[prompt_hash_col - 1] = form_data['prompt_hash']
+        
+        # Gravar a linha no journal; o envio para a planilha é feito em lote
+        logger.info("Adicionando linha à fila de submissões (planilha dinâmica)")
+        submission_queue.enqueue(responses_sheet.title, row_data)
+        logger.info("Dados gravados com sucesso na fila de submissões")
         
         return True
         
@@ -1099,15 +1597,15 @@ def get_all_questions():
     """
     try:
         logger.info("Tentando obter todas as perguntas da planilha...")
-        client = get_sheet_client()
         
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
+        # Servir da réplica local quando estiver sincronizada
+        records = sheet_replica.get_records('questions')
+        if records is not None:
+            return _sort_questions(records)
         
         # Verificar se a aba Perguntas existe
         try:
-            questions_sheet = sheet.worksheet("Perguntas")
+            questions_sheet = get_worksheet("Perguntas")
             logger.info("Aba Perguntas encontrada")
         except gspread.exceptions.WorksheetNotFound:
             logger.warning("Aba Perguntas não encontrada")
@@ -1146,7 +1644,7 @@ def get_all_questions():
                 return []
         
         # Ordenar por ordem
-        all_questions = sorted(records, key=lambda x: int(x.get('Ordem', 999)) if str(x.get('Ordem', '')).isdigit() else 999)
+        all_questions = _sort_questions(records)
         
         logger.info(f"Encontradas {len(all_questions)} perguntas no total")
         return all_questions
@@ -1163,18 +1661,13 @@ def save_questions_to_sheet(questions_data):
     """
     try:
         logger.info("Salvando perguntas na planilha...")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         # Verificar se a aba Perguntas existe
         try:
-            questions_sheet = sheet.worksheet("Perguntas")
+            questions_sheet = get_worksheet("Perguntas")
         except gspread.exceptions.WorksheetNotFound:
             # Criar nova aba
-            questions_sheet = sheet.add_worksheet(title="Perguntas", rows=100, cols=10)
+            questions_sheet = sheets_gateway.add_worksheet("Perguntas", rows=100, cols=10)
         
         # Limpar a planilha
         questions_sheet.clear()
@@ -1189,6 +1682,10 @@ def save_questions_to_sheet(questions_data):
         for question_data in questions_data:
             questions_sheet.append_row(question_data)
         
+        # Não servir a aba a partir da réplica até à próxima sincronização
+        sheet_replica.mark_dirty('questions', 1)
+        default_file_cache.invalidate_tag('questions')
+        invalidate_bootstrap_snapshot()
         logger.info(f"Salvadas {len(questions_data)} perguntas na planilha")
         return True
         
@@ -1204,27 +1701,25 @@ def add_question_to_sheet(question_data):
     """
     try:
         logger.info("Adicionando nova pergunta à planilha...")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         # Verificar se a aba Perguntas existe
         try:
-            questions_sheet = sheet.worksheet("Perguntas")
+            questions_sheet = get_worksheet("Perguntas")
         except gspread.exceptions.WorksheetNotFound:
             # Criar nova aba
-            questions_sheet = sheet.add_worksheet(title="Perguntas", rows=100, cols=10)
+            questions_sheet = sheets_gateway.add_worksheet("Perguntas", rows=100, cols=10)
             # Adicionar cabeçalhos
             headers = [
                 "ID", "Secao", "Pergunta", "Tipo", "Obrigatoria", "Opcoes", "Placeholder", "Ajuda", "Ordem", "Ativa"
             ]
             questions_sheet.append_row(headers)
         
-        # Obter próxima ordem
-        all_questions = get_all_questions()
-        next_order = len(all_questions) + 1
+        # Obter próxima ordem a partir da planilha (o cache e a réplica podem estar desatualizados)
+        existing_orders = [
+            int(row[8]) for row in questions_sheet.get_all_values()[1:]
+            if len(row) > 8 and str(row[8]).strip().isdigit()
+        ]
+        next_order = max(existing_orders, default=0) + 1
         
         # Preparar dados da linha
         row_data = [
@@ -1243,6 +1738,10 @@ def add_question_to_sheet(question_data):
         # Adicionar à planilha
         questions_sheet.append_row(row_data)
         
+        # Não servir a aba a partir da réplica até à próxima sincronização
+        sheet_replica.mark_dirty('questions', 1)
+        default_file_cache.invalidate_tag('questions')
+        invalidate_bootstrap_snapshot()
         logger.info("Nova pergunta adicionada com sucesso")
         return True
         
@@ -1258,15 +1757,10 @@ def delete_question_from_sheet(question_id):
     """
     try:
         logger.info(f"Removendo pergunta {question_id} da planilha...")
-        client = get_sheet_client()
-        
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
         
         # Verificar se a aba Perguntas existe
         try:
-            questions_sheet = sheet.worksheet("Perguntas")
+            questions_sheet = get_worksheet("Perguntas")
         except gspread.exceptions.WorksheetNotFound:
             logger.warning("Aba Perguntas não encontrada")
             return False
@@ -1286,6 +1780,10 @@ def delete_question_from_sheet(question_id):
         
         if row_to_delete:
             questions_sheet.delete_rows(row_to_delete)
+            # Não servir a aba a partir da réplica até à próxima sincronização
+            sheet_replica.mark_dirty('questions', 1)
+            default_file_cache.invalidate_tag('questions')
+            invalidate_bootstrap_snapshot()
             logger.info(f"Pergunta {question_id} removida com sucesso")
             return True
         else:
@@ -1304,19 +1802,26 @@ def get_all_forms(force_refresh=False):
     """
     def _fetch_forms():
         logger.info("Tentando obter todos os formulários da planilha...")
-        client = get_sheet_client()
         
-        # Usar ID direto em vez do nome da planilha
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
+        # Servir da réplica local quando estiver sincronizada
+        records = None if force_refresh else sheet_replica.get_records('forms')
+        if records is not None:
+            logger.info(f"Encontrados {len(records)} formulários configurados (réplica local)")
+            return records
+        
+        # Senão, ler todas as abas de configuração num único pedido
+        records = load_bootstrap_snapshot().get('forms_all')
+        if records is not None:
+            logger.info(f"Encontrados {len(records)} formulários configurados (snapshot de arranque)")
+            return records
         
         # Verificar se a aba Formularios existe
         try:
-            forms_sheet = sheet.worksheet("Formularios")
+            forms_sheet = get_worksheet("Formularios")
             logger.info("Aba Formularios encontrada")
         except gspread.exceptions.WorksheetNotFound:
             logger.info("Aba Formularios não encontrada. Criando...")
-            forms_sheet = sheet.add_worksheet(title="Formularios", rows="100", cols="10")
+            forms_sheet = sheets_gateway.add_worksheet("Formularios", rows="100", cols="10")
             
             # Adicionar cabeçalhos
             headers = [
@@ -1407,11 +1912,7 @@ def save_form_configuration(form_data):
     """
     try:
         logger.info("Salvando configuração do formulário...")
-        client = get_sheet_client()
-        
-        SPREADSHEET_ID = "1UvH63UVLS8KkQJIh6y9hOvygOv2H6GWGZvKTAKMKFzc"
-        sheet = client.open_by_key(SPREADSHEET_ID)
-        forms_sheet = sheet.worksheet("Formularios")
+        forms_sheet = get_worksheet("Formularios")
         
         # Verificar se o formulário já existe
         records = forms_sheet.get_all_records()
@@ -1445,6 +1946,10 @@ def save_form_configuration(form_data):
             forms_sheet.append_row(row_data)
             logger.info(f"Novo formulário {form_data.get('ID')} criado")
         
+        # Não servir a aba a partir da réplica até à próxima sincronização
+        sheet_replica.mark_dirty('forms', 1)
+        default_file_cache.invalidate_tag('forms')
+        invalidate_bootstrap_snapshot()
         return True
         
     except Exception as e:
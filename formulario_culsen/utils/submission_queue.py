@@ -0,0 +1,559 @@
+import os
+import json
+import time
+import random
+import uuid
+import threading
+import logging
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.process_lock import ProcessFileLock, process_locks_available
+
+logger = logging.getLogger('formulario_culsen.submission_queue')
+
+# Filas vivas neste processo, para recriar os seus locks depois de um fork
+_queues = weakref.WeakSet()
+
+def _after_fork_in_child():
+    for queue in list(_queues):
+        queue._after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+class SubmissionQueue:
+    """
+    Fila write-behind para submissões de formulário.
+
+    Cada linha é primeiro gravada (com fsync) num journal local em disco e só
+    depois enviada para o Google Sheets por uma thread de fundo, em lotes com
+    append_rows, preservando a ordem de chegada.
+
+    Cada processo (ex: worker do gunicorn) tem o seu próprio journal e arquivo
+    de confirmação ('submissions.<pid>.jsonl' / '.ack'), protegidos por um lock
+    de arquivo mantido enquanto o processo vive. Os journals de processos que
+    terminaram (lock livre) são adotados por outro processo: as linhas ainda
+    não enviadas passam para o journal deste, que as envia. A adoção começa por
+    renomear o journal órfão para um arquivo de reclamação do processo que
+    adota ('submissions.<pid>.claim-<id>'); as linhas integradas levam o nome
+    da reclamação, para que uma queda a meio não as envie duas vezes.
+    """
+
+    def __init__(self, flush_function: Callable[[str, List[list]], Any],
+                 journal_dir: str = None,
+                 is_retryable: Callable[[Exception], bool] = None,
+                 batch_size: int = 50,
+                 flush_interval: float = 2.0,
+                 max_backoff: float = 120.0,
+                 adopt_interval: float = 60.0):
+        """
+        Inicializa a fila
+
+        Args:
+            flush_function: Função (titulo_aba, linhas) que envia um lote para a planilha
+            journal_dir: Diretório do journal (por omissão, variável SUBMISSION_QUEUE_DIR ou 'queue' na raiz do projeto)
+            is_retryable: Indica se um erro deve ser repetido (quota/5xx) ou descartado
+            batch_size: Número máximo de linhas por append_rows
+            flush_interval: Segundos de espera para juntar linhas antes de enviar
+            max_backoff: Tempo máximo de espera entre tentativas, em segundos
+            adopt_interval: Segundos entre procuras de journals de processos terminados
+        """
+        if journal_dir is None:
+            current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            journal_dir = os.environ.get('SUBMISSION_QUEUE_DIR') or os.path.join(current_dir, 'queue')
+
+        self.journal_dir = journal_dir
+        self.journal_path = None
+        self.ack_path = None
+        self.failed_path = os.path.join(journal_dir, 'submissions.failed.jsonl')
+
+        self.flush_function = flush_function
+        self.is_retryable = is_retryable or (lambda e: True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.adopt_interval = adopt_interval
+
+        # Lock do diretório: serializa a criação e a adoção de journals entre processos
+        self._dir_lock = ProcessFileLock(os.path.join(journal_dir, 'submissions.lock'))
+        self._journal_lock = None
+        self._journal_name = None
+        self._pid = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = []
+        self._next_seq = 1
+        self._acked_seq = 0
+        # Sequência já enviada cuja confirmação ainda não foi gravada em disco
+        self._unsaved_ack = None
+
+        self._stats = {
+            'enqueued': 0,
+            'flushed_rows': 0,
+            'flush_requests': 0,
+            'retries': 0,
+            'failed_rows': 0,
+            'adopted_rows': 0,
+            'ack_failures': 0,
+        }
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+        _queues.add(self)
+        with self._lock:
+            self._ensure_journal()
+
+    def _after_fork(self):
+        """No processo filho: recria os locks, que podiam estar ocupados por threads do pai"""
+        self._dir_lock.forget()
+        self._dir_lock = ProcessFileLock(self._dir_lock.path)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # ----- Journal -----
+
+    def _paths(self, name: str) -> Tuple[str, str, str]:
+        """Caminhos (journal, confirmação, lock) de um journal ('' = formato antigo, partilhado)"""
+        base = os.path.join(self.journal_dir, f"submissions.{name}" if name else 'submissions')
+        return f"{base}.jsonl", f"{base}.ack", f"{base}.lock"
+
+    @staticmethod
+    def _read_ack(ack_path: str) -> int:
+        """Lê o último número de sequência confirmado de um journal"""
+        try:
+            if os.path.exists(ack_path):
+                with open(ack_path, 'r', encoding='utf-8') as f:
+                    return int(f.read().strip() or 0)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Erro ao ler confirmação do journal: {str(e)}")
+        return 0
+
+    @staticmethod
+    def _read_journal(journal_path: str) -> List[Dict[str, Any]]:
+        """Lê as entradas válidas de um journal"""
+        entries = []
+        if not os.path.exists(journal_path):
+            return entries
+
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Linha incompleta (ex: queda a meio da escrita)
+                    logger.warning("Entrada inválida ignorada no journal de submissões")
+        return entries
+
+    def _ensure_journal(self):
+        """Abre o journal deste processo, se ainda não estiver aberto (chamar com lock)"""
+        if self._pid == os.getpid():
+            return
+
+        if self._journal_lock is not None:
+            # Processo criado por fork: o journal herdado continua a ser do processo pai
+            self._journal_lock.forget()
+            self._journal_lock = None
+        self._pending = []
+        self._unsaved_ack = None
+
+        with self._dir_lock:
+            if process_locks_available():
+                name = str(os.getpid())
+                lock = ProcessFileLock(self._paths(name)[2])
+                if not lock.acquire(timeout=0):
+                    # Mesmo pid noutro host/contentor a partilhar o diretório
+                    name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+                    lock = ProcessFileLock(self._paths(name)[2])
+                    lock.acquire()
+                self._journal_lock = lock
+            else:
+                # Sem locks entre processos: um único journal, como num só processo
+                name = ''
+
+            self._journal_name = name
+            self.journal_path, self.ack_path, _ = self._paths(name)
+            self._pid = os.getpid()
+            self._recover()
+            self._adopt_orphans()
+
+    def _recover(self):
+        """Carrega do journal deste processo as linhas ainda não confirmadas"""
+        self._acked_seq = self._read_ack(self.ack_path)
+        self._next_seq = self._acked_seq + 1
+
+        for entry in self._read_journal(self.journal_path):
+            self._next_seq = max(self._next_seq, entry['seq'] + 1)
+            if entry['seq'] > self._acked_seq:
+                self._pending.append(entry)
+
+        if self._pending:
+            logger.info(f"Recuperadas {len(self._pending)} submissões pendentes do journal")
+
+    @staticmethod
+    def _journal_owner(filename: str) -> Optional[str]:
+        """Nome do journal a que pertence um arquivo de journal ou de reclamação (None se não for nenhum)"""
+        if filename == 'submissions.jsonl':
+            return ''
+        if not filename.startswith('submissions.'):
+            return None
+        name = filename[len('submissions.'):]
+        if name.endswith('.jsonl'):
+            return name[:-len('.jsonl')]
+        if '.claim-' in name:
+            return name.split('.claim-')[0]
+        return None
+
+    def _claim_files(self, name: str) -> List[str]:
+        """Arquivos de reclamação do journal `name`, por ordem"""
+        prefix = f"submissions.{name}.claim-"
+        return [
+            os.path.join(self.journal_dir, filename)
+            for filename in sorted(os.listdir(self.journal_dir)) if filename.startswith(prefix)
+        ]
+
+    def _take_claim(self, path: str):
+        """Renomeia atomicamente um journal para uma reclamação deste processo"""
+        claim = f"submissions.{self._journal_name}.claim-{uuid.uuid4().hex[:8]}"
+        os.replace(path, os.path.join(self.journal_dir, claim))
+
+    @staticmethod
+    def _rewrite_journal(journal_path: str, entries: List[Dict[str, Any]]):
+        """Substitui atomicamente o conteúdo de um journal"""
+        tmp_path = f"{journal_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, journal_path)
+
+    def _claim_journal(self, name: str):
+        """
+        Reclama o journal de um processo terminado (chamar com o lock desse journal)
+
+        Primeiro as reclamações que esse processo não chegou a integrar (as que
+        já estão no seu journal são descartadas), depois o próprio journal, só
+        com as linhas não confirmadas.
+        """
+        journal_path, ack_path, _ = self._paths(name)
+        entries = self._read_journal(journal_path)
+        merged = {entry.get('claim') for entry in entries}
+
+        for claim_path in self._claim_files(name):
+            if os.path.basename(claim_path) in merged:
+                os.remove(claim_path)
+            else:
+                self._take_claim(claim_path)
+
+        acked = self._read_ack(ack_path)
+        pending = [entry for entry in entries if entry['seq'] > acked]
+        if not pending:
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+            return
+
+        if len(pending) < len(entries):
+            self._rewrite_journal(journal_path, pending)
+        self._take_claim(journal_path)
+
+    def _merge_claims(self) -> int:
+        """
+        Integra neste journal as linhas das reclamações deste processo (chamar com lock)
+
+        Returns:
+            Número de linhas integradas
+        """
+        claims = self._claim_files(self._journal_name)
+        if not claims:
+            return 0
+
+        merged = {entry.get('claim') for entry in self._read_journal(self.journal_path)}
+        adopted = 0
+        for claim_path in claims:
+            claim = os.path.basename(claim_path)
+            try:
+                if claim not in merged:
+                    entries = self._read_journal(claim_path)
+                    if entries:
+                        self._append_entries(
+                            [(entry['worksheet'], entry['row'], entry['timestamp']) for entry in entries],
+                            claim=claim
+                        )
+                        adopted += len(entries)
+                        logger.info(f"Adotadas {len(entries)} submissões pendentes de {claim}")
+                os.remove(claim_path)
+            except OSError as e:
+                logger.warning(f"Erro ao integrar journal adotado {claim}: {str(e)}")
+        return adopted
+
+    def _adopt_orphans(self) -> int:
+        """
+        Passa para este journal as linhas pendentes de processos que terminaram
+        (chamar com lock e com o lock do diretório)
+
+        Returns:
+            Número de linhas adotadas
+        """
+        if not process_locks_available():
+            return 0
+
+        owners = set()
+        for filename in os.listdir(self.journal_dir):
+            name = self._journal_owner(filename)
+            if name is not None and name not in (self._journal_name, 'failed'):
+                owners.add(name)
+
+        for name in sorted(owners):
+            _, ack_path, lock_path = self._paths(name)
+            # O journal antigo ('') não tem dono; os restantes só se o processo terminou
+            lock = ProcessFileLock(lock_path) if name else None
+            if lock is not None and not lock.acquire(timeout=0):
+                continue
+
+            try:
+                self._claim_journal(name)
+                for path in (ack_path,) + ((lock_path,) if lock is not None else ()):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            except OSError as e:
+                logger.warning(f"Erro ao adotar journal submissions.{name}: {str(e)}")
+            finally:
+                if lock is not None:
+                    lock.release()
+
+        adopted = self._merge_claims()
+        self._stats['adopted_rows'] += adopted
+        return adopted
+
+    def _append_entries(self, items: List[Tuple[str, list, float]], claim: str = None) -> List[Dict[str, Any]]:
+        """Grava linhas no journal deste processo com um único fsync (chamar com lock)"""
+        entries = []
+        for worksheet_title, row, timestamp in items:
+            entry = {
+                'seq': self._next_seq,
+                'worksheet': worksheet_title,
+                'row': row,
+                'timestamp': timestamp
+            }
+            if claim:
+                entry['claim'] = claim
+            entries.append(entry)
+            self._next_seq += 1
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._pending.extend(entries)
+        return entries
+
+    def _write_ack(self, seq: int):
+        """Grava atomicamente o último número de sequência enviado"""
+        tmp_path = f"{self.ack_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.ack_path)
+        self._acked_seq = seq
+
+    def _compact_journal(self):
+        """Esvazia o journal quando todas as linhas foram enviadas (chamar com lock)"""
+        if self._pending:
+            return
+        try:
+            # As marcas 'claim' têm de ficar enquanto houver reclamações por apagar
+            if self._journal_name and self._claim_files(self._journal_name):
+                return
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.warning(f"Erro ao compactar journal de submissões: {str(e)}")
+
+    # ----- API pública -----
+
+    def enqueue(self, worksheet_title: str, row: list) -> int:
+        """
+        Aceita uma linha para escrita posterior; retorna após o fsync do journal
+
+        Args:
+            worksheet_title: Título da aba destino
+            row: Valores da linha
+
+        Returns:
+            Número de sequência atribuído à linha
+        """
+        with self._lock:
+            self._ensure_journal()
+            entry = self._append_entries([(worksheet_title, row, time.time())])[0]
+            self._stats['enqueued'] += 1
+
+        logger.info(f"Submissão {entry['seq']} gravada no journal (aba: {worksheet_title})")
+        self.start()
+        self._wakeup.set()
+        return entry['seq']
+
+    def start(self):
+        """Inicia a thread de envio, se ainda não estiver ativa"""
+        with self._lock:
+            self._ensure_journal()
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='submission-queue', daemon=True)
+            self._thread.start()
+            if self._pending:
+                self._wakeup.set()
+
+    def stop(self, timeout: float = 10.0):
+        """Pede à thread de envio para terminar após o lote corrente"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.save_ack()
+
+    def pending_count(self) -> int:
+        """Número de linhas ainda por enviar"""
+        with self._lock:
+            return len(self._pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas da fila"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+            stats['acked_seq'] = self._acked_seq
+            stats['journal_path'] = self.journal_path
+        return stats
+
+    # ----- Envio -----
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Obtém o próximo lote: linhas consecutivas da mesma aba, por ordem"""
+        with self._lock:
+            if not self._pending:
+                return []
+            title = self._pending[0]['worksheet']
+            batch = []
+            for entry in self._pending:
+                if entry['worksheet'] != title or len(batch) >= self.batch_size:
+                    break
+                batch.append(entry)
+            return batch
+
+    def _ack_batch(self, batch: List[Dict[str, Any]]):
+        """
+        Remove da fila um lote já enviado e confirma-o no disco
+
+        O lote sai da fila antes da escrita da confirmação: se esta falhar, é
+        repetida mais tarde (save_ack), e o lote nunca volta a ser enviado.
+        """
+        with self._lock:
+            del self._pending[:len(batch)]
+            self._unsaved_ack = batch[-1]['seq']
+        self.save_ack()
+
+    def save_ack(self) -> bool:
+        """
+        Grava a confirmação em atraso, se houver
+
+        Returns:
+            False se a escrita falhou (fica para a próxima tentativa)
+        """
+        with self._lock:
+            if self._unsaved_ack is None:
+                return True
+            try:
+                self._write_ack(self._unsaved_ack)
+            except OSError as e:
+                self._stats['ack_failures'] += 1
+                logger.error(f"Erro ao gravar confirmação de submissões enviadas: {str(e)}")
+                return False
+            self._unsaved_ack = None
+            self._compact_journal()
+            return True
+
+    def _dead_letter(self, batch: List[Dict[str, Any]], error: Exception):
+        """Move para o ficheiro de falhas um lote com erro não recuperável"""
+        try:
+            with open(self.failed_path, 'a', encoding='utf-8') as f:
+                for entry in batch:
+                    entry = dict(entry, error=str(error))
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.error(f"Erro ao gravar submissões falhadas: {str(e)}")
+            return False
+
+        self._stats['failed_rows'] += len(batch)
+        return True
+
+    def _adopt_periodically(self, last_adopt: float) -> float:
+        """Adota journals de processos terminados, no máximo a cada adopt_interval segundos"""
+        now = time.monotonic()
+        if now - last_adopt < self.adopt_interval:
+            return last_adopt
+        try:
+            with self._lock:
+                with self._dir_lock:
+                    self._adopt_orphans()
+        except Exception as e:
+            logger.warning(f"Erro ao procurar journals abandonados: {str(e)}")
+        return now
+
+    def _run(self):
+        """Ciclo da thread de envio"""
+        backoff = 1.0
+        last_adopt = time.monotonic()
+
+        while not self._stop.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.save_ack()
+            last_adopt = self._adopt_periodically(last_adopt)
+
+            # Pequena janela para juntar submissões simultâneas no mesmo lote
+            if self.pending_count() and self.pending_count() < self.batch_size:
+                self._stop.wait(min(self.flush_interval, 0.5))
+
+            while not self._stop.is_set():
+                batch = self._next_batch()
+                if not batch:
+                    break
+
+                title = batch[0]['worksheet']
+                rows = [entry['row'] for entry in batch]
+
+                try:
+                    self.flush_function(title, rows)
+                except Exception as e:
+                    if self.is_retryable(e):
+                        delay = min(backoff, self.max_backoff) * (0.5 + random.random())
+                        self._stats['retries'] += 1
+                        logger.warning(f"Erro temporário ao enviar submissões ({str(e)}). Nova tentativa em {delay:.1f}s")
+                        backoff = min(backoff * 2, self.max_backoff)
+                        self._stop.wait(delay)
+                        continue
+
+                    logger.error(f"Erro não recuperável ao enviar {len(rows)} submissões: {str(e)}")
+                    if self._dead_letter(batch, e):
+                        self._ack_batch(batch)
+                    else:
+                        self._stop.wait(self.max_backoff)
+                    continue
+
+                # Enviado: a partir daqui o lote só pode ser confirmado, nunca reenviado
+                self._stats['flush_requests'] += 1
+                self._stats['flushed_rows'] += len(rows)
+                self._ack_batch(batch)
+                backoff = 1.0
+                logger.info(f"Enviadas {len(rows)} submissões para a aba '{title}'")
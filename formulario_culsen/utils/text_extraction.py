@@ -0,0 +1,113 @@
+import time
+import hashlib
+import threading
+import unicodedata
+import logging
+from typing import Any, Callable, Dict, List
+
+from utils.file_cache import with_file_cache
+
+logger = logging.getLogger('formulario_culsen.text_extraction')
+
+# Tamanho dos blocos lidos para calcular o hash sem carregar o arquivo inteiro
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(file_path: str) -> str:
+    """Calcula o SHA-256 do conteúdo de um arquivo"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_text(text: str) -> str:
+    """Normaliza o texto extraído (Unicode NFC, quebras de linha '\\n', sem caracteres nulos)"""
+    text = unicodedata.normalize('NFC', text or '')
+    return text.replace('\r\n', '\n').replace('\r', '\n').replace('\x00', '')
+
+class TextExtractionCache:
+    """
+    Cache do texto extraído de documentos, endereçado pelo conteúdo.
+
+    A chave é o SHA-256 dos bytes do arquivo (e o nome do extrator), pelo que o
+    mesmo CV enviado, validado ou reanalisado várias vezes só é processado uma
+    vez, independentemente do nome ou da pasta do arquivo. O resultado fica no
+    file cache (espaço de nomes 'cv_text'), partilhado entre workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'extractions': 0,
+            'errors': 0,
+            'extraction_ms': 0.0,
+        }
+
+    def _count(self, name: str, amount: float = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def extract(self, file_path: str, extract_pages: Callable[[str], List[str]], extractor: str) -> Dict[str, Any]:
+        """
+        Obtém o texto de um documento, extraindo-o só se este conteúdo ainda não estiver em cache
+
+        Args:
+            file_path: Caminho do arquivo
+            extract_pages: Função que devolve o texto de cada página (lança exceção em caso de erro)
+            extractor: Nome do extrator (faz parte da chave; mudar de extrator gera novas entradas)
+
+        Returns:
+            Dicionário com 'sha256', 'extractor', 'text', 'pages' ([{'page', 'chars'}]),
+            'total_chars' e 'extraction_ms'
+
+        Raises:
+            Exception: Erros da extração (não ficam em cache)
+        """
+        digest = file_sha256(file_path)
+        extracted = []
+
+        def _extract():
+            start = time.perf_counter()
+            pages = [normalize_text(page_text) for page_text in extract_pages(file_path)]
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            extracted.append(elapsed_ms)
+
+            page_stats = [{'page': i, 'chars': len(page_text)} for i, page_text in enumerate(pages, start=1)]
+            for page in page_stats:
+                logger.info(f"Página {page['page']}: {page['chars']} caracteres extraídos")
+
+            return {
+                'sha256': digest,
+                'extractor': extractor,
+                'text': ''.join(page_text + "\n\n" for page_text in pages if page_text),
+                'pages': page_stats,
+                'total_chars': sum(page['chars'] for page in page_stats),
+                'extraction_ms': round(elapsed_ms, 1),
+            }
+
+        try:
+            document = with_file_cache(f"cv_text_{extractor}_{digest}", _extract)
+        except Exception:
+            self._count('errors')
+            raise
+
+        if extracted:
+            self._count('extractions')
+            self._count('extraction_ms', extracted[0])
+        else:
+            self._count('hits')
+            logger.info(f"Texto do documento {digest[:12]} obtido do cache ({document['total_chars']} caracteres)")
+        return document
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna estatísticas do cache de extração"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['extractions']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['extraction_ms'] = round(stats['extraction_ms'], 1)
+        return stats
+
+# Instância global do cache de extração de texto
+text_extraction_cache = TextExtractionCache()